@@ -0,0 +1,323 @@
+from typing import Any, Dict, Optional, Tuple, Type
+
+from ariadne.types import ContextValue, Extension, Resolver
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLResolveInfo,
+    GraphQLSchema,
+    InlineFragmentNode,
+    IntValueNode,
+    OperationDefinitionNode,
+    SelectionSetNode,
+    VariableNode,
+    get_named_type,
+    is_composite_type,
+)
+from graphql.pyutils import Undefined
+from graphql.utilities import get_operation_root_type, value_from_ast_untyped
+from graphql.validation import ValidationRule
+
+from aj_micro_utils.config import get_settings
+from aj_micro_utils.query_cost import QueryCostError
+
+CONNECTION_INTERFACE = "Connection"
+EDGE_INTERFACE = "Edge"
+PAGE_ARGUMENTS = ("first", "last")
+
+
+def implements(graphql_type: Any, interface: str) -> bool:
+    return graphql_type.name == interface or any(
+        i.name == interface for i in getattr(graphql_type, "interfaces", ())
+    )
+
+
+class QueryComplexity:
+    """
+    Static cost and depth of the operations
+
+    - every object field costs its weight, 1 by default, the scalar fields
+    cost scalar_weight, "Type.field" weights can be set in field_weights
+    - the edges of a Connection (search_and_filter.input_schemas interfaces)
+    cost first (or last) times their selection, a page size from a variable
+    without a value or default counts as default_first, QUERY_MAX_FIRST
+    - rule is the validation rule rejecting the operations over max_depth
+    or max_cost, GRAPHQL_MAX_COST by default, in the units of the fields
+    above rather than the ModelResolver ones of QUERY_MAX_COST, and extension reports the cost in the response extensions
+    """
+
+    def __init__(
+        self,
+        max_depth: int = None,
+        max_cost: float = None,
+        field_weights: Dict[str, float] = None,
+        default_weight: float = 1,
+        scalar_weight: float = 0,
+        default_first: int = None,
+    ) -> None:
+        self.max_depth = (
+            get_settings().query_max_depth if max_depth is None else max_depth
+        )
+        self.max_cost = (
+            get_settings().graphql_max_cost if max_cost is None else max_cost
+        )
+        self.field_weights = field_weights or {}
+        self.default_weight = default_weight
+        self.scalar_weight = scalar_weight
+        self.default_first = (
+            get_settings().query_max_first if default_first is None else default_first
+        )
+        self.rule = self.get_validation_rule()
+        self.extension = self.get_extension()
+
+    def measure(
+        self,
+        schema: GraphQLSchema,
+        operation: OperationDefinitionNode,
+        fragments: Dict[str, FragmentDefinitionNode],
+        variables: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[float, int]:
+        """Cost and depth of the operation, the variables without
+        a value get the default of their definition
+        """
+        values = {}
+
+        for definition in operation.variable_definitions or ():
+            if definition.default_value is not None:
+                values[definition.variable.name.value] = value_from_ast_untyped(
+                    definition.default_value
+                )
+
+        values.update(variables or {})
+
+        return self.measure_selections(
+            schema,
+            get_operation_root_type(schema, operation),
+            operation.selection_set,
+            fragments,
+            values,
+            1,
+            (),
+        )
+
+    def measure_selections(
+        self,
+        schema: GraphQLSchema,
+        parent_type: Any,
+        selection_set: SelectionSetNode,
+        fragments: Dict[str, FragmentDefinitionNode],
+        variables: Dict[str, Any],
+        depth: int,
+        spreads: tuple,
+        page: Optional[int] = None,
+    ) -> Tuple[float, int]:
+        cost = 0
+        max_depth = 0
+
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                selection_cost, selection_depth = self.measure_field(
+                    schema,
+                    parent_type,
+                    selection,
+                    fragments,
+                    variables,
+                    depth,
+                    spreads,
+                    page,
+                )
+            elif isinstance(selection, InlineFragmentNode):
+                selection_cost, selection_depth = self.measure_selections(
+                    schema,
+                    schema.get_type(selection.type_condition.name.value)
+                    if selection.type_condition
+                    else parent_type,
+                    selection.selection_set,
+                    fragments,
+                    variables,
+                    depth,
+                    spreads,
+                    page,
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = fragments.get(name)
+
+                if fragment is None or name in spreads:
+                    continue
+
+                selection_cost, selection_depth = self.measure_selections(
+                    schema,
+                    schema.get_type(fragment.type_condition.name.value),
+                    fragment.selection_set,
+                    fragments,
+                    variables,
+                    depth,
+                    (*spreads, name),
+                    page,
+                )
+            else:
+                continue
+
+            cost += selection_cost
+            max_depth = max(max_depth, selection_depth)
+
+        return cost, max_depth
+
+    def measure_field(
+        self,
+        schema: GraphQLSchema,
+        parent_type: Any,
+        node: FieldNode,
+        fragments: Dict[str, FragmentDefinitionNode],
+        variables: Dict[str, Any],
+        depth: int,
+        spreads: tuple,
+        page: Optional[int],
+    ) -> Tuple[float, int]:
+        name = node.name.value
+        field = getattr(parent_type, "fields", {}).get(name)
+
+        if field is None or name.startswith("__"):
+            return 0, 0
+
+        field_type = get_named_type(field.type)
+        cost = self.field_weights.get(
+            f"{parent_type.name}.{name}",
+            self.default_weight
+            if is_composite_type(field_type)
+            else self.scalar_weight,
+        )
+
+        if node.selection_set is None:
+            return cost, depth
+
+        child_cost, child_depth = self.measure_selections(
+            schema,
+            field_type,
+            node.selection_set,
+            fragments,
+            variables,
+            depth + 1,
+            spreads,
+            self.get_page(field, node, variables)
+            if implements(field_type, CONNECTION_INTERFACE)
+            else None,
+        )
+
+        if page is not None and implements(field_type, EDGE_INTERFACE):
+            return (cost + child_cost) * page, child_depth
+
+        return cost + child_cost, child_depth
+
+    def get_page(self, field: Any, node: FieldNode, variables: Dict[str, Any]) -> int:
+        """The page size of a connection, the largest of first and last"""
+        sizes = []
+
+        for argument in node.arguments:
+            if argument.name.value not in PAGE_ARGUMENTS:
+                continue
+
+            value = argument.value
+
+            if isinstance(value, IntValueNode):
+                sizes.append(int(value.value))
+            elif isinstance(value, VariableNode):
+                size = variables.get(value.name.value)
+                sizes.append(self.default_first if size is None else size)
+
+        if not sizes:
+            for argument in PAGE_ARGUMENTS:
+                definition = field.args.get(argument)
+                if definition is not None and definition.default_value not in (
+                    None,
+                    Undefined,
+                ):
+                    sizes.append(definition.default_value)
+
+        return max(sizes) if sizes else self.default_first
+
+    def check(self, cost: float, depth: int) -> Optional[QueryCostError]:
+        if self.max_depth and depth > self.max_depth:
+            return QueryCostError(
+                f"Query depth {depth} is over the limit of {self.max_depth}",
+                cost=depth,
+                limit=self.max_depth,
+            )
+
+        if self.max_cost and cost > self.max_cost:
+            return QueryCostError(
+                f"Query cost {cost} is over the limit of {self.max_cost}",
+                cost=cost,
+                limit=self.max_cost,
+            )
+
+        return None
+
+    def get_validation_rule(self) -> Type[ValidationRule]:
+        complexity = self
+
+        class QueryComplexityRule(ValidationRule):
+            def enter_operation_definition(
+                self, node: OperationDefinitionNode, *_
+            ) -> None:
+                fragments = {
+                    definition.name.value: definition
+                    for definition in self.context.document.definitions
+                    if isinstance(definition, FragmentDefinitionNode)
+                }
+
+                try:
+                    cost, depth = complexity.measure(
+                        self.context.schema, node, fragments
+                    )
+                except GraphQLError:
+                    return
+
+                error = complexity.check(cost, depth)
+
+                if error is not None:
+                    self.report_error(error)
+
+        return QueryComplexityRule
+
+    def get_extension(self) -> Type[Extension]:
+        complexity = self
+
+        class QueryComplexityExtension(Extension):
+            """Reports the cost of the operation with its variables"""
+
+            def __init__(self) -> None:
+                self.info: Optional[GraphQLResolveInfo] = None
+
+            def resolve(
+                self, next_: Resolver, obj: Any, info: GraphQLResolveInfo, **kwargs
+            ):
+                if self.info is None:
+                    self.info = info
+
+                return next_(obj, info, **kwargs)
+
+            def format(self, context: ContextValue) -> Optional[dict]:
+                if self.info is None:
+                    return None
+
+                cost, depth = complexity.measure(
+                    self.info.schema,
+                    self.info.operation,
+                    self.info.fragments,
+                    self.info.variable_values,
+                )
+
+                return {
+                    "cost": {
+                        "requested": cost,
+                        "depth": depth,
+                        "maxCost": complexity.max_cost,
+                        "maxDepth": complexity.max_depth,
+                    }
+                }
+
+        return QueryComplexityExtension
@@ -0,0 +1,271 @@
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from inspect import isawaitable
+from typing import Any, Collection, Dict, Iterable, List, Optional, Tuple, Type
+
+from ariadne.extensions import ExtensionManager
+from ariadne.format_error import format_error
+from ariadne.graphql import (
+    handle_graphql_errors,
+    handle_query_result,
+    parse_query,
+    validate_data,
+    validate_query,
+)
+from ariadne.types import ErrorFormatter, ExtensionList, GraphQLResult, RootValue
+from graphql import (
+    DocumentNode,
+    ExecutionContext,
+    GraphQLError,
+    GraphQLSchema,
+    execute,
+    print_schema,
+)
+from graphql.execution import MiddlewareManager
+from graphql.validation.rules import ASTValidationRule
+
+DOCUMENT_CACHE_SIZE = 1024
+
+
+class PersistedQueryNotFound(GraphQLError):
+    """The client sent only the hash of a query the server doesn't know,
+    the client retries with the query text (Apollo automatic persisted queries)
+    """
+
+    def __init__(self) -> None:
+        super().__init__(
+            "PersistedQueryNotFound",
+            extensions={"code": "PERSISTED_QUERY_NOT_FOUND"},
+        )
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=16)
+def get_schema_version(schema: GraphQLSchema) -> str:
+    """Validation results are only valid for the schema they were made with"""
+    return hashlib.md5(print_schema(schema).encode("utf-8")).hexdigest()[:12]
+
+
+class CachedDocument:
+    def __init__(self, query: str, document: DocumentNode) -> None:
+        self.query = query
+        self.document = document
+        self.validation: Dict[tuple, List[GraphQLError]] = {}
+
+
+class DocumentCache:
+    """
+    Parsed documents and their validation results keyed by the sha256 of the query
+
+    - the last size documents are kept, warmed documents are never evicted
+    - validation results are kept per schema version, rules and introspection
+    - with extensions.persistedQuery.sha256Hash clients can send the hash only,
+    an unknown hash gets a PersistedQueryNotFound error and the client sends
+    the query with its hash to register it
+    """
+
+    def __init__(self, size: int = DOCUMENT_CACHE_SIZE) -> None:
+        self.size = size
+        self._documents: "OrderedDict[str, CachedDocument]" = OrderedDict()
+        self._pinned: Dict[str, CachedDocument] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents) + len(self._pinned)
+
+    def lookup(self, sha256_hash: str) -> Optional[CachedDocument]:
+        cached = self._pinned.get(sha256_hash)
+
+        if cached is not None:
+            return cached
+
+        cached = self._documents.get(sha256_hash)
+
+        if cached is not None:
+            self._documents.move_to_end(sha256_hash)
+
+        return cached
+
+    def get(self, query: str, sha256_hash: str = None) -> CachedDocument:
+        """The parsed query, syntax errors are raised and not cached"""
+        sha256_hash = sha256_hash or query_hash(query)
+        cached = self.lookup(sha256_hash)
+
+        if cached is not None:
+            return cached
+
+        cached = self._documents[sha256_hash] = CachedDocument(
+            query, parse_query(query)
+        )
+
+        if len(self._documents) > self.size:
+            self._documents.popitem(last=False)
+
+        return cached
+
+    def resolve_query(self, data: Any) -> Tuple[Any, Optional[str]]:
+        """The request data with the query of a persisted query hash
+        filled in and the hash of the query, if the client sent one
+        """
+        if not isinstance(data, dict):
+            return data, None
+
+        extensions = data.get("extensions")
+        persisted = (
+            extensions.get("persistedQuery") if isinstance(extensions, dict) else None
+        )
+
+        if not isinstance(persisted, dict) or not persisted.get("sha256Hash"):
+            return data, None
+
+        sha256_hash = persisted["sha256Hash"]
+
+        if data.get("query"):
+            if query_hash(data["query"]) != sha256_hash:
+                raise GraphQLError("provided sha does not match query")
+
+            return data, sha256_hash
+
+        cached = self.lookup(sha256_hash)
+
+        if cached is None:
+            raise PersistedQueryNotFound()
+
+        return {**data, "query": cached.query}, sha256_hash
+
+    def validate(
+        self,
+        cached: CachedDocument,
+        schema: GraphQLSchema,
+        rules: Optional[Collection[Type[ASTValidationRule]]] = None,
+        introspection: bool = True,
+    ) -> List[GraphQLError]:
+        key = (
+            get_schema_version(schema),
+            tuple(rules) if rules else None,
+            introspection,
+        )
+        errors = cached.validation.get(key)
+
+        if errors is None:
+            errors = cached.validation[key] = validate_query(
+                schema, cached.document, rules, enable_introspection=introspection
+            )
+
+        return errors
+
+    def warm(
+        self,
+        schema: GraphQLSchema,
+        queries: Iterable[str],
+        rules: Optional[Collection[Type[ASTValidationRule]]] = None,
+        introspection: bool = True,
+    ) -> int:
+        """Parses and validates the known operations at startup,
+        they stay cached and can be sent as persisted queries
+        """
+        count = 0
+
+        for query in queries:
+            sha256_hash = query_hash(query)
+            cached = self._documents.pop(sha256_hash, None) or CachedDocument(
+                query, parse_query(query)
+            )
+            self._pinned[sha256_hash] = cached
+            self.validate(cached, schema, rules, introspection)
+            count += 1
+
+        return count
+
+    def clear(self) -> None:
+        self._documents.clear()
+        self._pinned.clear()
+
+
+async def cached_graphql(
+    schema: GraphQLSchema,
+    data: Any,
+    *,
+    document_cache: DocumentCache,
+    context_value: Optional[Any] = None,
+    root_value: Optional[RootValue] = None,
+    debug: bool = False,
+    introspection: bool = True,
+    logger: Optional[str] = None,
+    validation_rules: Optional[Any] = None,
+    error_formatter: ErrorFormatter = format_error,
+    middleware: Optional[MiddlewareManager] = None,
+    extensions: ExtensionList = None,
+    **kwargs,
+) -> GraphQLResult:
+    """Same as ariadne.graphql, but the query is parsed and
+    validated through the document cache
+    """
+    extension_manager = ExtensionManager(extensions, context_value)
+
+    with extension_manager.request():
+        try:
+            data, sha256_hash = document_cache.resolve_query(data)
+            validate_data(data)
+            query, variables, operation_name = (
+                data["query"],
+                data.get("variables"),
+                data.get("operationName"),
+            )
+
+            cached = document_cache.get(query, sha256_hash)
+            document = cached.document
+
+            if callable(validation_rules):
+                validation_rules = validation_rules(context_value, document, data)
+
+            validation_errors = document_cache.validate(
+                cached, schema, validation_rules, introspection
+            )
+            if validation_errors:
+                return handle_graphql_errors(
+                    validation_errors,
+                    logger=logger,
+                    error_formatter=error_formatter,
+                    debug=debug,
+                    extension_manager=extension_manager,
+                )
+
+            if callable(root_value):
+                root_value = root_value(context_value, document)
+                if isawaitable(root_value):
+                    root_value = await root_value
+
+            result = execute(
+                schema,
+                document,
+                root_value=root_value,
+                context_value=context_value,
+                variable_values=variables,
+                operation_name=operation_name,
+                execution_context_class=ExecutionContext,
+                middleware=extension_manager.as_middleware_manager(middleware),
+                **kwargs,
+            )
+
+            if isawaitable(result):
+                result = await result
+        except GraphQLError as error:
+            return handle_graphql_errors(
+                [error],
+                logger=logger,
+                error_formatter=error_formatter,
+                debug=debug,
+                extension_manager=extension_manager,
+            )
+        else:
+            return handle_query_result(
+                result,
+                logger=logger,
+                error_formatter=error_formatter,
+                debug=debug,
+                extension_manager=extension_manager,
+            )
@@ -1,28 +1,79 @@
+import asyncio
 from inspect import isawaitable
-from typing import Any
+from typing import Any, Iterable, Optional, Tuple
 
-from ariadne import graphql
 from ariadne.asgi import GraphQL
 from ariadne.exceptions import HttpError
 from starlette.background import BackgroundTasks
 from starlette.requests import Request
-from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.responses import PlainTextResponse, Response
 
+from aj_micro_utils.ariadne.documents import DocumentCache, cached_graphql
+from aj_micro_utils.ariadne.renderers import ORJSONRenderer, ResponseRenderer
+from aj_micro_utils.ariadne.response_cache import ResponseCache
+from aj_micro_utils.background import BackgroundExecutor
 from aj_micro_utils.config import get_settings
 
 DEBUG = get_settings().debug
 
 
 class DebugBackgroundTasks(BackgroundTasks):
+    """
+    The tasks run concurrently through the BackgroundExecutor, with DEBUG
+    they run one after another and their errors are raised, the offloaded
+    ones are still enqueued to arq as the worker functions take its ctx
+    """
+
     async def __call__(self) -> None:
+        if not DEBUG:
+            await BackgroundExecutor.run(self.tasks)
+            return
+
         for task in self.tasks:
-            if DEBUG:
-                await task.func(*task.args, **task.kwargs)
-            else:
-                await task()
+            await BackgroundExecutor.call(task)
 
 
 class GraphQLWithBackGroundTasks(GraphQL):
+    """
+    Ariadne ASGI app running the background tasks after the response,
+    the queries are parsed and validated once through the document cache,
+    known_queries are parsed and validated at startup and can be
+    sent as persisted queries right away, the response is rendered
+    by the renderer, orjson by default, a list of up to max_batch_size
+    operations is executed concurrently and gets a list of results,
+    with a response_cache the query operations are answered from redis
+    for the max age of their cache hints
+    """
+
+    def __init__(
+        self,
+        schema,
+        *,
+        document_cache: Optional[DocumentCache] = None,
+        known_queries: Optional[Iterable[str]] = None,
+        renderer: Optional[ResponseRenderer] = None,
+        max_batch_size: Optional[int] = None,
+        response_cache: Optional[ResponseCache] = None,
+        **kwargs,
+    ):
+        super().__init__(schema, **kwargs)
+        self.max_batch_size = (
+            get_settings().graphql_max_batch_size
+            if max_batch_size is None
+            else max_batch_size
+        )
+        self.document_cache = document_cache or DocumentCache()
+        self.response_cache = response_cache
+        self.renderer = renderer or ORJSONRenderer()
+
+        if known_queries:
+            self.document_cache.warm(
+                schema,
+                known_queries,
+                None if callable(self.validation_rules) else self.validation_rules,
+                self.introspection,
+            )
+
     async def get_context_for_request(self, request: Any) -> Any:
         if callable(self.context_value):
             context = self.context_value(request)
@@ -41,13 +92,77 @@ class GraphQLWithBackGroundTasks(GraphQL):
         except HttpError as error:
             return PlainTextResponse(error.message or error.status, status_code=400)
 
+        if isinstance(data, list):
+            if not self.max_batch_size:
+                return PlainTextResponse("Batching is not enabled", status_code=400)
+            if not data or len(data) > self.max_batch_size:
+                return PlainTextResponse(
+                    f"Batches must have 1 to {self.max_batch_size} operations",
+                    status_code=400,
+                )
+
+        cache_request = None
+
+        if self.response_cache is not None and not isinstance(data, list):
+            cache_request = self.response_cache.prepare(
+                request, data, self.document_cache
+            )
+
+        if cache_request is not None:
+            cached = await self.response_cache.get(cache_request)
+
+            if cached is not None:
+                return self.response_cache.respond(request, cached)
+
         context_value = await self.get_context_for_request(request)
+
+        if isinstance(data, list):
+            results = await asyncio.gather(
+                *[
+                    self.execute_operation(request, operation, context_value)
+                    for operation in data
+                ]
+            )
+            success = any(success for success, _ in results)
+            response = [response for _, response in results]
+        elif cache_request is not None:
+            with self.response_cache.collect_hints(cache_request):
+                success, response = await self.execute_operation(
+                    request, data, context_value
+                )
+        else:
+            success, response = await self.execute_operation(
+                request, data, context_value
+            )
+
+        status_code = 200 if success else 400
+        background = context_value.get("background")
+
+        if cache_request is not None and success:
+            cached = await self.response_cache.set(self.schema, cache_request, response)
+
+            if cached is not None:
+                return self.response_cache.respond(request, cached, background)
+
+        headers = {"Connection": "keep-alive"}
+
+        return self.renderer.render(
+            response, status_code=status_code, headers=headers, background=background
+        )
+
+    async def execute_operation(
+        self, request: Request, data: Any, context_value: Any
+    ) -> Tuple[bool, dict]:
+        """Executes one operation, the operations of a batch
+        share the context, its loaders and background tasks
+        """
         extensions = await self.get_extensions_for_request(request, context_value)
         middleware = await self.get_middleware_for_request(request, context_value)
 
-        success, response = await graphql(
+        return await cached_graphql(
             self.schema,
             data,
+            document_cache=self.document_cache,
             context_value=context_value,
             root_value=self.root_value,
             validation_rules=self.validation_rules,
@@ -58,10 +173,3 @@ class GraphQLWithBackGroundTasks(GraphQL):
             extensions=extensions,
             middleware=middleware,
         )
-        status_code = 200 if success else 400
-        background = context_value.get("background")
-        headers = {"Connection": "keep-alive"}
-
-        return JSONResponse(
-            response, status_code=status_code, background=background, headers=headers
-        )
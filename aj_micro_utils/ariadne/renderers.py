@@ -0,0 +1,141 @@
+from abc import ABC, abstractmethod
+from array import array
+from decimal import Decimal
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network
+from typing import Any, Iterator, Mapping, Optional
+
+import orjson
+from starlette.background import BackgroundTasks
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+from aj_micro_utils.fields import LazyJSON
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def default(o: Any) -> Any:
+    """Types orjson doesn't serialize natively, same as the cache MyEncoder,
+    the LazyJSON documents that weren't decoded are copied as they are
+    """
+    if isinstance(o, Decimal):
+        return float(o)
+
+    if isinstance(o, LazyJSON):
+        return o.value if o.decoded else orjson.Fragment(o.raw)
+
+    if isinstance(o, array):
+        return o.tolist()
+
+    if isinstance(o, (IPv4Address, IPv6Address, IPv4Network, IPv6Network)):
+        return str(o)
+
+    raise TypeError(f"Type is not JSON serializable: {type(o).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """UUID, datetime, date, dataclasses and numpy arrays are serialized natively"""
+    return orjson.dumps(
+        content,
+        default=default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+    )
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def iter_json(content: Any) -> Iterator[bytes]:
+    """The JSON of the content in parts, the first lists are split per item
+    and each item is serialized whole, so a big connection is serialized
+    edge by edge while it is sent
+    """
+    if isinstance(content, dict):
+        yield b"{"
+        for i, (key, value) in enumerate(content.items()):
+            yield (b"," if i else b"") + dumps(str(key)) + b":"
+            yield from iter_json(value)
+        yield b"}"
+    elif isinstance(content, list):
+        yield b"["
+        for i, value in enumerate(content):
+            yield (b"," if i else b"") + dumps(value)
+        yield b"]"
+    else:
+        yield dumps(content)
+
+
+def iter_chunks(content: Any, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    buffer = bytearray()
+
+    for part in iter_json(content):
+        buffer += part
+
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+
+    if buffer:
+        yield bytes(buffer)
+
+
+class ResponseRenderer(ABC):
+    """Turns the graphql result into the http response of GraphQLWithBackGroundTasks"""
+
+    @abstractmethod
+    def render(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        background: Optional[BackgroundTasks] = None,
+    ) -> Response:
+        ...
+
+
+class JSONRenderer(ResponseRenderer):
+    """Starlette JSONResponse, stdlib json"""
+
+    def render(self, content, status_code=200, headers=None, background=None):
+        return JSONResponse(
+            content, status_code=status_code, headers=headers, background=background
+        )
+
+
+class ORJSONRenderer(ResponseRenderer):
+    """
+    orjson serialization, with stream_over_items the responses with more than
+    that many list items (edges...) are streamed in chunk_size chunks
+    """
+
+    def __init__(
+        self, stream_over_items: int = None, chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> None:
+        self.stream_over_items = stream_over_items
+        self.chunk_size = chunk_size
+
+    def render(self, content, status_code=200, headers=None, background=None):
+        if self.stream_over_items and count_items(content) > self.stream_over_items:
+            return StreamingResponse(
+                iter_chunks(content, self.chunk_size),
+                status_code=status_code,
+                headers=headers,
+                media_type=ORJSONResponse.media_type,
+                background=background,
+            )
+
+        return ORJSONResponse(
+            content, status_code=status_code, headers=headers, background=background
+        )
+
+
+def count_items(content: Any) -> int:
+    """Number of list items in the content, stops looking below the lists"""
+    if isinstance(content, dict):
+        return sum(count_items(value) for value in content.values())
+
+    if isinstance(content, list):
+        return len(content)
+
+    return 0
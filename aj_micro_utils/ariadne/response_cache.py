@@ -0,0 +1,362 @@
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Optional, Tuple
+
+import orjson
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLSchema,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    OperationType,
+    SelectionSetNode,
+    get_named_type,
+)
+from graphql.utilities import get_operation_root_type
+from starlette.background import BackgroundTasks
+from starlette.requests import Request
+from starlette.responses import Response
+
+from aj_micro_utils.ariadne.documents import DocumentCache, query_hash
+from aj_micro_utils.ariadne.renderers import ORJSONResponse, dumps
+from aj_micro_utils.cache import redis_get, redis_set
+
+PUBLIC = "PUBLIC"
+PRIVATE = "PRIVATE"
+ANONYMOUS = "anonymous"
+POLICY_CACHE_SIZE = 1024
+
+cache_control_type_defs = """
+    enum CacheControlScope {
+        PUBLIC
+        PRIVATE
+    }
+
+    directive @cacheControl(
+        maxAge: Int
+        scope: CacheControlScope
+    ) on FIELD_DEFINITION | OBJECT | INTERFACE | UNION
+"""
+
+_cache_policy: ContextVar[Optional["CachePolicy"]] = ContextVar(
+    "cache_policy", default=None
+)
+
+
+class CachePolicy:
+    """The lowest max age and the narrowest scope of the fields of a response"""
+
+    __slots__ = ("max_age", "scope")
+
+    def __init__(self, max_age: Optional[int] = None, scope: str = PUBLIC) -> None:
+        self.max_age = max_age
+        self.scope = scope
+
+    def restrict(self, max_age: Optional[int] = None, scope: str = None) -> None:
+        if max_age is not None and (self.max_age is None or max_age < self.max_age):
+            self.max_age = max_age
+        if scope == PRIVATE:
+            self.scope = PRIVATE
+
+
+def set_cache_hint(max_age: int, scope: str = None) -> None:
+    """Lowers the max age of the response the resolver is part of,
+    for data that expires sooner than its schema hint says
+    """
+    policy = _cache_policy.get()
+
+    if policy is not None:
+        policy.restrict(max_age, scope)
+
+
+def get_directive_hint(node: Any) -> Optional[Tuple[Optional[int], Optional[str]]]:
+    """maxAge and scope of the @cacheControl directive of a schema definition"""
+    for directive in getattr(node, "directives", None) or ():
+        if directive.name.value != "cacheControl":
+            continue
+
+        arguments = {arg.name.value: arg.value.value for arg in directive.arguments}
+        max_age = arguments.get("maxAge")
+
+        return (int(max_age) if max_age is not None else None, arguments.get("scope"))
+
+    return None
+
+
+def get_static_policy(
+    schema: GraphQLSchema,
+    operation: OperationDefinitionNode,
+    fragments: dict,
+    default_max_age: int = 0,
+) -> CachePolicy:
+    """
+    The policy of the @cacheControl hints of the selected fields, the maxAge
+    of a field overrides the one of its type, the root fields without a
+    maxAge get default_max_age, the other fields keep the one of their parent
+    """
+    policy = CachePolicy()
+    root_type = get_operation_root_type(schema, operation)
+
+    def visit(parent_type: Any, selection_set: SelectionSetNode, root: bool) -> None:
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = fragments.get(selection.name.value)
+                if fragment is not None:
+                    visit(
+                        schema.get_type(fragment.type_condition.name.value),
+                        fragment.selection_set,
+                        root,
+                    )
+                continue
+
+            if isinstance(selection, InlineFragmentNode):
+                visit(
+                    schema.get_type(selection.type_condition.name.value)
+                    if selection.type_condition
+                    else parent_type,
+                    selection.selection_set,
+                    root,
+                )
+                continue
+
+            if not isinstance(selection, FieldNode) or not hasattr(
+                parent_type, "fields"
+            ):
+                continue
+
+            field = parent_type.fields.get(selection.name.value)
+
+            if field is None:
+                continue
+
+            field_type = get_named_type(field.type)
+            field_hint = get_directive_hint(field.ast_node) or (None, None)
+            type_hint = get_directive_hint(field_type.ast_node) or (None, None)
+            max_age = field_hint[0] if field_hint[0] is not None else type_hint[0]
+
+            if max_age is None and root:
+                max_age = default_max_age
+
+            policy.restrict(max_age, field_hint[1] or type_hint[1])
+
+            if selection.selection_set is not None:
+                visit(field_type, selection.selection_set, False)
+
+    visit(root_type, operation.selection_set, True)
+
+    return policy
+
+
+def default_scope(request: Request) -> str:
+    """The cache is shared by the anonymous requests, each token gets its own"""
+    authorization = request.headers.get("authorization")
+
+    if not authorization:
+        return ANONYMOUS
+
+    return hashlib.sha256(authorization.encode("utf-8")).hexdigest()[:16]
+
+
+class CacheRequest:
+    __slots__ = ("key", "operation_key", "scope", "operation", "fragments", "policy")
+
+    def __init__(
+        self,
+        key: str,
+        operation_key: tuple,
+        scope: str,
+        operation: OperationDefinitionNode,
+        fragments: dict,
+    ) -> None:
+        self.key = key
+        self.operation_key = operation_key
+        self.scope = scope
+        self.operation = operation
+        self.fragments = fragments
+        self.policy = CachePolicy()
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "max_age", "scope")
+
+    def __init__(self, body: bytes, etag: str, max_age: int, scope: str) -> None:
+        self.body = body
+        self.etag = etag
+        self.max_age = max_age
+        self.scope = scope
+
+    def encode(self) -> bytes:
+        return f"{self.etag} {self.max_age} {self.scope}\n".encode("utf-8") + self.body
+
+    @classmethod
+    def decode(cls, value: bytes) -> "CachedResponse":
+        header, body = value.split(b"\n", 1)
+        etag, max_age, scope = header.decode("utf-8").split(" ")
+        return cls(body, etag, int(max_age), scope)
+
+
+class ResponseCache:
+    """
+    Full response cache of the query operations in redis, keyed by the
+    query hash, operation name, variables and the auth scope of the request
+
+    - the max age is the lowest @cacheControl(maxAge) of the selected fields
+    and their types and of the set_cache_hint calls of the resolvers,
+    responses with a max age of 0, errors or a PRIVATE hint for an
+    anonymous request are not cached
+    - the responses have an ETag, a request with a matching
+    If-None-Match gets a 304 without a body
+    """
+
+    def __init__(
+        self,
+        default_max_age: int = 0,
+        scope: Callable[[Request], str] = default_scope,
+        prefix: str = "graphql_response",
+    ) -> None:
+        self.default_max_age = default_max_age
+        self.scope = scope
+        self.prefix = prefix
+        self._policies: "OrderedDict[tuple, CachePolicy]" = OrderedDict()
+
+    def prepare(
+        self, request: Request, data: Any, document_cache: DocumentCache
+    ) -> Optional[CacheRequest]:
+        """The cache key of a query operation, None for what can't be cached"""
+        try:
+            data, sha256_hash = document_cache.resolve_query(data)
+        except GraphQLError:
+            return None
+
+        query = data.get("query") if isinstance(data, dict) else None
+
+        if not query or not isinstance(query, str):
+            return None
+
+        try:
+            document = document_cache.get(query, sha256_hash).document
+        except GraphQLError:
+            return None
+
+        operation_name = data.get("operationName")
+        operations = [
+            definition
+            for definition in document.definitions
+            if isinstance(definition, OperationDefinitionNode)
+            and (
+                operation_name is None
+                or (definition.name and definition.name.value == operation_name)
+            )
+        ]
+
+        if len(operations) != 1 or operations[0].operation != OperationType.QUERY:
+            return None
+
+        scope = self.scope(request)
+        variables = hashlib.md5(
+            orjson.dumps(data.get("variables") or {}, option=orjson.OPT_SORT_KEYS)
+        ).hexdigest()
+        fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if not isinstance(definition, OperationDefinitionNode)
+        }
+
+        operation_key = (sha256_hash or query_hash(query), operation_name or "")
+
+        return CacheRequest(
+            f"{self.prefix}:{':'.join(operation_key)}:{variables}:{scope}",
+            operation_key,
+            scope,
+            operations[0],
+            fragments,
+        )
+
+    async def get(self, cache_request: CacheRequest) -> Optional[CachedResponse]:
+        value = await redis_get(cache_request.key)
+
+        if not value:
+            return None
+
+        return CachedResponse.decode(value)
+
+    @contextmanager
+    def collect_hints(self, cache_request: CacheRequest):
+        """Collects the set_cache_hint calls of the resolvers of the operation"""
+        token = _cache_policy.set(cache_request.policy)
+        try:
+            yield cache_request.policy
+        finally:
+            _cache_policy.reset(token)
+
+    def get_policy(
+        self, schema: GraphQLSchema, cache_request: CacheRequest
+    ) -> CachePolicy:
+        key = (id(schema), *cache_request.operation_key)
+        static = self._policies.get(key)
+
+        if static is None:
+            static = self._policies[key] = get_static_policy(
+                schema,
+                cache_request.operation,
+                cache_request.fragments,
+                self.default_max_age,
+            )
+
+            if len(self._policies) > POLICY_CACHE_SIZE:
+                self._policies.popitem(last=False)
+
+        policy = CachePolicy(static.max_age, static.scope)
+        policy.restrict(cache_request.policy.max_age, cache_request.policy.scope)
+
+        return policy
+
+    async def set(
+        self, schema: GraphQLSchema, cache_request: CacheRequest, response: dict
+    ) -> Optional[CachedResponse]:
+        if "errors" in response:
+            return None
+
+        policy = self.get_policy(schema, cache_request)
+
+        if not policy.max_age or (
+            policy.scope == PRIVATE and cache_request.scope == ANONYMOUS
+        ):
+            return None
+
+        body = dumps(response)
+        cached = CachedResponse(
+            body,
+            f'"{hashlib.md5(body).hexdigest()}"',
+            policy.max_age,
+            PUBLIC if cache_request.scope == ANONYMOUS else PRIVATE,
+        )
+        await redis_set(cache_request.key, cached.encode(), ex=policy.max_age)
+
+        return cached
+
+    def respond(
+        self,
+        request: Request,
+        cached: CachedResponse,
+        background: Optional[BackgroundTasks] = None,
+    ) -> Response:
+        headers = {
+            "ETag": cached.etag,
+            "Cache-Control": f"{cached.scope.lower()}, max-age={cached.max_age}",
+            "Vary": "Authorization",
+        }
+
+        if request.headers.get("if-none-match") == cached.etag:
+            return Response(status_code=304, headers=headers, background=background)
+
+        return Response(
+            cached.body,
+            headers=headers,
+            media_type=ORJSONResponse.media_type,
+            background=background,
+        )
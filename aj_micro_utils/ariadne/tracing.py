@@ -0,0 +1,81 @@
+import time
+from inspect import isawaitable
+from typing import Any, Optional
+
+from ariadne.contrib.tracing.utils import format_path, should_trace
+from ariadne.types import ContextValue, Extension, Resolver
+from graphql import GraphQLResolveInfo
+
+from aj_micro_utils.tracing import Trace, Tracer, current_trace
+
+TRACE_HEADER = "x-graphql-trace"
+
+
+def is_trace_requested(context: ContextValue) -> bool:
+    request = context.get("request") if isinstance(context, dict) else None
+    return request is not None and bool(request.headers.get(TRACE_HEADER))
+
+
+class TracingExtension(Extension):
+    """
+    Times the field resolvers, db queries, cache calls and upstream queries
+    of the operations picked by the Tracer, the other operations only pay
+    for a function call per field
+
+    GraphQLWithBackGroundTasks(schema, extensions=[TracingExtension])
+    """
+
+    def __init__(self) -> None:
+        self.token = None
+        self.trace: Optional[Trace] = None
+
+    def request_started(self, context: ContextValue) -> None:
+        self.token = Tracer.start(is_trace_requested(context))
+
+        if self.token is not None:
+            self.trace = current_trace()
+
+    def request_finished(self, context: ContextValue) -> None:
+        if self.token is not None:
+            Tracer.finish(self.token)
+            self.token = None
+
+    def resolve(self, next_: Resolver, obj: Any, info: GraphQLResolveInfo, **kwargs):
+        trace = self.trace
+
+        if trace is None or not should_trace(info):
+            return next_(obj, info, **kwargs)
+
+        if trace.operation is None and info.operation.name is not None:
+            trace.operation = info.operation.name.value
+
+        start = time.perf_counter()
+        result = next_(obj, info, **kwargs)
+
+        if isawaitable(result):
+            return self.resolve_async(trace, result, start, info)
+
+        trace.add_field(
+            format_path(info.path),
+            f"{info.parent_type.name}.{info.field_name}",
+            (time.perf_counter() - start) * 1000,
+        )
+        return result
+
+    async def resolve_async(
+        self, trace: Trace, result: Any, start: float, info: GraphQLResolveInfo
+    ) -> Any:
+        try:
+            return await result
+        finally:
+            trace.add_field(
+                format_path(info.path),
+                f"{info.parent_type.name}.{info.field_name}",
+                (time.perf_counter() - start) * 1000,
+            )
+
+    def format(self, context: ContextValue) -> Optional[dict]:
+        if self.trace is not None and self.trace.requested:
+            return {"trace": self.trace.as_dict()}
+
+        return None
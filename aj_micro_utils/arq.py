@@ -1,18 +1,227 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+from uuid import uuid4
+
 from arq import create_pool
-from arq.connections import RedisSettings
+from arq.connections import ArqRedis, RedisSettings, expires_extra_ms
+from arq.constants import job_key_prefix, result_key_prefix
+from arq.jobs import serialize_job
+from arq.utils import timestamp_ms, to_ms, to_unix_ms
 
 from aj_micro_utils.config import get_settings
+from aj_micro_utils.redis import RedisConnections
 
 SENTINEL = get_settings().sentinel
+SENTINEL_MASTER = "mymaster"
+ENQUEUE_BATCH_SIZE = 1000
+
+Duration = Union[None, int, float, timedelta]
+
+
+def job_id(function: str, *args, **kwargs) -> str:
+    """Same id for the same function and arguments, enqueued
+    with it a job is only queued once until its result expires
+    """
+    arguments = repr((args, sorted(kwargs.items()))).encode("utf-8")
+    return f"{function}:{hashlib.md5(arguments).hexdigest()}"
+
+
+class ArqJob:
+    """A job for Arq.enqueue_many, same arguments as ArqRedis.enqueue_job"""
+
+    __slots__ = (
+        "function",
+        "args",
+        "kwargs",
+        "job_id",
+        "defer_until",
+        "defer_by",
+        "expires",
+    )
+
+    def __init__(
+        self,
+        function: str,
+        *args: Any,
+        _job_id: Optional[str] = None,
+        _defer_until: Optional[datetime] = None,
+        _defer_by: Duration = None,
+        _expires: Duration = None,
+        **kwargs: Any,
+    ) -> None:
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.job_id = _job_id
+        self.defer_until = _defer_until
+        self.defer_by = _defer_by
+        self.expires = _expires
+
+
+def get_redis_settings(
+    dsn: str = None, sentinels: List[Tuple[str, int]] = None
+) -> RedisSettings:
+    """The settings of the dsn, with sentinels the master of the sentinels,
+    the password and database of the dsn are used for it
+    """
+    if not sentinels:
+        return RedisSettings.from_dsn(dsn)
+
+    conf = urlparse(dsn) if dsn else None
+
+    return RedisSettings(
+        host=sentinels,
+        sentinel=True,
+        sentinel_master=SENTINEL_MASTER,
+        password=conf.password if conf else None,
+        database=int((conf.path or "0").strip("/")) if conf else 0,
+    )
 
 
 class Arq:
     _redis = None
 
     @classmethod
-    async def setup(cls, dsn):
-        cls._redis = await create_pool(RedisSettings.from_dsn(dsn))
+    async def setup(cls, dsn: str = None, sentinels: List[Tuple[str, int]] = None):
+        """
+        Without dsn and sentinels the pool of RedisConnections is used,
+        its arq purpose decodes the replies as utf8 like the arq pools
+        """
+        if dsn is None and sentinels is None:
+            cls._redis = ArqRedis(RedisConnections.pool("arq"))
+        else:
+            cls._redis = await create_pool(get_redis_settings(dsn, sentinels))
 
     @classmethod
     async def enqueue(cls, function: str, *args, **kwargs):
         return await cls._redis.enqueue_job(function, *args, **kwargs)
+
+    @classmethod
+    async def enqueue_many(
+        cls,
+        jobs: Iterable[ArqJob],
+        *,
+        queue_name: str = None,
+        dedupe: bool = False,
+        defer_until: Optional[datetime] = None,
+        defer_by: Duration = None,
+        expires: Duration = None,
+        batch_size: int = ENQUEUE_BATCH_SIZE,
+    ) -> List[Optional[str]]:
+        """
+        Enqueues the jobs with two round trips per batch_size jobs,
+        returns the job ids, None for the jobs already queued or done
+
+        - with dedupe the jobs without a _job_id get the job_id of their function
+        and arguments, so the same work is only queued once
+        - defer_until, defer_by and expires apply to the jobs without their own
+        """
+        ids = []
+        batch = []
+
+        for job in jobs:
+            batch.append(job)
+
+            if len(batch) >= batch_size:
+                ids.extend(
+                    await cls._enqueue_batch(
+                        batch, queue_name, dedupe, defer_until, defer_by, expires
+                    )
+                )
+                batch = []
+
+        if batch:
+            ids.extend(
+                await cls._enqueue_batch(
+                    batch, queue_name, dedupe, defer_until, defer_by, expires
+                )
+            )
+
+        return ids
+
+    @classmethod
+    async def _enqueue_batch(
+        cls,
+        jobs: List[ArqJob],
+        queue_name: Optional[str],
+        dedupe: bool,
+        defer_until: Optional[datetime],
+        defer_by: Duration,
+        expires: Duration,
+    ) -> List[Optional[str]]:
+        """The job keys are set if they don't exist and the jobs
+        are added to the queue when their key was set
+        """
+        redis = cls._redis
+        queue_name = queue_name or redis.default_queue_name
+        enqueue_time_ms = timestamp_ms()
+        ids: List[Optional[str]] = []
+        scores = {}
+        pipe = redis.pipeline()
+
+        for job in jobs:
+            id_ = job.job_id or (
+                job_id(job.function, *job.args, **job.kwargs) if dedupe else uuid4().hex
+            )
+
+            if id_ in scores:
+                ids.append(None)
+                continue
+
+            job_defer_until = job.defer_until or defer_until
+            job_defer_by = to_ms(job.defer_by or defer_by)
+
+            if job_defer_until is not None:
+                score = to_unix_ms(job_defer_until)
+            elif job_defer_by:
+                score = enqueue_time_ms + job_defer_by
+            else:
+                score = enqueue_time_ms
+
+            expires_ms = (
+                to_ms(job.expires or expires)
+                or score - enqueue_time_ms + expires_extra_ms
+            )
+            payload = serialize_job(
+                job.function,
+                job.args,
+                job.kwargs,
+                None,
+                enqueue_time_ms,
+                serializer=redis.job_serializer,
+            )
+            pipe.set(
+                job_key_prefix + id_,
+                payload,
+                pexpire=expires_ms,
+                exist=redis.SET_IF_NOT_EXIST,
+            )
+            pipe.exists(result_key_prefix + id_)
+            scores[id_] = score
+            ids.append(id_)
+
+        results = await pipe.execute()
+        queued = []
+        done = []
+
+        for i, id_ in enumerate(scores):
+            created, has_result = results[i * 2], results[i * 2 + 1]
+
+            if created and not has_result:
+                queued.extend((scores[id_], id_))
+            elif created:
+                done.append(job_key_prefix + id_)
+
+        if queued or done:
+            pipe = redis.pipeline()
+            if queued:
+                pipe.zadd(queue_name, *queued)
+            if done:
+                pipe.delete(*done)
+            await pipe.execute()
+
+        accepted = set(queued[1::2])
+
+        return [id_ if id_ in accepted else None for id_ in ids]
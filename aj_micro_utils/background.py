@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Iterable, Optional
+from weakref import WeakKeyDictionary
+
+import sentry_sdk
+from starlette.background import BackgroundTask
+
+from aj_micro_utils.arq import Arq
+from aj_micro_utils.config import get_settings
+from aj_micro_utils.query_monitor import HISTOGRAM_LIMIT, LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+def task_name(task: BackgroundTask) -> str:
+    func = task.func
+    return (
+        f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+    )
+
+
+class BackgroundExecutor:
+    """
+    Runs the background tasks queued during the requests
+
+    - the tasks of a request run concurrently, at most concurrency
+    tasks run at once in the process and the others wait
+    - a task running longer than timeout seconds is cancelled
+    - a failing task is logged and reported to sentry, the others still run
+    - the functions registered with offload are enqueued to arq
+    by name instead of running in process
+    - the pending and running tasks are counted and the latency
+    of every task is observed in a histogram per function
+    """
+
+    _concurrency: int = get_settings().background_concurrency
+    _timeout: Optional[float] = get_settings().background_timeout or None
+    _offloaded: Dict[Callable, str] = {}
+    _semaphores: "WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+        WeakKeyDictionary()
+    )
+    _histograms: Dict[str, LatencyHistogram] = {}
+    _pending: int = 0
+    _running: int = 0
+    _failed: int = 0
+    _timed_out: int = 0
+
+    @classmethod
+    def setup(cls, concurrency: int = None, timeout: float = None) -> None:
+        """A timeout of 0 disables the timeout"""
+        if concurrency is not None:
+            cls._concurrency = concurrency
+            cls._semaphores = WeakKeyDictionary()
+        if timeout is not None:
+            cls._timeout = timeout or None
+
+    @classmethod
+    def offload(cls, func: Callable, name: str = None) -> Callable:
+        """Registers func to be enqueued to the arq worker function name,
+        the function name by default, can be used as a decorator
+        """
+        cls._offloaded[func] = name or func.__name__
+        return func
+
+    @classmethod
+    def semaphore(cls) -> asyncio.Semaphore:
+        loop = asyncio.get_event_loop()
+        semaphore = cls._semaphores.get(loop)
+
+        if semaphore is None:
+            semaphore = cls._semaphores[loop] = asyncio.Semaphore(cls._concurrency)
+
+        return semaphore
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "pending": cls._pending,
+            "running": cls._running,
+            "failed": cls._failed,
+            "timed_out": cls._timed_out,
+            "tasks": {name: h.as_dict() for name, h in cls._histograms.items()},
+        }
+
+    @classmethod
+    def reset(cls) -> None:
+        cls._histograms = {}
+        cls._failed = 0
+        cls._timed_out = 0
+
+    @classmethod
+    def observe(cls, name: str, duration_ms: float) -> None:
+        histogram = cls._histograms.get(name)
+
+        if histogram is None:
+            if len(cls._histograms) >= HISTOGRAM_LIMIT:
+                return
+            histogram = cls._histograms[name] = LatencyHistogram()
+
+        histogram.observe(duration_ms)
+
+    @classmethod
+    async def run(cls, tasks: Iterable[BackgroundTask]) -> None:
+        await asyncio.gather(*[cls.run_task(task) for task in tasks])
+
+    @classmethod
+    async def run_task(cls, task: BackgroundTask) -> None:
+        name = task_name(task)
+        semaphore = cls.semaphore()
+
+        cls._pending += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            cls._pending -= 1
+
+        cls._running += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(cls.call(task), cls._timeout)
+        except asyncio.TimeoutError as e:
+            cls._timed_out += 1
+            logger.error(f"Background task {name} timed out after {cls._timeout}s")
+            sentry_sdk.capture_exception(e)
+        except Exception as e:
+            cls._failed += 1
+            logger.exception(f"Background task {name} failed: {e}")
+            sentry_sdk.capture_exception(e)
+        finally:
+            cls._running -= 1
+            semaphore.release()
+            cls.observe(name, (time.perf_counter() - start) * 1000)
+
+    @classmethod
+    async def call(cls, task: BackgroundTask) -> None:
+        function = cls._offloaded.get(task.func)
+
+        if function is not None:
+            await Arq.enqueue(function, *task.args, **task.kwargs)
+        else:
+            await task()
@@ -1,15 +1,23 @@
 import json
 from datetime import datetime, date
 from decimal import Decimal
-from functools import _make_key
+from functools import _make_key, lru_cache
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network
+from typing import Tuple
 from uuid import UUID
 
+from tortoise.fields import DatetimeField
 from tortoise.queryset import QuerySet
 
 from aj_micro_utils.config import get_settings
+from aj_micro_utils.datetimes import format_datetime, parse_datetime_columns
 from aj_micro_utils.db import run_query_with_pagination
+from aj_micro_utils.fields import CustomDatetimeField, LazyJSON
 from aj_micro_utils.helper import gql_query
+from aj_micro_utils.query_monitor import QueryMonitor, time_queryset
 from aj_micro_utils.redis import Redis, RedisSentinel
+from aj_micro_utils.routing import DBRouter
+from aj_micro_utils.tracing import span
 
 SENTINEL = get_settings().sentinel
 
@@ -23,33 +31,61 @@ class MyEncoder(json.JSONEncoder):
             return float(o)
 
         if isinstance(o, datetime):
-            return str(o)
+            return format_datetime(o)
 
         if isinstance(o, date):
             return str(o)
 
+        if isinstance(o, LazyJSON):
+            return o.value
+
+        if hasattr(o, "tolist"):  # array('i') and numpy arrays
+            return o.tolist()
+
+        if isinstance(o, (IPv4Address, IPv6Address, IPv4Network, IPv6Network)):
+            return str(o)
+
         return super(MyEncoder, self).default(o)
 
 
 async def redis_get(key):
-    if SENTINEL:
-        return await RedisSentinel.get(key)
+    with span("cache", "get"):
+        if SENTINEL:
+            return await RedisSentinel.get(key)
 
-    return await Redis.get(key)
+        return await Redis.get(key)
 
 
 async def redis_set(key, value, ex: int = 3600):
-    if SENTINEL:
-        return await RedisSentinel.set(key, value, ex)
+    with span("cache", "set"):
+        if SENTINEL:
+            return await RedisSentinel.set(key, value, ex)
 
-    return await Redis.set(key, value, ex)
+        return await Redis.set(key, value, ex)
 
 
 async def redis_exists(key):
-    if SENTINEL:
-        return await RedisSentinel.exists(key)
+    with span("cache", "exists"):
+        if SENTINEL:
+            return await RedisSentinel.exists(key)
+
+        return await Redis.exists(key)
+
+
+async def redis_hincrby(key, field, increment: int = 1):
+    with span("cache", "hincrby"):
+        if SENTINEL:
+            return await RedisSentinel.hincrby(key, field, increment)
+
+        return await Redis.hincrby(key, field, increment)
+
+
+async def redis_hgetall(key) -> dict:
+    with span("cache", "hgetall"):
+        if SENTINEL:
+            return await RedisSentinel.hgetall(key)
 
-    return await Redis.exists(key)
+        return await Redis.hgetall(key)
 
 
 async def redis_update(key, value, ex: int = 3600):
@@ -62,21 +98,25 @@ async def redis_update(key, value, ex: int = 3600):
 
 
 async def redis_delete(key):
-    if SENTINEL:
-        return await RedisSentinel.delete(key)
+    with span("cache", "delete"):
+        if SENTINEL:
+            return await RedisSentinel.delete(key)
 
-    return await Redis.delete(key)
+        return await Redis.delete(key)
 
 
 async def cache_query(
-    cache_key, sql, expiry: int = 3600, connection: str = "default", **kwargs
+    cache_key, sql, expiry: int = 3600, connection: str = None, **kwargs
 ):
     cache = await redis_get(cache_key)
 
     if cache:
         return json.loads(cache)
 
-    results = await run_query_with_pagination(sql, connection, **kwargs)
+    with QueryMonitor.tags(cache="miss", cache_key=cache_key):
+        results = await run_query_with_pagination(
+            sql, connection or DBRouter.read_connection(), **kwargs
+        )
 
     await redis_set(
         cache_key, json.dumps([dict(r) for r in results], cls=MyEncoder), ex=expiry
@@ -109,7 +149,7 @@ async def run_query_with_pagination_and_cache(
     sql: str,
     cursor_name: str,
     expiry: int = 3600,
-    connection: str = "default",
+    connection: str = None,
     *args,
     **kwargs,
 ):
@@ -120,7 +160,10 @@ async def run_query_with_pagination_and_cache(
     if cache:
         return json.loads(cache)
 
-    results = await run_query_with_pagination(sql, connection, **kwargs)
+    with QueryMonitor.tags(cache="miss", cache_key=cache_key):
+        results = await run_query_with_pagination(
+            sql, connection or DBRouter.read_connection(), **kwargs
+        )
 
     await redis_set(
         cache_key, json.dumps([dict(r) for r in results], cls=MyEncoder), ex=expiry
@@ -145,26 +188,27 @@ async def orm_query_and_cache(
     cache = await redis_get(cache_key)
 
     if cache:
-        return [queryset.model(**r) for r in json.loads(cache)]
+        return load_cached_models(queryset.model, cache)
 
     if after:
-        result = (
-            await queryset.filter(
-                **{f"{queryset.model.Meta.paginate_on}__lt": after_cursor}
-            )
+        values_query = (
+            queryset.filter(**{f"{queryset.model.Meta.paginate_on}__lt": after_cursor})
             .all()
             .order_by(f"-{queryset.model.Meta.paginate_on}")
             .limit(limit)
             .values()
         )
     else:
-        result = (
-            await queryset.all()
+        values_query = (
+            queryset.all()
             .order_by(f"-{queryset.model.Meta.paginate_on}")
             .limit(limit)
             .values()
         )
 
+    with QueryMonitor.tags(cache="miss", cache_key=cache_key):
+        result = await time_queryset(values_query)
+
     await redis_set(cache_key, json.dumps(result, cls=MyEncoder), ex=expiry)
 
     return [queryset.model(**r) for r in result]
@@ -174,15 +218,28 @@ async def orm_redis_get(key: str, model, single: bool = False):
     result = await redis_get(key)
 
     if result:
-        convert = json.loads(result)
+        models = load_cached_models(model, result)
 
-        if single:
-            return model(**convert[0])
-
-        return [model(**r) for r in convert]
+        return models[0] if single else models
 
     return None
 
 
+def load_cached_models(model, cache) -> list:
+    """The models of cached rows, their datetime columns are parsed per column"""
+    rows = parse_datetime_columns(json.loads(cache), get_datetime_columns(model))
+
+    return [model(**r) for r in rows]
+
+
+@lru_cache(maxsize=None)
+def get_datetime_columns(model) -> Tuple[str, ...]:
+    return tuple(
+        name
+        for name, field in model._meta.fields_map.items()
+        if isinstance(field, (DatetimeField, CustomDatetimeField))
+    )
+
+
 async def orm_redis_set(key: str, value, expiry: int = 3600):
     await redis_set(key, json.dumps(value, cls=MyEncoder), ex=expiry)
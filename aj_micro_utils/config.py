@@ -11,6 +11,17 @@ class Settings(BaseSettings):
     debug: bool = False
     database_url: str = ""
     sentinel: bool = False
+    slow_query_ms: float = 500
+    explain_sample_rate: float = 0.0
+    query_max_first: int = 100
+    query_max_cost: float = 1000
+    query_max_depth: int = 10
+    graphql_max_cost: float = 10000
+    background_concurrency: int = 10
+    background_timeout: float = 30
+    trace_sample_rate: float = 0.0
+    trace_requests: bool = False
+    graphql_max_batch_size: int = 10
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,87 @@
+import functools
+from datetime import datetime, timezone, tzinfo
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    from ciso8601 import parse_datetime as parse_iso8601
+except ImportError:  # pragma: nocoverage
+    from iso8601 import parse_date
+
+    parse_iso8601 = functools.partial(parse_date, default_timezone=None)
+
+
+def with_timezone(value: datetime, tz: Optional[tzinfo] = timezone.utc) -> datetime:
+    """Naive datetimes are in tz, they stay naive without it"""
+    if value.tzinfo is None and tz is not None:
+        return value.replace(tzinfo=tz)
+
+    return value
+
+
+def format_datetime(value: datetime) -> str:
+    """
+    Fixed format text of the cursors and the cache, always with the
+    microseconds, with the offset unless the datetime is naive:
+    2021-01-01 12:00:00.000000+00:00
+    """
+    return value.isoformat(sep=" ", timespec="microseconds")
+
+
+def parse_datetime(
+    value: Any, tz: Optional[tzinfo] = timezone.utc
+) -> Optional[datetime]:
+    """
+    The datetime of a text, a timestamp in seconds or a datetime, naive
+    ones are in tz, with tz None they stay naive (timestamp without time
+    zone columns). The text of format_datetime, str() and isoformat() is
+    parsed by datetime.fromisoformat, the other ISO 8601 texts ("Z" offset,
+    no separators...) by ciso8601 or iso8601
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, datetime):
+        return with_timezone(value, tz)
+
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz or timezone.utc)
+
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        parsed = parse_iso8601(value)
+
+    return with_timezone(parsed, tz)
+
+
+def parse_datetimes(
+    values: Iterable[Any], tz: tzinfo = timezone.utc
+) -> List[Optional[datetime]]:
+    """parse_datetime of a result column, each distinct value is parsed once"""
+    parsed: Dict[Any, Optional[datetime]] = {}
+    column = []
+
+    for value in values:
+        try:
+            column.append(parsed[value])
+        except KeyError:
+            column.append(parsed.setdefault(value, parse_datetime(value, tz)))
+
+    return column
+
+
+def parse_datetime_columns(
+    rows: List[dict], columns: Iterable[str], tz: tzinfo = timezone.utc
+) -> List[dict]:
+    """The datetime columns of the rows parsed in place, column by column"""
+    for column in columns:
+        if not rows or column not in rows[0]:
+            continue
+
+        for row, value in zip(rows, parse_datetimes([r[column] for r in rows], tz)):
+            row[column] = value
+
+    return rows
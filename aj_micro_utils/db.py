@@ -1,7 +1,144 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+from weakref import WeakKeyDictionary
+
+from asyncpg import Record
+from asyncpg.prepared_stmt import PreparedStatement
+from jinja2 import Template, nodes
+from jinja2.utils import Markup
 from jinjasql import JinjaSql
+from jinjasql.core import _thread_local
 from tortoise import Tortoise
 
-j = JinjaSql(param_style="asyncpg")
+from aj_micro_utils.query_monitor import QueryMonitor
+
+TEMPLATE_CACHE_SIZE = 256
+RENDERED_CACHE_SIZE = 1024
+PREPARED_CACHE_SIZE = 128
+
+# nodes a template may consist of for its rendered sql to depend only on
+# which bind params are set, anything else (comparisons, loops, sqlsafe,
+# inclause...) makes the output depend on the values themselves
+SHAPE_SAFE_NODES = (
+    nodes.Template,
+    nodes.Output,
+    nodes.TemplateData,
+    nodes.If,
+    nodes.Name,
+    nodes.Const,
+    nodes.Not,
+    nodes.And,
+    nodes.Or,
+)
+SHAPE_SAFE_TESTS = ("none", "defined", "undefined")
+
+
+class CachingJinjaSql(JinjaSql):
+    def prepare_query_with_names(
+        self, template: Template, data: dict
+    ) -> Tuple[str, list, list]:
+        """Same as prepare_query, but also returns the name of
+        the variable each bind param came from
+        """
+        try:
+            _thread_local.bind_params = OrderedDict()
+            _thread_local.param_style = self.param_style
+            _thread_local.param_index = 0
+            query = template.render(data)
+            bind_params = _thread_local.bind_params
+            names = [key.rsplit("_", 1)[0] for key in bind_params.keys()]
+            return query, list(bind_params.values()), names
+        finally:
+            del _thread_local.bind_params
+            del _thread_local.param_style
+            del _thread_local.param_index
+
+
+j = CachingJinjaSql(param_style="asyncpg")
+
+_rendered_queries: "OrderedDict[tuple, Tuple[str, list]]" = OrderedDict()
+_prepared_statements: "WeakKeyDictionary[Any, OrderedDict]" = WeakKeyDictionary()
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def get_template(sql: str) -> Template:
+    """Compiles the sql template once per sql text"""
+    return j.env.from_string(sql)
+
+
+def is_shape_safe(node: nodes.Node) -> bool:
+    if isinstance(node, nodes.Filter):
+        return node.name == "bind" and isinstance(node.node, nodes.Name)
+
+    if isinstance(node, nodes.Test):
+        return node.name in SHAPE_SAFE_TESTS and isinstance(node.node, nodes.Name)
+
+    if not isinstance(node, SHAPE_SAFE_NODES):
+        return False
+
+    return all(is_shape_safe(child) for child in node.iter_child_nodes())
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def can_cache_rendered(sql: str) -> bool:
+    """The rendered sql can be reused when the template only branches
+    on variables being set or not and binds plain variables
+    """
+    return is_shape_safe(j.env.parse(sql))
+
+
+def get_shape(data: dict) -> Optional[tuple]:
+    """Describes which of the params are set, values that
+    are rendered into the sql text itself have no shape
+    """
+    shape = []
+    for key, value in data.items():
+        if isinstance(value, (Markup, list, tuple, dict)):
+            return None
+        shape.append((key, value is None, bool(value)))
+
+    return tuple(shape)
+
+
+def prepare_query(sql: str, data: dict) -> Tuple[str, list]:
+    """Renders the sql template into a query and its bind params,
+    reusing the rendered query for the same shape of params
+    """
+    template = get_template(sql)
+
+    if not can_cache_rendered(sql):
+        return j.prepare_query(template, data)
+
+    shape = get_shape(data)
+
+    if shape is None:
+        return j.prepare_query(template, data)
+
+    key = (sql, shape)
+    cached = _rendered_queries.get(key)
+
+    if cached is not None:
+        _rendered_queries.move_to_end(key)
+        query, names = cached
+
+        return query, [data[name] for name in names]
+
+    query, bind_params, names = j.prepare_query_with_names(template, data)
+
+    if all(name in data for name in names):
+        _rendered_queries[key] = (query, names)
+
+        if len(_rendered_queries) > RENDERED_CACHE_SIZE:
+            _rendered_queries.popitem(last=False)
+
+    return query, bind_params
+
+
+def clear_query_cache() -> None:
+    get_template.cache_clear()
+    can_cache_rendered.cache_clear()
+    _rendered_queries.clear()
 
 
 async def run_query_with_pagination(query: str, connection: str, **kwargs):
@@ -10,8 +147,156 @@ async def run_query_with_pagination(query: str, connection: str, **kwargs):
     based on the choice:
     """
     sql = query
-    query, bind_params = j.prepare_query(sql, kwargs)
+    query, bind_params = prepare_query(sql, kwargs)
 
     client = Tortoise.get_connection(connection)
 
-    return await client.execute_query_dict(query, bind_params)
+    return await QueryMonitor.timed(
+        client.execute_query_dict(query, bind_params), query, bind_params, client
+    )
+
+
+def unwrap_connection(conn: Any) -> Any:
+    """Pool proxies are recreated on every acquire, the prepared
+    statements belong to the underlying asyncpg connection
+    """
+    return getattr(conn, "_con", None) or conn
+
+
+async def get_prepared_statement(conn: Any, query: str) -> PreparedStatement:
+    """Prepares the query once per connection and reuses it afterwards"""
+    statements = _prepared_statements.setdefault(unwrap_connection(conn), OrderedDict())
+    statement = statements.get(query)
+
+    if statement is not None:
+        statements.move_to_end(query)
+        return statement
+
+    statement = await conn.prepare(query)
+    statements[query] = statement
+
+    if len(statements) > PREPARED_CACHE_SIZE:
+        statements.popitem(last=False)
+
+    return statement
+
+
+def forget_prepared_statement(conn: Any, query: str) -> None:
+    statements = _prepared_statements.get(unwrap_connection(conn))
+
+    if statements is not None:
+        statements.pop(query, None)
+
+
+async def fetch_records(
+    query: str, connection: str = "default", **kwargs
+) -> List[Record]:
+    """Same as run_query_with_pagination but uses a prepared statement
+    and returns the asyncpg records without converting them to dicts
+    """
+    query, bind_params = prepare_query(query, kwargs)
+
+    client = Tortoise.get_connection(connection)
+
+    async with client.acquire_connection() as conn:
+        statement = await get_prepared_statement(conn, query)
+
+        try:
+            return await QueryMonitor.timed(
+                statement.fetch(*bind_params), query, bind_params, client
+            )
+        except Exception:
+            # the cached plan can go stale after a schema change
+            forget_prepared_statement(conn, query)
+            raise
+
+
+async def executemany(
+    query: str, args: Iterable[Sequence], connection: str = "default"
+) -> None:
+    """Runs the query once per args row in a single round trip and transaction,
+    the query uses asyncpg $n placeholders
+    """
+    client = Tortoise.get_connection(connection)
+
+    async with client.acquire_connection() as conn:
+        async with conn.transaction():
+            await conn.executemany(query, args)
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+async def bulk_insert(
+    table: str,
+    records: Iterable[Sequence],
+    columns: List[str],
+    connection: str = "default",
+    schema_name: Optional[str] = None,
+) -> int:
+    """Loads the records into the table using binary COPY,
+    returns the number of rows copied
+    """
+    client = Tortoise.get_connection(connection)
+
+    async with client.acquire_connection() as conn:
+        result = await conn.copy_records_to_table(
+            table, records=records, columns=columns, schema_name=schema_name
+        )
+
+    return int(result.split(" ")[1])
+
+
+async def bulk_upsert(
+    table: str,
+    records: Iterable[Sequence],
+    columns: List[str],
+    conflict_columns: List[str],
+    update_columns: Optional[List[str]] = None,
+    connection: str = "default",
+    schema_name: Optional[str] = None,
+) -> int:
+    """COPY the records into a temporary table and upsert them
+    into the table with a single INSERT ... ON CONFLICT,
+    update_columns defaults to every column that is not in conflict_columns
+    """
+    if update_columns is None:
+        update_columns = [c for c in columns if c not in conflict_columns]
+
+    target = quote_identifier(table)
+    if schema_name is not None:
+        target = f"{quote_identifier(schema_name)}.{target}"
+
+    # temporary tables live in their own schema, the staging one is unqualified
+    staging = quote_identifier(f"_bulk_upsert_{table}")
+    column_list = ", ".join(quote_identifier(c) for c in columns)
+    conflict_list = ", ".join(quote_identifier(c) for c in conflict_columns)
+
+    if update_columns:
+        action = "DO UPDATE SET " + ", ".join(
+            f"{quote_identifier(c)} = EXCLUDED.{quote_identifier(c)}"
+            for c in update_columns
+        )
+    else:
+        action = "DO NOTHING"
+
+    client = Tortoise.get_connection(connection)
+
+    async with client.acquire_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                f"CREATE TEMPORARY TABLE {staging} "
+                f"(LIKE {target} INCLUDING DEFAULTS)"
+            )
+            await conn.copy_records_to_table(
+                f"_bulk_upsert_{table}", records=records, columns=columns
+            )
+            result = await conn.execute(
+                f"INSERT INTO {target} ({column_list}) "
+                f"SELECT {column_list} FROM {staging} "
+                f"ON CONFLICT ({conflict_list}) {action}"
+            )
+            await conn.execute(f"DROP TABLE {staging}")
+
+    return int(result.split(" ")[2])
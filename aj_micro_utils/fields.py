@@ -1,37 +1,385 @@
 import functools
+from array import array
 from datetime import datetime, timezone
-from typing import Any, Optional, List, Union
-
-from tortoise import fields, ConfigurationError
+from decimal import Decimal
+from ipaddress import (
+    IPv4Address,
+    IPv4Interface,
+    IPv6Address,
+    IPv6Interface,
+    ip_address,
+    ip_interface,
+)
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, List, Union
+
+import orjson
+from pypika.enums import Comparator
+from pypika.terms import BasicCriterion, Criterion, Term
+from tortoise import Tortoise, fields, ConfigurationError
 from tortoise.exceptions import FieldError
 from tortoise.fields import Field
-from tortoise.fields.data import JsonLoadsFunc, JSON_LOADS, JSON_DUMPS, JsonDumpsFunc
+from tortoise.fields.data import JsonLoadsFunc, JsonDumpsFunc
+
+from aj_micro_utils.datetimes import parse_datetime
+
+_UNSET = object()
+INET_CACHE_SIZE = 4096
+
+IPAddress = Union[IPv4Address, IPv6Address]
+IPInterface = Union[IPv4Interface, IPv6Interface]
+
+
+def _json_default(o: Any) -> Any:
+    if isinstance(o, Decimal):
+        return float(o)
+
+    if isinstance(o, LazyJSON):
+        return o.value
+
+    raise TypeError(f"Type is not JSON serializable: {type(o).__name__}")
+
+
+def json_dumps(value: Any) -> str:
+    return orjson.dumps(
+        value, default=_json_default, option=orjson.OPT_NON_STR_KEYS
+    ).decode("utf-8")
+
+
+json_loads = orjson.loads
+
+
+class LazyJSON:
+    """
+    JSON document decoded on first access, raw is the text or bytes
+    it was read from, it is written back as is until it is decoded
+    """
+
+    __slots__ = ("raw", "_value", "_decoder")
+
+    def __init__(self, raw: Union[str, bytes], decoder: JsonLoadsFunc = json_loads):
+        self.raw = raw
+        self._value = _UNSET
+        self._decoder = decoder
+
+    @property
+    def decoded(self) -> bool:
+        return self._value is not _UNSET
+
+    @property
+    def value(self) -> Any:
+        if self._value is _UNSET:
+            try:
+                self._value = self._decoder(self.raw)
+            except Exception:
+                raise FieldError(f"Value {self.raw!r} is invalid json value.")
+
+        return self._value
+
+    @property
+    def text(self) -> str:
+        """The JSON text, the raw one while it isn't decoded"""
+        if self.decoded:
+            return json_dumps(self._value)
+
+        return self.raw.decode("utf-8") if isinstance(self.raw, bytes) else self.raw
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self.value.get(key, default)
+
+    def keys(self):
+        return self.value.keys()
+
+    def values(self):
+        return self.value.values()
+
+    def items(self):
+        return self.value.items()
+
+    def __getitem__(self, key: Any) -> Any:
+        return self.value[key]
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self.value[key] = value
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.value
 
-try:
-    from ciso8601 import parse_datetime
-except ImportError:  # pragma: nocoverage
-    from iso8601 import parse_date
+    def __iter__(self) -> Iterator:
+        return iter(self.value)
 
-    parse_datetime = functools.partial(parse_date, default_timezone=None)
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def __bool__(self) -> bool:
+        return bool(self.value)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, LazyJSON):
+            other = other.value
+
+        return self.value == other
+
+    def __repr__(self) -> str:
+        if self.decoded:
+            return f"LazyJSON({self._value!r})"
+
+        return f"LazyJSON(raw={self.raw!r})"
+
+
+def encode_db_json(value: Any) -> str:
+    """Encoder of the asyncpg json codecs, the fields already encode their values"""
+    if isinstance(value, str):
+        return value
+
+    if isinstance(value, LazyJSON):
+        return value.text
+
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+
+    return json_dumps(value)
+
+
+async def register_json_codecs(connection: Any, lazy: bool = True) -> None:
+    """
+    asyncpg init hook, json and jsonb columns are decoded by asyncpg into
+    LazyJSON values (or decoded with orjson when lazy is False) so the
+    fields don't parse them a second time, it is passed to asyncpg with the
+    tortoise connection credentials: {..., "init": register_json_codecs}
+    """
+    for typename in ("json", "jsonb"):
+        await connection.set_type_codec(
+            typename,
+            encoder=encode_db_json,
+            decoder=LazyJSON if lazy else json_loads,
+            schema="pg_catalog",
+        )
+
+
+class ArrayOperators(Comparator):
+    contains = "@>"
+    contained_by = "<@"
+    overlap = "&&"
+
+
+class IntArrayValue(Term):
+    """integer[] literal, the values are ints so they are inlined as is"""
+
+    def __init__(self, values: Iterable[int]) -> None:
+        super().__init__()
+        self.values = values
+
+    def get_sql(self, **kwargs: Any) -> str:
+        return "'{%s}'::integer[]" % ",".join(str(value) for value in self.values)
+
+
+def int_array_encoder(value: Any, instance: Any, field: Field) -> List[int]:
+    """Value of an array lookup, an int is an array of one"""
+    if isinstance(value, int):
+        return [value]
+
+    return [int(v) for v in value]
+
+
+def array_contains(field: Term, value: List[int]) -> Criterion:
+    return BasicCriterion(ArrayOperators.contains, field, IntArrayValue(value))
+
+
+def array_contained_by(field: Term, value: List[int]) -> Criterion:
+    return BasicCriterion(ArrayOperators.contained_by, field, IntArrayValue(value))
+
+
+def array_overlap(field: Term, value: List[int]) -> Criterion:
+    return BasicCriterion(ArrayOperators.overlap, field, IntArrayValue(value))
+
+
+def get_array_filters(
+    field_name: str, field: Field, source_field: str
+) -> Dict[str, dict]:
+    """
+    Lookups of the integer[] columns, all of them can use a GIN index:
+    - contains: the column has all the values (@>)
+    - contained_by: the values have all the ones of the column (<@)
+    - overlap: the column has any of the values (&&)
+    - any: the column has the value, the same as contains=[value]
+    rather than value = ANY(column) that no index serves
+    """
+    actual_field_name = field.model_field_name if field_name == "pk" else field_name
+    lookups = {
+        "contains": array_contains,
+        "contained_by": array_contained_by,
+        "overlap": array_overlap,
+        "any": array_contains,
+    }
+
+    return {
+        f"{field_name}__{lookup}": {
+            "field": actual_field_name,
+            "source_field": source_field,
+            "operator": operator,
+            "value_encoder": int_array_encoder,
+        }
+        for lookup, operator in lookups.items()
+    }
 
 
 class ArrayIntField(Field):
+    """
+    integer[] field.
+
+    ``compact_size``:
+        The arrays of at least compact_size values are returned as
+        ``array('i')``, 4 bytes per value instead of a python int object
+        each, unset they are all lists. ``array('i', [1]) == [1]`` is False,
+        compare them with ``list(value)``.
+    ``numpy``:
+        The compacted arrays are numpy arrays, all of them without a compact_size.
+
+    The contains, contained_by, overlap and any lookups are added by
+    ``register_field_filters()``, see ``get_array_filters``.
+    """
+
     class _db_postgres:
         SQL_TYPE = "integer[]"
 
-    def __init__(self, **kwargs: Any) -> None:
+    def __init__(
+        self, compact_size: Optional[int] = None, numpy: bool = False, **kwargs: Any
+    ) -> None:
         super().__init__(**kwargs)
+        self.compact_size = compact_size
+        self.numpy = None
+
+        if numpy:
+            if compact_size is None:
+                self.compact_size = 0
+
+            try:
+                import numpy as np
+            except ImportError:  # pragma: nocoverage
+                raise ConfigurationError("ArrayIntField(numpy=True) requires numpy")
+
+            self.numpy = np
 
     def to_db_value(
         self, value: Any, instance: "Union[Type[Model], Model]"
     ) -> Optional[List[int]]:
-        return value
+        if value is None or isinstance(value, list):
+            return value
+
+        if hasattr(value, "tolist"):
+            return value.tolist()
+
+        return list(value)
+
+    def to_python_value(self, value: Any) -> Optional[Union[List[int], array]]:
+        if value is None or self.compact_size is None:
+            return value
+
+        if len(value) < self.compact_size:
+            return value
+
+        if self.numpy is not None:
+            return self.numpy.asarray(value, dtype=self.numpy.int32)
+
+        if isinstance(value, array):
+            return value
+
+        return array("i", value)
+
+
+class InetOperators(Comparator):
+    within = "<<"
+    within_or_equal = "<<="
+    contains_or_equal = ">>="
+    overlap = "&&"
+
+
+class InetValue(Term):
+    """inet literal of a parsed address or network"""
+
+    def __init__(self, value: Union[IPAddress, IPInterface]) -> None:
+        super().__init__()
+        self.value = value
+
+    def get_sql(self, **kwargs: Any) -> str:
+        return f"'{self.value}'::inet"
+
+
+@functools.lru_cache(maxsize=INET_CACHE_SIZE)
+def parse_inet(value: str) -> Union[IPAddress, IPInterface]:
+    """
+    The address of a host, the interface of a value with a prefix,
+    as asyncpg decodes them, the same text is only parsed once
+    """
+    try:
+        return ip_interface(value) if "/" in value else ip_address(value)
+    except ValueError:
+        raise FieldError(f"Value {value} is invalid inet value.")
+
+
+def inet_encoder(
+    value: Any, instance: Any, field: Field
+) -> Union[IPAddress, IPInterface]:
+    """Value of an inet lookup, an address or a network in cidr notation"""
+    return parse_inet(str(value))
 
-    def to_python_value(self, value: List[int]) -> Optional[List[int]]:
-        return value
+
+def inet_within(field: Term, value: Any) -> Criterion:
+    return BasicCriterion(InetOperators.within, field, InetValue(value))
+
+
+def inet_within_or_equal(field: Term, value: Any) -> Criterion:
+    return BasicCriterion(InetOperators.within_or_equal, field, InetValue(value))
+
+
+def inet_contains_or_equal(field: Term, value: Any) -> Criterion:
+    return BasicCriterion(InetOperators.contains_or_equal, field, InetValue(value))
+
+
+def inet_overlap(field: Term, value: Any) -> Criterion:
+    return BasicCriterion(InetOperators.overlap, field, InetValue(value))
+
+
+def get_inet_filters(
+    field_name: str, field: Field, source_field: str
+) -> Dict[str, dict]:
+    """
+    Lookups of the inet columns, a GiST index with inet_ops serves them:
+    - within: the column is in the network and not equal to it (<<)
+    - within_or_equal: the column is in the network or equal to it (<<=)
+    - contains_or_equal: the column contains the address or network (>>=)
+    - overlap: either of them contains the other (&&)
+    """
+    actual_field_name = field.model_field_name if field_name == "pk" else field_name
+    lookups = {
+        "within": inet_within,
+        "within_or_equal": inet_within_or_equal,
+        "contains_or_equal": inet_contains_or_equal,
+        "overlap": inet_overlap,
+    }
+
+    return {
+        f"{field_name}__{lookup}": {
+            "field": actual_field_name,
+            "source_field": source_field,
+            "operator": operator,
+            "value_encoder": inet_encoder,
+        }
+        for lookup, operator in lookups.items()
+    }
 
 
 class InetField(Field):
+    """
+    inet field.
+
+    The values are ``ipaddress`` objects, an address for a host
+    and an interface for a value with a network prefix.
+
+    The within, within_or_equal, contains_or_equal and overlap lookups
+    are added by ``register_field_filters()``, see ``get_inet_filters``.
+    """
+
     class _db_postgres:
         SQL_TYPE = "inet"
 
@@ -41,10 +389,16 @@ class InetField(Field):
     def to_db_value(
         self, value: Any, instance: "Union[Type[Model], Model]"
     ) -> Optional[str]:
-        return value
+        if value is None:
+            return None
 
-    def to_python_value(self, value: str) -> Optional[str]:
-        return value
+        return str(parse_inet(value) if isinstance(value, str) else value)
+
+    def to_python_value(self, value: Any) -> Optional[Union[IPAddress, IPInterface]]:
+        if value is None or not isinstance(value, str):
+            return value
+
+        return parse_inet(value)
 
 
 class CustomDatetimeField(fields.Field, datetime):
@@ -79,11 +433,7 @@ class CustomDatetimeField(fields.Field, datetime):
         self.tz = tz
 
     def to_python_value(self, value: Any) -> Optional[datetime]:
-        if value is None or isinstance(value, datetime):
-            return value
-        if isinstance(value, int):
-            return datetime.fromtimestamp(value, self.tz)
-        return parse_datetime(value, default_timezone=self.tz)
+        return parse_datetime(value, self.tz)
 
     def to_db_value(
         self, value: Optional[datetime], instance: "Union[Type[Model], Model]"
@@ -112,14 +462,15 @@ class CustomJSONField(Field, dict, list):  # type: ignore
 
     This field can store dictionaries or lists of any JSON-compliant structure.
 
-    You can specify your own custom JSON encoder/decoder, leaving at the default should work well.
-    If you have ``python-rapidjson`` installed, we default to using that,
-    else the default ``json`` module will be used.
+    You can specify your own custom JSON encoder/decoder, the default is orjson.
 
     ``encoder``:
         The custom JSON encoder.
     ``decoder``:
         The custom JSON decoder.
+    ``lazy``:
+        The values are LazyJSON documents decoded on first access,
+        for wide columns the formatters don't always read.
 
     """
 
@@ -131,33 +482,75 @@ class CustomJSONField(Field, dict, list):  # type: ignore
 
     def __init__(
         self,
-        encoder: JsonDumpsFunc = JSON_DUMPS,
-        decoder: JsonLoadsFunc = JSON_LOADS,
+        encoder: JsonDumpsFunc = json_dumps,
+        decoder: JsonLoadsFunc = json_loads,
+        lazy: bool = False,
         **kwargs: Any,
     ) -> None:
         super().__init__(**kwargs)
         self.encoder = encoder
         self.decoder = decoder
+        self.lazy = lazy
 
     def to_db_value(
         self,
-        value: Optional[Union[dict, list, str]],
+        value: Optional[Union[dict, list, str, LazyJSON]],
         instance: "Union[Type[Model], Model]",
     ) -> Optional[str]:
+        if isinstance(value, LazyJSON):
+            return value.text if not value.decoded else self.encoder(value.value)
         if isinstance(value, str):
             try:
-                self.encoder(value)
+                self.decoder(value)
             except Exception:
                 raise FieldError(f"Value {value} is invalid json value.")
             return value
         return None if value is None else self.encoder(value)
 
     def to_python_value(
-        self, value: Optional[Union[str, dict, list]]
-    ) -> Optional[Union[dict, list]]:
-        if isinstance(value, str):
+        self, value: Optional[Union[str, bytes, dict, list, LazyJSON]]
+    ) -> Optional[Union[dict, list, LazyJSON]]:
+        if isinstance(value, (str, bytes)):
+            if self.lazy:
+                return LazyJSON(value, self.decoder)
             try:
                 return self.decoder(value)
             except Exception:
                 raise FieldError(f"Value {value} is invalid json value.")
+        if isinstance(value, LazyJSON) and not self.lazy:
+            return value.value
         return value
+
+
+FIELD_FILTERS: Dict[type, Callable[[str, Field, str], Dict[str, dict]]] = {
+    ArrayIntField: get_array_filters,
+    InetField: get_inet_filters,
+}
+
+
+def add_field_filters(model: Any) -> None:
+    """The lookups of FIELD_FILTERS for the fields of the model,
+    next to the tortoise ones of its other fields
+    """
+    meta = model._meta
+
+    for name, field in meta.fields_map.items():
+        for field_class, get_filters in FIELD_FILTERS.items():
+            if not isinstance(field, field_class):
+                continue
+
+            source_field = meta.fields_db_projection.get(name, name)
+            field_filters = get_filters(name, field, source_field)
+
+            if field.pk:
+                field_filters.update(get_filters("pk", field, source_field))
+
+            meta._filters.update(field_filters)
+            meta.filters.update(field_filters)
+
+
+def register_field_filters() -> None:
+    """add_field_filters of every model, call it right after Tortoise.init"""
+    for app in Tortoise.apps.values():
+        for model in app.values():
+            add_field_filters(model)
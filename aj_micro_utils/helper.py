@@ -6,6 +6,7 @@ import sentry_sdk
 from httpx import HTTPStatusError
 
 from aj_micro_utils.config import get_settings
+from aj_micro_utils.tracing import span
 
 GRAPHQL_TOKEN = get_settings().graphql_token
 GRAPHQL_ENDPOINT = get_settings().graphql_url
@@ -14,23 +15,24 @@ GIT_VERSION = get_settings().git_version
 
 async def gql_query(query: str, variables: dict, client_name: str = ""):
     try:
-        async with httpx.AsyncClient() as client:
-            r = await client.post(
-                f"{GRAPHQL_ENDPOINT}graphql/",
-                json={
-                    "query": query,
-                    "variables": variables,
-                },
-                headers={
-                    "apollographql-client-name": client_name,
-                    "apollographql-client-version": GIT_VERSION,
-                    "Authorization": GRAPHQL_TOKEN,
-                },
-            )
+        with span("upstream", client_name or "graphql"):
+            async with httpx.AsyncClient() as client:
+                r = await client.post(
+                    f"{GRAPHQL_ENDPOINT}graphql/",
+                    json={
+                        "query": query,
+                        "variables": variables,
+                    },
+                    headers={
+                        "apollographql-client-name": client_name,
+                        "apollographql-client-version": GIT_VERSION,
+                        "Authorization": GRAPHQL_TOKEN,
+                    },
+                )
 
-            r.raise_for_status()
+                r.raise_for_status()
 
-            return r.json()
+                return r.json()
     except HTTPStatusError as e:
         logging.error(e)
         sentry_sdk.capture_exception(e)
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import logging
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import aioredis
+import asyncpg
+
+from aj_micro_utils.cache import redis_hincrby
+from aj_micro_utils.config import get_settings
+from aj_micro_utils.db import quote_identifier
+from aj_micro_utils.fields import ArrayIntField, InetField
+
+USAGE_KEY = "index_advisor:usage"
+KEY_SEPARATOR = "|"
+
+# expected benefit of an index per recorded use, a pattern lookup
+# without an index reads the whole table
+BENEFIT_WEIGHTS = {
+    "eq": 1,
+    "in": 1,
+    "order": 1,
+    "gt": 2,
+    "lt": 2,
+    "gte": 2,
+    "lte": 2,
+    "matches": 20,
+    "contains": 50,
+    "icontains": 50,
+    "trigram": 50,
+    "fulltext": 50,
+    "array.contains": 50,
+    "array.containedBy": 50,
+    "array.overlap": 50,
+    "array.any": 50,
+    "inet.within": 50,
+    "inet.withinOrEqual": 50,
+    "inet.containsOrEqual": 50,
+    "inet.overlap": 50,
+}
+PATTERN_OPERATORS = ("matches", "contains", "icontains", "trigram")
+EQUALITY_OPERATORS = ("eq", "in")
+ARRAY_OPERATORS = ("array.contains", "array.containedBy", "array.overlap", "array.any")
+INET_OPERATORS = (
+    "inet.within",
+    "inet.withinOrEqual",
+    "inet.containsOrEqual",
+    "inet.overlap",
+)
+
+# the lookups of the custom fields are recorded with the kind of the field,
+# ex. array.contains, the same names are pattern lookups on text columns
+FIELD_OPERATORS = {
+    ArrayIntField: ("array", ("contains", "containedBy", "overlap", "any")),
+    InetField: ("inet", ("within", "withinOrEqual", "containsOrEqual", "overlap")),
+}
+
+EXISTING_INDEXES_QUERY = """
+    SELECT tablename, indexdef FROM pg_indexes WHERE schemaname = $1
+"""
+INDEX_DEF_PATTERN = re.compile(r"USING (\w+) \((.*)\)")
+
+
+def usage_operator(field: Any, operator: str) -> str:
+    for field_class, (kind, operators) in FIELD_OPERATORS.items():
+        if isinstance(field, field_class) and operator in operators:
+            return f"{kind}.{operator}"
+
+    return operator
+
+
+def usage_key(
+    model: str, table: str, column: str, operator: str, order_by: str = None
+) -> str:
+    return KEY_SEPARATOR.join((model, table, column, operator, order_by or ""))
+
+
+class UsageRecorder:
+    """Counts the columns, operators and sort keys the ModelResolver queries use
+
+    - opt in with setup(), recording is a counter increment per key
+    - the counts are added to a redis hash every flush interval,
+    so the usage of every process and service ends up in one place
+    - the index advisor report turns the counts into index proposals
+    """
+
+    _enabled: bool = False
+    _key: str = USAGE_KEY
+    _counts: Counter = Counter()
+    _flush_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def setup(cls, enabled: bool = True, key: str = USAGE_KEY):
+        cls._enabled = enabled
+        cls._key = key
+        cls._counts = Counter()
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls._enabled
+
+    @classmethod
+    def record(cls, keys: Iterable[str]) -> None:
+        if cls._enabled:
+            cls._counts.update(keys)
+
+    @classmethod
+    def counts(cls) -> Dict[str, int]:
+        return dict(cls._counts)
+
+    @classmethod
+    async def flush(cls) -> None:
+        counts, cls._counts = cls._counts, Counter()
+
+        for key in list(counts):
+            try:
+                await redis_hincrby(cls._key, key, counts[key])
+            except Exception as e:
+                logging.warning(f"Index usage flush failed: {e}")
+                # keep what wasn't flushed for the next try
+                cls._counts.update(counts)
+                return
+
+            del counts[key]
+
+    @classmethod
+    def start_flushing(cls, interval: float = 60.0) -> asyncio.Task:
+        async def run():
+            while True:
+                await asyncio.sleep(interval)
+                await cls.flush()
+
+        cls._flush_task = asyncio.ensure_future(run())
+
+        return cls._flush_task
+
+    @classmethod
+    async def shutdown(cls):
+        if cls._flush_task:
+            cls._flush_task.cancel()
+            cls._flush_task = None
+
+        await cls.flush()
+
+
+class IndexProposal:
+    """Index that would serve the recorded usage, benefit is the
+    weighted number of queries that would use it
+    """
+
+    def __init__(self, table: str, method: str, columns: Tuple[str, ...]) -> None:
+        self.table = table
+        self.method = method
+        self.columns = columns
+        self.benefit = 0
+        self.models: Set[str] = set()
+
+    @property
+    def name(self) -> str:
+        suffix = {
+            "trigram": "trgm_idx",
+            "fulltext": "search_vector_idx",
+            "gin": "gin_idx",
+            "gist": "gist_idx",
+        }
+        return f"{self.table}_{'_'.join(self.columns)}_{suffix.get(self.method, 'idx')}"
+
+    @property
+    def sql(self) -> str:
+        table = quote_identifier(self.table)
+        columns = ", ".join(quote_identifier(c) for c in self.columns)
+
+        if self.method == "fulltext":
+            models = ", ".join(sorted(self.models))
+            return f"-- full_text_index_sql({models}), searches {columns}"
+
+        if self.method == "trigram":
+            return (
+                f"CREATE INDEX IF NOT EXISTS {quote_identifier(self.name)} "
+                f"ON {table} USING GIN ({columns} gin_trgm_ops)"
+            )
+
+        if self.method == "gin":
+            return (
+                f"CREATE INDEX IF NOT EXISTS {quote_identifier(self.name)} "
+                f"ON {table} USING GIN ({columns})"
+            )
+
+        if self.method == "gist":
+            return (
+                f"CREATE INDEX IF NOT EXISTS {quote_identifier(self.name)} "
+                f"ON {table} USING GIST ({columns} inet_ops)"
+            )
+
+        return (
+            f"CREATE INDEX IF NOT EXISTS {quote_identifier(self.name)} "
+            f"ON {table} ({columns})"
+        )
+
+    def is_covered_by(self, method: str, definition: str) -> bool:
+        if self.method == "fulltext":
+            return method == "gin" and "to_tsvector" in definition
+
+        if self.method == "trigram":
+            return (
+                method == "gin"
+                and "gin_trgm_ops" in definition
+                and self.columns[0] in get_index_columns(definition)
+            )
+
+        columns = get_index_columns(definition)
+
+        if self.method == "gin":
+            return (
+                method == "gin"
+                and "gin_trgm_ops" not in definition
+                and columns[0] == self.columns[0]
+            )
+
+        if self.method == "gist":
+            return (
+                method == "gist"
+                and "inet_ops" in definition
+                and columns[0] == self.columns[0]
+            )
+
+        return method == "btree" and columns[: len(self.columns)] == self.columns
+
+
+def get_index_columns(definition: str) -> Tuple[str, ...]:
+    return tuple(
+        part.strip().split(" ")[0].strip('"') for part in definition.split(",")
+    )
+
+
+def parse_usage(raw: Dict) -> List[Tuple[str, str, str, str, Optional[str], int]]:
+    """The (model, table, column, operator, order_by, count) of the redis hash"""
+    usage = []
+
+    for key, count in raw.items():
+        key = key.decode() if isinstance(key, bytes) else key
+        model, table, column, operator, order_by = key.split(KEY_SEPARATOR)
+        usage.append((model, table, column, operator, order_by or None, int(count)))
+
+    return usage
+
+
+def propose_indexes(
+    usage: List[Tuple[str, str, str, str, Optional[str], int]]
+) -> List[IndexProposal]:
+    """
+    - pattern lookups and trigram search get a trigram GIN index
+    - full text search gets the GIN index of its tsvector
+    - array lookups get a GIN index on the column
+    - inet lookups get a GiST index with inet_ops on the column
+    - equality lookups get a composite index with the sort key,
+    range lookups and sorting an index on the column
+    - neq gets nothing, an index doesn't help it
+    """
+    proposals: Dict[tuple, IndexProposal] = {}
+
+    for model, table, column, operator, order_by, count in usage:
+        if operator in PATTERN_OPERATORS:
+            method, columns = "trigram", (column,)
+        elif operator == "fulltext":
+            method, columns = "fulltext", tuple(column.split(","))
+        elif operator in ARRAY_OPERATORS:
+            method, columns = "gin", (column,)
+        elif operator in INET_OPERATORS:
+            method, columns = "gist", (column,)
+        elif operator in EQUALITY_OPERATORS and order_by and order_by != column:
+            method, columns = "btree", (column, order_by)
+        elif operator in BENEFIT_WEIGHTS:
+            method, columns = "btree", (column,)
+        else:
+            continue
+
+        proposal = proposals.get((table, method, columns))
+
+        if proposal is None:
+            proposal = proposals[(table, method, columns)] = IndexProposal(
+                table, method, columns
+            )
+
+        proposal.benefit += count * BENEFIT_WEIGHTS[operator]
+        proposal.models.add(model)
+
+    return list(proposals.values())
+
+
+def advise(
+    usage: List[Tuple[str, str, str, str, Optional[str], int]],
+    existing: Dict[str, List[Tuple[str, str]]],
+) -> List[IndexProposal]:
+    """Proposals not covered by an existing (method, definition) index
+    of their table, the most beneficial first
+    """
+    proposals = [
+        proposal
+        for proposal in propose_indexes(usage)
+        if not any(
+            proposal.is_covered_by(method, definition)
+            for method, definition in existing.get(proposal.table, [])
+        )
+    ]
+
+    return sorted(proposals, key=lambda p: p.benefit, reverse=True)
+
+
+async def get_existing_indexes(
+    conn: asyncpg.Connection, schema: str = "public"
+) -> Dict[str, List[Tuple[str, str]]]:
+    existing: Dict[str, List[Tuple[str, str]]] = {}
+
+    for row in await conn.fetch(EXISTING_INDEXES_QUERY, schema):
+        match = INDEX_DEF_PATTERN.search(row["indexdef"])
+
+        if match:
+            existing.setdefault(row["tablename"], []).append(
+                (match.group(1), match.group(2))
+            )
+
+    return existing
+
+
+async def report(
+    redis_dsn: str, database_url: str, key: str = USAGE_KEY, schema: str = "public"
+) -> List[IndexProposal]:
+    redis = await aioredis.create_redis_pool(redis_dsn)
+
+    try:
+        usage = parse_usage(await redis.hgetall(key))
+    finally:
+        redis.close()
+        await redis.wait_closed()
+
+    conn = await asyncpg.connect(database_url)
+
+    try:
+        existing = await get_existing_indexes(conn, schema)
+    finally:
+        await conn.close()
+
+    return advise(usage, existing)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Proposes indexes from the recorded filter, search and sort usage"
+    )
+    parser.add_argument("--redis", required=True, help="redis dsn")
+    parser.add_argument("--database-url", default=get_settings().database_url)
+    parser.add_argument("--key", default=USAGE_KEY)
+    parser.add_argument("--schema", default="public")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    proposals = asyncio.get_event_loop().run_until_complete(
+        report(args.redis, args.database_url, args.key, args.schema)
+    )
+
+    for proposal in proposals[: args.limit]:
+        models = ", ".join(sorted(proposal.models))
+        print(f"{proposal.benefit:>10}  {models:<24} {proposal.sql}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import base64
 from datetime import datetime
-from typing import Callable, Any, Union
+from typing import Callable, Any, Tuple, Union
 
+from tortoise import Tortoise
+from tortoise.query_utils import Q
 from tortoise.queryset import QuerySet
 from tortoise.fields import Field, DatetimeField, DateField
 
@@ -10,7 +12,11 @@ from aj_micro_utils.cache import (
     run_query_with_pagination_and_cache,
     orm_query_and_cache,
 )
+from aj_micro_utils.datetimes import format_datetime, parse_datetime
 from aj_micro_utils.fields import CustomDatetimeField
+from aj_micro_utils.query_cost import check_first
+from aj_micro_utils.query_monitor import QueryMonitor, time_queryset
+from aj_micro_utils.routing import DBRouter
 
 PAGINATOR_MAPPING = {
     "id": """
@@ -40,6 +46,12 @@ class RelayPaginator:
     - can paginate on id (int) or created (datetime)
     - typename is being used for graphql to distinguish between
     the types if union is being used
+    - without a connection the reads are routed through the DBRouter,
+    sticky_key is passed on to it for read your writes
+    - with a rank_field the ORM results are ordered by that annotation
+    and the primary key, the cursor holds both (ranked search results)
+    - first above max_first (query_max_first setting by default)
+    is rejected with a QueryCostError
     """
 
     def __init__(
@@ -52,8 +64,13 @@ class RelayPaginator:
         can_cache: bool = False,
         cache_time: int = 3600,
         cursor_name: str = None,
-        connection: str = "default",
+        connection: str = None,
+        sticky_key: str = None,
+        rank_field: str = None,
+        max_first: int = None,
     ) -> None:
+        check_first(first, max_first)
+
         if not first:
             self.first = 10
         else:
@@ -62,16 +79,24 @@ class RelayPaginator:
         self.after = after
         self.typename = typename
         self.connection = connection
+        self.sticky_key = sticky_key
+        self.rank_field = rank_field
         self.cursor_name = cursor_name
         self.use_paginate_mapping = use_paginate_mapping
         self.can_cache = can_cache
         self.cache_time = cache_time
 
     def get_relay_node_cursor(self, obj: Any, paginate_on: str) -> str:
-        try:
-            data = getattr(obj, paginate_on)
-        except AttributeError:
-            data = obj[paginate_on]
+        if paginate_on == self.rank_field:
+            data = f"{getattr(obj, paginate_on)}|{obj.pk}"
+        else:
+            try:
+                data = getattr(obj, paginate_on)
+            except AttributeError:
+                data = obj[paginate_on]
+
+            if isinstance(data, datetime):
+                data = format_datetime(data)
 
         return base64.b64encode(f"{self.cursor_name}:{data}".encode("utf-8")).decode(
             "utf-8"
@@ -81,30 +106,28 @@ class RelayPaginator:
         """Takes the id or created out of the encoded string"""
         decoded_string = base64.b64decode(cursor).decode("utf-8")
         if self.paginate_on == "created":
-            return datetime.strptime(
-                decoded_string.split(":", 1)[1], "%Y-%m-%d %H:%M:%S.%f"
-            )
+            return parse_datetime(decoded_string.split(":", 1)[1], tz=None)
         return int(decoded_string.split(":")[1])
 
     def get_orm_cursor_value(self, cursor: str, t: Field) -> Any:
         """Takes the id or created out of the encoded string"""
         decoded_string = base64.b64decode(cursor).decode("utf-8")
 
-        if isinstance(t, CustomDatetimeField):
-            return datetime.strptime(
-                decoded_string.split(":", 1)[1], "%Y-%m-%d %H:%M:%S.%f%z"
-            )
-
-        if isinstance(t, DatetimeField):
-            return datetime.strptime(
-                decoded_string.split(":", 1)[1], "%Y-%m-%d %H:%M:%S.%f%z"
-            )
+        if isinstance(t, (CustomDatetimeField, DatetimeField)):
+            return parse_datetime(decoded_string.split(":", 1)[1])
 
         if isinstance(t, DateField):
             return datetime.strptime(decoded_string.split(":", 1)[1], "%Y-%m-%d")
 
         return decoded_string.split(":")[1]
 
+    def get_rank_cursor_value(self, cursor: str) -> Tuple[float, str]:
+        """Takes the rank and the primary key out of the encoded string"""
+        decoded_string = base64.b64decode(cursor).decode("utf-8")
+        rank, pk = decoded_string.split(":", 1)[1].split("|", 1)
+
+        return float(rank), pk
+
     def has_next_page(self, data_length: int) -> bool:
         """Querying first + 1 rows, so if the data returned
         for ex. if 11 rows and limit is 10 then 11 > 10, so we have next page
@@ -120,34 +143,102 @@ class RelayPaginator:
 
         return query + PAGINATOR_MAPPING[self.paginate_on]
 
-    async def orm_query(self, queryset: QuerySet):
+    def read_connection(self) -> str:
+        return self.connection or DBRouter.read_connection(self.sticky_key)
+
+    def route_queryset(self, queryset: QuerySet) -> QuerySet:
+        """Runs the queryset on a replica when one is available, an explicit
+        connection, a model on another database than the primary or
+        no replica keeps the model's own connection
+        """
+        if self.connection:
+            return queryset
+
+        if queryset.model._meta.default_connection != DBRouter.primary():
+            return queryset
+
+        replica = DBRouter.get_replica(self.sticky_key)
+
+        if replica is None:
+            return queryset
+
+        return queryset.using_db(Tortoise.get_connection(replica))
+
+    def rank_after(self, queryset: QuerySet) -> QuerySet:
+        """The rows after the (rank, pk) of the after cursor"""
+        pk = queryset.model._meta.pk_attr
+        rank, pk_value = self.get_rank_cursor_value(self.after)
+
+        return queryset.filter(
+            Q(**{f"{self.rank_field}__lt": rank})
+            | Q(**{self.rank_field: rank, f"{pk}__lt": pk_value})
+        )
+
+    def rank_query(self, queryset: QuerySet) -> QuerySet:
+        pk = queryset.model._meta.pk_attr
+
         if self.after:
-            paginate_on_field_type = queryset.model._meta.fields_map[
-                queryset.model.Meta.paginate_on
-            ]
-            after_cursor = self.get_orm_cursor_value(self.after, paginate_on_field_type)
-        else:
-            after_cursor = None
+            queryset = self.rank_after(queryset)
+
+        return queryset.order_by(f"-{self.rank_field}", f"-{pk}").limit(self.first + 1)
+
+    def get_after_cursor(self, queryset: QuerySet) -> Any:
+        paginate_on_field_type = queryset.model._meta.fields_map[
+            queryset.model.Meta.paginate_on
+        ]
+        return self.get_orm_cursor_value(self.after, paginate_on_field_type)
+
+    def page_queryset(self, queryset: QuerySet) -> QuerySet:
+        """The queryset of the page exactly as orm_query runs it, routed,
+        ordered, after the cursor and limited to first + 1 rows
+        """
+        queryset = self.route_queryset(queryset)
+
+        if self.rank_field:
+            return self.rank_query(queryset)
+
+        paginate_on = queryset.model.Meta.paginate_on
+
+        if self.after:
+            queryset = queryset.filter(
+                **{f"{paginate_on}__lt": self.get_after_cursor(queryset)}
+            )
+
+        return queryset.order_by(f"-{paginate_on}").limit(self.first + 1)
+
+    async def orm_query(self, queryset: QuerySet):
+        if self.can_cache and not self.rank_field:
+            queryset = self.route_queryset(queryset)
+            after_cursor = self.get_after_cursor(queryset) if self.after else None
 
-        if self.can_cache:
             return await orm_query_and_cache(
                 queryset, self.after, after_cursor, (self.first + 1), self.cache_time
             )
 
-        if self.after:
-            return (
-                await queryset.filter(
-                    **{f"{queryset.model.Meta.paginate_on}__lt": after_cursor}
-                )
-                .all()
-                .order_by(f"-{queryset.model.Meta.paginate_on}")
-                .limit(self.first + 1)
+        return await time_queryset(self.page_queryset(queryset))
+
+    async def raw_query(self, data_query: str, **kwargs) -> list:
+        if self.can_cache:
+            return await run_query_with_pagination_and_cache(
+                self.map(query=data_query),
+                self.cursor_name,
+                self.cache_time,
+                connection=self.read_connection(),
+                limit=self.first + 1,  # fetching plus one row to check if next page
+                after=self.get_cursor_value(self.after)
+                if self.after
+                else None,  # after id or created
+                **kwargs,
             )
 
-        return (
-            await queryset.all()
-            .order_by(f"-{queryset.model.Meta.paginate_on}")
-            .limit(self.first + 1)
+        return await db.run_query_with_pagination(
+            self.map(query=data_query),
+            self.read_connection(),
+            limit=self.first + 1,  # fetching plus one row to check if next page
+            after=self.get_cursor_value(self.after)
+            if self.after
+            else None,  # after id or created
+            **kwargs,
         )
 
     async def paginate(
@@ -162,34 +253,25 @@ class RelayPaginator:
         is_str = isinstance(data_query, str)
 
         if is_str:
-            if self.can_cache:
-                full_results = await run_query_with_pagination_and_cache(
-                    self.map(query=data_query),
-                    self.cursor_name,
-                    self.cache_time,
-                    connection=self.connection,
-                    limit=self.first + 1,  # fetching plus one row to check if next page
-                    after=self.get_cursor_value(self.after)
-                    if self.after
-                    else None,  # after id or created
-                    **kwargs,
-                )
-            else:
-                full_results = await db.run_query_with_pagination(
-                    self.map(query=data_query),
-                    self.connection,
-                    limit=self.first + 1,  # fetching plus one row to check if next page
-                    after=self.get_cursor_value(self.after)
-                    if self.after
-                    else None,  # after id or created
-                    **kwargs,
-                )
+            with QueryMonitor.tags(
+                cursor_name=self.cursor_name, typename=self.typename
+            ):
+                full_results = await self.raw_query(data_query, **kwargs)
             paginate_on = self.paginate_on
         else:
-            full_results = await self.orm_query(data_query)
-            paginate_on = data_query.model.Meta.paginate_on
+            with QueryMonitor.tags(
+                model=data_query.model.__name__, typename=self.typename
+            ):
+                full_results = await self.orm_query(data_query)
+            paginate_on = self.rank_field or data_query.model.Meta.paginate_on
             self.cursor_name = data_query.model.__name__
 
+        return self.to_connection(full_results, paginate_on, formatter)
+
+    def to_connection(
+        self, full_results: list, paginate_on: str, formatter: Callable
+    ) -> dict:
+        """Relay connection of the first + 1 rows fetched for the page"""
         final_results = []
         start_cursor = None
         end_cursor = None
@@ -0,0 +1,66 @@
+import json
+import logging
+from typing import Any, Optional
+
+from graphql import GraphQLError
+
+from aj_micro_utils.config import get_settings
+
+EXPLAIN_COST_PREFIX = "EXPLAIN (FORMAT JSON) "
+
+
+class QueryCostError(GraphQLError):
+    """Raised from a resolver when the query goes over the budget,
+    the client gets the message with the QUERY_TOO_EXPENSIVE code
+    """
+
+    def __init__(self, message: str, cost: float = None, limit: float = None) -> None:
+        extensions = {"code": "QUERY_TOO_EXPENSIVE"}
+
+        if cost is not None:
+            extensions["cost"] = cost
+        if limit is not None:
+            extensions["limit"] = limit
+
+        super().__init__(message, extensions=extensions)
+
+
+def check_first(first: Any, max_first: int = None) -> None:
+    """Rejects page sizes above max_first, defaults to the query_max_first setting"""
+    if max_first is None:
+        max_first = get_settings().query_max_first
+
+    if first is None:
+        return
+
+    if first < 0:
+        raise QueryCostError("first can't be negative")
+
+    if first > max_first:
+        raise QueryCostError(
+            f"first can't be more than {max_first}, got {first}",
+            cost=first,
+            limit=max_first,
+        )
+
+
+def get_plan_cost(result: list) -> float:
+    """Total Cost of the top node of an EXPLAIN (FORMAT JSON) result"""
+    plan = list(result[0].values())[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return float(plan[0]["Plan"]["Total Cost"])
+
+
+async def explain_cost(client: Any, sql: str, params: list = None) -> Optional[float]:
+    """Planner estimate of the query, the query itself is not run,
+    None when the database can't explain it
+    """
+    try:
+        result = await client.execute_query_dict(EXPLAIN_COST_PREFIX + sql, params)
+        return get_plan_cost(result)
+    except Exception as e:
+        logging.warning(f"Explain cost check failed: {e}")
+        return None
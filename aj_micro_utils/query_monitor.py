@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import logging
+import random
+import re
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from aj_micro_utils.config import get_settings
+from aj_micro_utils.tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency buckets in milliseconds, the last bucket is +Inf
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+HISTOGRAM_LIMIT = 1000
+EXPLAIN_PREFIX = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+# the ORM renders the values into the sql, they are replaced by ? and
+# the value lists of IN (...) collapse into a single ?
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+VALUE_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+
+_query_tags: ContextVar[dict] = ContextVar("query_tags", default={})
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql: str) -> str:
+    """Short stable id of the query text, whitespace and literal values are ignored"""
+    sql = VALUE_LIST_RE.sub("?", LITERAL_RE.sub("?", " ".join(sql.split())))
+    return hashlib.md5(sql.encode("utf-8")).hexdigest()[:12]
+
+
+def get_q_shape(q: Any) -> tuple:
+    """The lookups of a Q object without their values"""
+    return (
+        q.join_type,
+        q._is_negated,
+        tuple(sorted(q.filters)),
+        tuple(get_q_shape(child) for child in q.children),
+    )
+
+
+@lru_cache(maxsize=1024)
+def get_structure_shape(model: str, structure: Tuple) -> str:
+    digest = hashlib.md5(repr(structure).encode("utf-8")).hexdigest()[:12]
+    return f"orm:{model}:{digest}"
+
+
+def get_queryset_shape(queryset: Any) -> str:
+    """
+    orm:<Model>:<id> of the lookups, ordering, annotations, selected fields
+    and limit of the queryset, without the values and without rendering its sql
+    """
+    structure = (
+        tuple(get_q_shape(q) for q in queryset._q_objects),
+        tuple(queryset._orderings),
+        tuple(queryset._annotations),
+        tuple(queryset._fields_for_select),
+        queryset._distinct,
+        queryset._limit is not None,
+        queryset._offset is not None,
+    )
+
+    return get_structure_shape(queryset.model.__name__, structure)
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, duration_ms: float) -> None:
+        self.buckets[bisect_left(HISTOGRAM_BUCKETS, duration_ms)] += 1
+        self.count += 1
+        self.total += duration_ms
+
+        if duration_ms > self.max:
+            self.max = duration_ms
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": self.total,
+            "max_ms": self.max,
+            "buckets": dict(zip([*map(str, HISTOGRAM_BUCKETS), "+Inf"], self.buckets)),
+        }
+
+
+class QueryMonitor:
+    """Times the queries ran by the db helpers and the paginator
+
+    - every query is observed in a latency histogram per query shape,
+    the sql fingerprint or for the ORM orm:<Model> and the id of the
+    queryset's lookups, ordering and limit
+    - queries slower than slow_ms are logged with their tags and sql
+    - explain_sample_rate of the slow selects are re-run in the background
+    with EXPLAIN (ANALYZE, BUFFERS) and the plan is logged
+    - hooks are called with every query record, to feed metrics sinks
+    """
+
+    _enabled: bool = True
+    _slow_ms: float = get_settings().slow_query_ms
+    _explain_sample_rate: float = get_settings().explain_sample_rate
+    _histograms: Dict[str, LatencyHistogram] = {}
+    _hooks: List[Callable[[dict], Any]] = []
+    # the running explains, the event loop only keeps weak references to tasks
+    _explain_tasks: Set[asyncio.Future] = set()
+
+    @classmethod
+    def setup(
+        cls,
+        slow_ms: float = None,
+        explain_sample_rate: float = None,
+        enabled: bool = True,
+    ):
+        if slow_ms is not None:
+            cls._slow_ms = slow_ms
+        if explain_sample_rate is not None:
+            cls._explain_sample_rate = explain_sample_rate
+        cls._enabled = enabled
+
+    @classmethod
+    def add_hook(cls, hook: Callable[[dict], Any]) -> None:
+        cls._hooks.append(hook)
+
+    @classmethod
+    @contextmanager
+    def tags(cls, **tags):
+        """Tags the queries ran inside the block, for ex. cursor_name, model, typename"""
+        token = _query_tags.set({**_query_tags.get(), **tags})
+        try:
+            yield
+        finally:
+            _query_tags.reset(token)
+
+    @classmethod
+    def histograms(cls) -> Dict[str, dict]:
+        return {shape: h.as_dict() for shape, h in cls._histograms.items()}
+
+    @classmethod
+    def reset(cls) -> None:
+        cls._histograms = {}
+
+    @classmethod
+    def observe(cls, shape: str, duration_ms: float) -> None:
+        histogram = cls._histograms.get(shape)
+
+        if histogram is None:
+            if len(cls._histograms) >= HISTOGRAM_LIMIT:
+                return
+            histogram = cls._histograms[shape] = LatencyHistogram()
+
+        histogram.observe(duration_ms)
+
+    @classmethod
+    async def timed(
+        cls,
+        awaitable: Awaitable,
+        sql: Union[str, Callable[[], str]],
+        params: Optional[list] = None,
+        client: Any = None,
+        shape: str = None,
+    ) -> Any:
+        """Awaits the query and records how long it took,
+        sql can be a callable so the ORM only renders it for slow queries
+        """
+        if not cls._enabled:
+            return await awaitable
+
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            cls.record(duration_ms, sql, params, client, shape)
+
+    @classmethod
+    def record(
+        cls,
+        duration_ms: float,
+        sql: Union[str, Callable[[], str]],
+        params: Optional[list] = None,
+        client: Any = None,
+        shape: str = None,
+    ) -> None:
+        tags = _query_tags.get()
+
+        if shape is None:
+            shape = fingerprint(sql) if isinstance(sql, str) else "unknown"
+
+        cls.observe(shape, duration_ms)
+        record_span("db", shape, duration_ms)
+
+        slow = duration_ms >= cls._slow_ms
+
+        if not slow and not cls._hooks:
+            return
+
+        if callable(sql):
+            sql = sql()
+
+        record = {
+            "shape": shape,
+            "fingerprint": fingerprint(sql),
+            "duration_ms": round(duration_ms, 3),
+            "slow": slow,
+            "sql": sql,
+            "tags": tags,
+        }
+
+        for hook in cls._hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                logger.error(e)
+
+        if not slow:
+            return
+
+        logger.warning(
+            "Slow query %.1fms %s %s", duration_ms, shape, tags, extra={"query": record}
+        )
+
+        if (
+            client is not None
+            and cls._explain_sample_rate
+            and sql.lstrip()[:6].upper() == "SELECT"
+            and random.random() < cls._explain_sample_rate
+        ):
+            task = asyncio.ensure_future(cls.explain(client, sql, params, record))
+            cls._explain_tasks.add(task)
+            task.add_done_callback(cls._explain_tasks.discard)
+
+    @classmethod
+    async def explain(
+        cls, client: Any, sql: str, params: Optional[list], record: dict
+    ) -> None:
+        try:
+            result = await client.execute_query_dict(EXPLAIN_PREFIX + sql, params)
+        except Exception as e:
+            logger.error(f"Explain failed for {record['fingerprint']}: {e}")
+            return
+
+        plan = list(result[0].values())[0] if result else None
+
+        logger.warning(
+            "Slow query plan %s",
+            record["fingerprint"],
+            extra={"query": {**record, "plan": plan}},
+        )
+
+
+async def time_queryset(queryset: Any) -> Any:
+    """Awaits the ORM queryset through the QueryMonitor, each query shape
+    of the model has its own histogram, the sql is only rendered
+    when the query is slow or hooks are set
+    """
+    return await QueryMonitor.timed(
+        queryset,
+        lambda: queryset.query.get_sql(),
+        client=queryset._db or queryset.model._meta.db,
+        shape=get_queryset_shape(queryset),
+    )
@@ -1,27 +1,267 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
 import aioredis
+from aioredis.abc import AbcPool
+from aioredis.pool import _AsyncConnectionContextManager, _ConnectionContextManager
 from aioredis.sentinel import SentinelPool
 from aioredis.sentinel.pool import ManagedPool
+from aioredis.util import _NOTSET
+
+SENTINEL_MASTER = "mymaster"
+
+# arq reads its job ids as str, its own pools decode the replies as utf8
+PURPOSE_ENCODINGS = {"arq": "utf8"}
+
+
+class PurposePool:
+    """
+    View of the shared pool for one purpose (cache, arq...), at most limit
+    of its commands and acquired connections are in flight at once, the
+    others wait, so a burst of one purpose can't take every connection,
+    with an encoding its replies are decoded with it unless a command
+    sets its own, the acquired connections use it until they are released
+    """
+
+    def __init__(
+        self, pool: AbcPool, purpose: str, limit: int = None, encoding: str = None
+    ) -> None:
+        self._pool = pool
+        self.purpose = purpose
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters = 0
+        self._semaphore = asyncio.Semaphore(limit) if limit else None
+        self._encoding = encoding
+        self._encodings: Dict[int, Optional[str]] = {}
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def __repr__(self) -> str:
+        return f"<PurposePool {self.purpose} limit={self.limit} {self._pool!r}>"
+
+    @property
+    def encoding(self) -> Optional[str]:
+        return self._encoding or self._pool.encoding
+
+    async def _enter(self) -> None:
+        if self._semaphore is not None:
+            self.waiters += 1
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self.waiters -= 1
+
+        self.in_flight += 1
+
+    def _exit(self) -> None:
+        self.in_flight -= 1
+
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def execute(self, command, *args, **kwargs):
+        if self._encoding and kwargs.get("encoding", _NOTSET) is _NOTSET:
+            kwargs["encoding"] = self._encoding
+
+        if self._semaphore is None:
+            return self._pool.execute(command, *args, **kwargs)
+
+        return self._execute(command, args, kwargs)
+
+    async def _execute(self, command, args, kwargs):
+        await self._enter()
+        try:
+            return await self._pool.execute(command, *args, **kwargs)
+        finally:
+            self._exit()
+
+    async def acquire(self, command=None, args=()):
+        await self._enter()
+        try:
+            conn = await self._pool.acquire(command, args)
+        except BaseException:
+            self._exit()
+            raise
+
+        if self._encoding:
+            self._encodings[id(conn)] = conn._encoding
+            conn._encoding = self._encoding
+
+        return conn
+
+    def release(self, conn) -> None:
+        if id(conn) in self._encodings:
+            conn._encoding = self._encodings.pop(id(conn))
+
+        try:
+            self._pool.release(conn)
+        finally:
+            self._exit()
+
+    def get(self) -> _AsyncConnectionContextManager:
+        return _AsyncConnectionContextManager(self)
+
+    def __await__(self):
+        conn = yield from self.acquire().__await__()
+        return _ConnectionContextManager(self, conn)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiters": self.waiters,
+            "limit": self.limit,
+        }
+
+
+AbcPool.register(PurposePool)
+
+
+def get_pool_stats(pool: AbcPool) -> dict:
+    condition = getattr(pool, "_cond", None)
+
+    return {
+        "size": pool.size,
+        "in_use": pool.size - pool.freesize,
+        "idle": pool.freesize,
+        "maxsize": pool.maxsize,
+        "waiters": len(getattr(condition, "_waiters", None) or ()),
+    }
+
+
+class RedisConnections:
+    """
+    One redis pool shared by Redis, RedisSentinel and Arq
+
+    - with sentinels the master and replica pools of the sentinel pool
+    are shared, the replica is used for the reads of RedisSentinel
+    - limits caps the commands and connections in flight per purpose,
+    ex. {"arq": 4} so arq bursts keep connections free for the cache
+    - stats returns the size, in use, idle connections and waiters of the
+    pools and the in flight commands and waiters of the purposes
+    """
+
+    _pool: Optional[AbcPool] = None
+    _sentinel_pool: Optional[SentinelPool] = None
+    _limits: Dict[str, int] = {}
+    _purposes: Dict[Tuple[str, bool], PurposePool] = {}
+
+    @classmethod
+    async def setup(
+        cls,
+        dsn: str = None,
+        sentinels: List[Tuple[str, int]] = None,
+        minsize: int = 1,
+        maxsize: int = 10,
+        limits: Dict[str, int] = None,
+    ) -> None:
+        if sentinels:
+            cls._sentinel_pool = await aioredis.sentinel.create_sentinel_pool(
+                sentinels, minsize=minsize, maxsize=maxsize
+            )
+        else:
+            cls._pool = await aioredis.create_pool(
+                dsn, minsize=minsize, maxsize=maxsize
+            )
+
+        cls._limits = limits or {}
+        cls._purposes = {}
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls._pool is not None or cls._sentinel_pool is not None
+
+    @classmethod
+    def base_pool(cls, replica: bool = False) -> AbcPool:
+        if cls._sentinel_pool is None:
+            return cls._pool
+
+        if replica:
+            return cls._sentinel_pool.slave_for(SENTINEL_MASTER)
+
+        return cls._sentinel_pool.master_for(SENTINEL_MASTER)
+
+    @classmethod
+    def pool(cls, purpose: str, replica: bool = False) -> PurposePool:
+        key = (purpose, replica and cls._sentinel_pool is not None)
+        pool = cls._purposes.get(key)
+
+        if pool is None:
+            pool = cls._purposes[key] = PurposePool(
+                cls.base_pool(key[1]),
+                purpose,
+                cls._limits.get(purpose),
+                PURPOSE_ENCODINGS.get(purpose),
+            )
+
+        return pool
+
+    @classmethod
+    def client(cls, purpose: str, replica: bool = False) -> aioredis.Redis:
+        return aioredis.Redis(cls.pool(purpose, replica))
+
+    @classmethod
+    def stats(cls) -> dict:
+        pools = {}
+
+        if cls._sentinel_pool is not None:
+            pools["master"] = get_pool_stats(cls.base_pool())
+            pools["replica"] = get_pool_stats(cls.base_pool(replica=True))
+        elif cls._pool is not None:
+            pools["default"] = get_pool_stats(cls._pool)
+
+        purposes = {}
+
+        for (purpose, replica), pool in cls._purposes.items():
+            purposes[f"{purpose}:replica" if replica else purpose] = pool.stats()
+
+        return {"pools": pools, "purposes": purposes}
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        pool = cls._sentinel_pool or cls._pool
+        cls._pool = cls._sentinel_pool = None
+        cls._purposes = {}
+
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
 
 
 class RedisSentinel:
     _sentinel_pool: SentinelPool = None
+    _shared: bool = False
 
     @classmethod
-    async def setup(cls, sentinals):
-        cls._sentinel_pool = await aioredis.sentinel.create_sentinel_pool(sentinals)
+    async def setup(cls, sentinals=None):
+        """Without sentinals the pools of RedisConnections are used"""
+        cls._shared = sentinals is None
+
+        if not cls._shared:
+            cls._sentinel_pool = await aioredis.sentinel.create_sentinel_pool(sentinals)
 
     @classmethod
     async def shutdown(cls):
+        if cls._shared:
+            return
+
         cls._sentinel_pool.close()
         await cls._sentinel_pool.wait_closed()
 
     @classmethod
     async def _master(cls) -> ManagedPool:
-        return cls._sentinel_pool.master_for("mymaster")
+        if cls._shared:
+            return RedisConnections.pool("cache")
+
+        return cls._sentinel_pool.master_for(SENTINEL_MASTER)
 
     @classmethod
     async def _slave(cls) -> ManagedPool:
-        return cls._sentinel_pool.slave_for("mymaster")
+        if cls._shared:
+            return RedisConnections.pool("cache", replica=True)
+
+        return cls._sentinel_pool.slave_for(SENTINEL_MASTER)
 
     @classmethod
     async def get(cls, key) -> object:
@@ -56,13 +296,36 @@ class RedisSentinel:
 
             return False
 
+    @classmethod
+    async def hincrby(cls, key, field, increment: int = 1):
+        pool: ManagedPool = await cls._master()
+
+        async with pool.get() as conn:
+            return await conn.execute("hincrby", key, field, increment)
+
+    @classmethod
+    async def hgetall(cls, key) -> dict:
+        pool: ManagedPool = await cls._slave()
+
+        async with pool.get() as conn:
+            values = await conn.execute("hgetall", key)
+
+        return dict(zip(values[::2], values[1::2]))
+
 
 class Redis:
     _pool: aioredis.Redis = None
+    _shared: bool = False
 
     @classmethod
-    async def setup(cls, dsn):
-        cls._pool = await aioredis.create_redis_pool(dsn)
+    async def setup(cls, dsn=None):
+        """Without dsn the pool of RedisConnections is used"""
+        cls._shared = dsn is None
+
+        if cls._shared:
+            cls._pool = RedisConnections.client("cache")
+        else:
+            cls._pool = await aioredis.create_redis_pool(dsn)
 
     @classmethod
     async def get(cls, key):
@@ -85,7 +348,18 @@ class Redis:
 
         return False
 
+    @classmethod
+    async def hincrby(cls, key, field, increment: int = 1):
+        return await cls._pool.hincrby(key, field, increment)
+
+    @classmethod
+    async def hgetall(cls, key) -> dict:
+        return await cls._pool.hgetall(key)
+
     @classmethod
     async def shutdown(cls):
+        if cls._shared:
+            return
+
         cls._pool.close()
         await cls._pool.wait_closed()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from itertools import cycle
+from typing import Dict, Iterator, List, Optional
+
+from tortoise import Tortoise
+
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END AS lag
+"""
+
+STICKY_KEYS_LIMIT = 10000
+
+_sticky_until: ContextVar[float] = ContextVar("db_sticky_until", default=0.0)
+
+
+class DBRouter:
+    """Routes read only queries to a pool of replica connections
+
+    - replicas are the tortoise connection names of the read replicas
+    - reads are spread round robin over the healthy replicas
+    - a replica is skipped when it failed its last check or lags
+    more than max_lag seconds behind the primary
+    - after record_write the reads go to the primary for sticky_seconds,
+    either for the current context or for the given key (user, account...)
+    """
+
+    _primary: str = "default"
+    _replicas: List[str] = []
+    _cycle: Optional[Iterator[str]] = None
+    _unhealthy: Dict[str, float] = {}
+    _lag: Dict[str, float] = {}
+    _sticky_keys: Dict[str, float] = {}
+    _max_lag: float = 5.0
+    _sticky_seconds: float = 2.0
+    _retry_after: float = 30.0
+    _health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def setup(
+        cls,
+        replicas: List[str],
+        primary: str = "default",
+        max_lag: float = 5.0,
+        sticky_seconds: float = 2.0,
+        retry_after: float = 30.0,
+    ):
+        cls._primary = primary
+        cls._replicas = list(replicas)
+        cls._cycle = cycle(cls._replicas) if cls._replicas else None
+        cls._unhealthy = {}
+        cls._lag = {}
+        cls._sticky_keys = {}
+        cls._max_lag = max_lag
+        cls._sticky_seconds = sticky_seconds
+        cls._retry_after = retry_after
+        _sticky_until.set(0.0)
+
+    @classmethod
+    async def shutdown(cls):
+        if cls._health_task:
+            cls._health_task.cancel()
+            cls._health_task = None
+
+    @classmethod
+    def primary(cls) -> str:
+        return cls._primary
+
+    @classmethod
+    def is_healthy(cls, name: str) -> bool:
+        if cls._lag.get(name, 0) > cls._max_lag:
+            return False
+
+        return cls._unhealthy.get(name, 0) <= time.monotonic()
+
+    @classmethod
+    def mark_unhealthy(cls, name: str) -> None:
+        """Skips the replica until retry_after seconds passed or the next health check"""
+        cls._unhealthy[name] = time.monotonic() + cls._retry_after
+
+    @classmethod
+    def record_write(cls, key: str = None) -> None:
+        """Sends the following reads to the primary for sticky_seconds"""
+        until = time.monotonic() + cls._sticky_seconds
+        _sticky_until.set(until)
+
+        if key is not None:
+            if len(cls._sticky_keys) >= STICKY_KEYS_LIMIT:
+                cls.prune_sticky_keys()
+
+            cls._sticky_keys[key] = until
+
+    @classmethod
+    def prune_sticky_keys(cls) -> None:
+        now = time.monotonic()
+        cls._sticky_keys = {k: v for k, v in cls._sticky_keys.items() if v > now}
+
+    @classmethod
+    def is_sticky(cls, key: str = None) -> bool:
+        now = time.monotonic()
+
+        if _sticky_until.get() > now:
+            return True
+
+        if key is None:
+            return False
+
+        until = cls._sticky_keys.get(key)
+
+        if until is None:
+            return False
+
+        if until <= now:
+            del cls._sticky_keys[key]
+            return False
+
+        return True
+
+    @classmethod
+    def get_replica(cls, key: str = None) -> Optional[str]:
+        """Returns the replica that should serve the read,
+        None means the read has to go to the primary
+        """
+        if cls._cycle is None or cls.is_sticky(key):
+            return None
+
+        for _ in range(len(cls._replicas)):
+            name = next(cls._cycle)
+
+            if cls.is_healthy(name):
+                return name
+
+        return None
+
+    @classmethod
+    def read_connection(cls, key: str = None) -> str:
+        return cls.get_replica(key) or cls._primary
+
+    @classmethod
+    async def check_replicas(cls) -> None:
+        for name in cls._replicas:
+            try:
+                client = Tortoise.get_connection(name)
+                result = await client.execute_query_dict(REPLICA_LAG_QUERY)
+            except Exception as e:
+                logging.warning(f"Replica {name} failed the health check: {e}")
+                cls.mark_unhealthy(name)
+                continue
+
+            cls._lag[name] = float(result[0]["lag"] or 0)
+            cls._unhealthy.pop(name, None)
+
+    @classmethod
+    def start_health_checks(cls, interval: float = 5.0) -> asyncio.Task:
+        async def run():
+            while True:
+                await cls.check_replicas()
+                await asyncio.sleep(interval)
+
+        cls._health_task = asyncio.ensure_future(run())
+
+        return cls._health_task
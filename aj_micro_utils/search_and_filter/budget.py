@@ -0,0 +1,230 @@
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Type
+
+from ariadne import convert_camel_case_to_snake
+from tortoise import models, queryset
+
+from aj_micro_utils.config import get_settings
+from aj_micro_utils.paginator import RelayPaginator
+from aj_micro_utils.query_cost import QueryCostError, explain_cost
+from aj_micro_utils.search_and_filter.queries import (
+    get_filter_shape,
+    get_schema_index,
+    get_search_types,
+)
+
+FILTER_COST_CACHE_SIZE = 512
+
+# rough cost of a lookup on an indexed field, the pattern
+# lookups scan every row the other lookups left over
+OPERATOR_COSTS = {
+    "eq": 1,
+    "in": 2,
+    "gt": 2,
+    "lt": 2,
+    "gte": 2,
+    "lte": 2,
+    "neq": 10,
+    "matches": 20,
+    "contains": 50,
+    "icontains": 50,
+}
+UNINDEXED_FACTOR = 10
+RELATION_COST = 5
+SEARCH_BACKEND_COST = 50
+
+REJECT = "reject"
+DOWNGRADE = "downgrade"
+
+
+def get_lookup_cost(model: Type[models.Model], name: str, operator: str) -> float:
+    cost = OPERATOR_COSTS.get(operator, 1)
+
+    if name not in get_schema_index(model).indexed:
+        cost *= UNINDEXED_FACTOR
+
+    return cost
+
+
+@lru_cache(maxsize=FILTER_COST_CACHE_SIZE)
+def estimate_filter_cost(
+    model: Type[models.Model], shape: tuple, max_lookup_cost: float
+) -> Tuple[float, Tuple[str, ...]]:
+    """
+    Cost of a filter shape and the lookups that cost more than max_lookup_cost,
+    named as the client sent them, ex. ("email.icontains",)
+    """
+    cost = 0
+    expensive: List[str] = []
+    schema_index = get_schema_index(model)
+
+    for key, sub_shape in shape:
+        name = convert_camel_case_to_snake(key)
+
+        if name in schema_index.relations:
+            if sub_shape is None:
+                continue
+
+            related_cost, related_expensive = estimate_filter_cost(
+                model._meta.fields_map[name].related_model, sub_shape, max_lookup_cost
+            )
+            cost += RELATION_COST + related_cost
+            expensive.extend(f"{key}.{lookup}" for lookup in related_expensive)
+            continue
+
+        operators = [op for op, _ in sub_shape] if sub_shape else ["eq"]
+
+        for operator in operators:
+            lookup_cost = get_lookup_cost(model, name, operator)
+            cost += lookup_cost
+
+            if lookup_cost > max_lookup_cost:
+                expensive.append(f"{key}.{operator}")
+
+    return cost, tuple(expensive)
+
+
+def estimate_search_cost(
+    model: Type[models.Model], search: str, backend: Any = None
+) -> float:
+    """
+    The default search ORs an equality lookup over every field that can hold
+    the search term, the search backends use their full text or trigram index
+    """
+    if backend is not None:
+        return SEARCH_BACKEND_COST
+
+    searchable = get_schema_index(model).searchable(get_search_types(search))
+
+    return sum(
+        get_lookup_cost(model, name, "eq")
+        for name, max_length in searchable
+        if not max_length or max_length >= len(search)
+    )
+
+
+class QueryBudget:
+    """
+    Guardrails for the queries a ModelResolver sends to the database
+
+    - first above max_first is rejected (query_max_first setting by default)
+    - lookups costing more than max_lookup_cost, like icontains on an unindexed
+    column, are rejected or with expensive_lookups="downgrade" limited
+    to pages of downgraded_first rows
+    - search terms shorter than min_search_length are rejected
+    - the estimated cost, page size plus the cost of the lookups,
+    can't go over max_cost (query_max_cost setting by default)
+    - with explain_max_cost the planner cost of the query is checked
+    with an EXPLAIN for clients the resolver wasn't told to trust
+    """
+
+    def __init__(
+        self,
+        max_first: int = None,
+        max_cost: float = None,
+        max_lookup_cost: float = 100,
+        expensive_lookups: str = REJECT,
+        downgraded_first: int = 10,
+        min_search_length: int = 3,
+        explain_max_cost: Optional[float] = None,
+    ) -> None:
+        assert expensive_lookups in (REJECT, DOWNGRADE)
+
+        self.max_first = max_first or get_settings().query_max_first
+        self.max_cost = max_cost or get_settings().query_max_cost
+        self.max_lookup_cost = max_lookup_cost
+        self.expensive_lookups = expensive_lookups
+        self.downgraded_first = downgraded_first
+        self.min_search_length = min_search_length
+        self.explain_max_cost = explain_max_cost
+
+    def estimate(
+        self,
+        model: Type[models.Model],
+        filter: dict = None,
+        search: str = None,
+        backend: Any = None,
+    ) -> Tuple[float, Tuple[str, ...]]:
+        """Cost of the lookups and the expensive ones, search wins over filter
+        the same way it does in the ModelResolver
+        """
+        if search:
+            if len(search) < self.min_search_length:
+                raise QueryCostError(
+                    f"search needs at least {self.min_search_length} characters"
+                )
+
+            return estimate_search_cost(model, search, backend), ()
+
+        if filter:
+            return estimate_filter_cost(
+                model, get_filter_shape(filter), self.max_lookup_cost
+            )
+
+        return 0, ()
+
+    def check(
+        self,
+        model: Type[models.Model],
+        first: int,
+        filter: dict = None,
+        search: str = None,
+        backend: Any = None,
+    ) -> int:
+        """Raises a QueryCostError when the query goes over the budget,
+        returns the page size the query may use
+        """
+        lookup_cost, expensive = self.estimate(model, filter, search, backend)
+
+        if expensive:
+            if self.expensive_lookups == REJECT:
+                raise QueryCostError(
+                    f"Filtering with {', '.join(expensive)} is too expensive, "
+                    "use a lookup on an indexed field"
+                )
+
+            first = min(first, self.downgraded_first)
+
+        cost = first + lookup_cost
+
+        if cost > self.max_cost:
+            raise QueryCostError(
+                f"Query cost {cost} is over the limit of {self.max_cost}",
+                cost=cost,
+                limit=self.max_cost,
+            )
+
+        return first
+
+    async def check_explain(self, qs: queryset.QuerySet) -> None:
+        """Asks the planner for the cost of the page queryset, with its ordering,
+        cursor and limit, on the connection it runs on, the query isn't run
+        """
+        client = qs._db or qs.model._meta.db
+
+        cost = await explain_cost(client, qs.sql())
+
+        if cost is not None and cost > self.explain_max_cost:
+            raise QueryCostError(
+                f"Query cost {cost} is over the limit of {self.explain_max_cost}",
+                cost=cost,
+                limit=self.explain_max_cost,
+            )
+
+    async def enforce(
+        self,
+        model: Type[models.Model],
+        qs: queryset.QuerySet,
+        paginator: RelayPaginator,
+        filter: dict = None,
+        search: str = None,
+        backend: Any = None,
+        trusted: bool = False,
+    ) -> int:
+        """Checks the query of the paginator's page, returns the page size it may use"""
+        paginator.first = self.check(model, paginator.first, filter, search, backend)
+
+        if self.explain_max_cost is not None and not trusted:
+            await self.check_explain(paginator.page_queryset(qs))
+
+        return paginator.first
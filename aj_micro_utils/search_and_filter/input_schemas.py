@@ -44,6 +44,26 @@ integer_filter_input = """
     }
 """
 
+array_int_filter_input = """
+    input ArrayIntFilterInput {
+    contains: [Int!]
+    containedBy: [Int!]
+    overlap: [Int!]
+    any: Int
+    }
+"""
+
+cidr_filter_input = """
+    input CidrFilterInput {
+    eq: String
+    neq: String
+    within: String
+    withinOrEqual: String
+    containsOrEqual: String
+    overlap: String
+    }
+"""
+
 page_info = """
     type PageInfo {
         hasNextPage: Boolean!
@@ -70,6 +90,8 @@ inputs = [
     boolean_filter_input,
     datetime_filter_input,
     integer_filter_input,
+    array_int_filter_input,
+    cidr_filter_input,
     page_info,
     edge_interface,
     connection_interface,
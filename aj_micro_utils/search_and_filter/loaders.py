@@ -0,0 +1,228 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Type
+
+from pypika import Order
+from pypika.analytics import RowNumber
+from pypika.terms import Field, Star
+from tortoise import models, queryset
+
+from aj_micro_utils.query_monitor import QueryMonitor
+from aj_micro_utils.search_and_filter.queries import ModelResolver
+
+ROW_NUMBER_FIELD = "_row_number"
+
+
+class ConnectionLoader:
+    """
+    Loads the nested connections of many parents with one query, DataLoader style
+
+    - the parent ids passed to load() in the same tick of the event loop
+    are fetched together, ROW_NUMBER() OVER (PARTITION BY parent ORDER BY
+    paginate_on DESC) keeps the first + 1 children of each parent, it numbers
+    the rows of the filter query in an outer query so the rows its DISTINCT
+    dedupes (lookups joining to-many relations) are numbered once
+    - with a ranked search the children are ordered and paged by (rank, pk)
+    - the rows are split into a Relay connection per parent, with the
+    same cursors and hasNextPage the ModelResolver would return
+    - kwargs are the ModelResolver kwargs (first, after, filter, search, prefetch...),
+    every parent gets the same page, create a loader per request and arguments
+    """
+
+    def __init__(
+        self,
+        model: Type[models.Model],
+        formatter: Callable,
+        parent_field: str,
+        **kwargs,
+    ) -> None:
+        self.resolver = ModelResolver(model, formatter, **kwargs)
+        self.model = model
+        self.formatter = formatter
+        self.parent_field = get_parent_key_field(model, parent_field)
+        self._queue: List[Tuple[Any, asyncio.Future]] = []
+        self._cache: Dict[Any, asyncio.Future] = {}
+
+    def load(self, parent_id: Any) -> asyncio.Future:
+        """Future of the connection of the parent, resolved with the batch"""
+        future = self._cache.get(parent_id)
+
+        if future is not None:
+            return future
+
+        loop = asyncio.get_event_loop()
+        future = self._cache[parent_id] = loop.create_future()
+
+        if not self._queue:
+            loop.call_soon(self.dispatch)
+
+        self._queue.append((parent_id, future))
+
+        return future
+
+    def dispatch(self) -> None:
+        queue, self._queue = self._queue, []
+        asyncio.ensure_future(self.resolve(queue))
+
+    async def resolve(self, queue: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            connections = await self.load_many([parent_id for parent_id, _ in queue])
+        except Exception as e:
+            for _, future in queue:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for parent_id, future in queue:
+            if not future.done():
+                future.set_result(connections[parent_id])
+
+    async def load_many(self, parent_ids: Iterable[Any]) -> Dict[Any, dict]:
+        """Connection of each parent, fetched with a single query"""
+        parent_ids = list(dict.fromkeys(parent_ids))
+        paginator = self.resolver.paginator
+        paginate_on = self.model.Meta.paginate_on
+        budget = self.resolver.budget
+
+        if budget:
+            paginator.first = budget.check(
+                self.model,
+                paginator.first,
+                filter=self.resolver.extra.get("filter"),
+                search=self.resolver.extra.get("search"),
+                backend=self.resolver.search_backend,
+            )
+
+        self.resolver.record_usage(paginator)
+
+        qs = self.resolver.query_set(
+            self.resolver.base_queryset.filter(
+                **{f"{self.parent_field}__in": parent_ids}
+            )
+        )
+
+        formatter = self.formatter
+        projection = self.resolver.projection
+
+        if projection is not None:
+            qs = projection.apply(qs, self.parent_field)
+
+            if projection.unselected:
+                formatter = projection.wrap_formatter(self.formatter)
+
+        if paginator.rank_field:
+            if paginator.after:
+                qs = paginator.rank_after(qs)
+            paginate_on = paginator.rank_field
+        elif paginator.after:
+            after_cursor = paginator.get_orm_cursor_value(
+                paginator.after, self.model._meta.fields_map[paginate_on]
+            )
+            qs = qs.filter(**{f"{paginate_on}__lt": after_cursor})
+
+        qs = paginator.route_queryset(qs)
+
+        with QueryMonitor.tags(model=self.model.__name__, typename=paginator.typename):
+            rows = await self.fetch(qs, paginate_on, paginator.first + 1)
+
+        children = defaultdict(list)
+        for row in rows:
+            children[getattr(row, self.parent_field)].append(row)
+
+        paginator.cursor_name = self.model.__name__
+
+        return {
+            parent_id: paginator.to_connection(
+                children[parent_id], paginate_on, formatter
+            )
+            for parent_id in parent_ids
+        }
+
+    async def fetch(
+        self, qs: queryset.QuerySet, paginate_on: str, limit: int
+    ) -> List[models.Model]:
+        """
+        The first limit rows of each parent ordered by paginate_on, a field
+        or the rank annotation, and the primary key, the columns of the
+        filter query are referenced by their names in the outer queries
+        """
+        query = qs.as_query()
+        meta = self.model._meta
+        pk_column = meta.fields_db_projection[meta.pk_attr]
+        order_column = meta.fields_db_projection.get(paginate_on, paginate_on)
+
+        row_number = (
+            RowNumber()
+            .over(Field(meta.fields_db_projection[self.parent_field]))
+            .orderby(Field(order_column), order=Order.desc)
+        )
+
+        if order_column != pk_column:
+            row_number = row_number.orderby(Field(pk_column), order=Order.desc)
+
+        query_class = qs._db.query_class
+        numbered_query = query_class.from_(query).select(
+            Star(), row_number.as_(ROW_NUMBER_FIELD)
+        )
+        batch_query = (
+            query_class.from_(numbered_query)
+            .select(Star())
+            .where(Field(ROW_NUMBER_FIELD) <= limit)
+            .orderby(Field(ROW_NUMBER_FIELD))
+        )
+
+        executor = qs._db.executor_class(
+            model=self.model,
+            db=qs._db,
+            prefetch_map=qs._prefetch_map,
+            prefetch_queries=qs._prefetch_queries,
+            select_related_idx=qs._select_related_idx,
+        )
+
+        return await QueryMonitor.timed(
+            executor.execute_select(
+                batch_query, custom_fields=list(qs._annotations.keys())
+            ),
+            lambda: batch_query.get_sql(),
+            client=qs._db,
+            shape=f"orm:{self.model.__name__}:batch",
+        )
+
+
+def get_parent_key_field(model: Type[models.Model], parent_field: str) -> str:
+    """The field holding the parent id, "parent" and "parent_id" both give parent_id"""
+    field = model._meta.fields_map[parent_field]
+
+    return getattr(field, "source_field", None) or parent_field
+
+
+def get_connection_loader(
+    context: dict,
+    model: Type[models.Model],
+    formatter: Callable,
+    parent_field: str,
+    **kwargs,
+) -> ConnectionLoader:
+    """The loader of the request context for the model, parent field and arguments,
+    so the resolvers of every parent in the list share it, the info of every parent
+    differs but they share the field node the projection is planned from
+    """
+    loaders = context.setdefault("connection_loaders", {})
+    info = kwargs.get("info")
+    arguments = {k: v for k, v in kwargs.items() if k != "info"}
+    key = (
+        model,
+        parent_field,
+        formatter,
+        id(info.field_nodes[0]) if info else None,
+        repr(sorted(arguments.items())),
+    )
+
+    loader = loaders.get(key)
+
+    if loader is None:
+        loader = loaders[key] = ConnectionLoader(
+            model, formatter, parent_field, **kwargs
+        )
+
+    return loader
@@ -0,0 +1,216 @@
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+from ariadne import convert_camel_case_to_snake
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLResolveInfo,
+    InlineFragmentNode,
+    SelectionSetNode,
+)
+from tortoise import models, queryset
+
+PROJECTION_CACHE_SIZE = 512
+
+_projection_plans: "OrderedDict[tuple, ProjectionPlan]" = OrderedDict()
+
+
+class ProjectionPlan:
+    """
+    Columns and relations a connection query needs for the fields
+    the client selected under edges.node
+
+    - fields is None when a selected field can't be mapped to the model,
+    then every column is selected
+    - unselected are the model fields left out, they are set to None on the
+    fetched objects so the formatter can still read them
+    """
+
+    def __init__(
+        self,
+        fields: Optional[Tuple[str, ...]],
+        prefetch: Tuple[str, ...],
+        unselected: Tuple[str, ...],
+    ) -> None:
+        self.fields = fields
+        self.prefetch = prefetch
+        self.unselected = unselected
+
+    def apply(self, qs: queryset.QuerySet, *required: str) -> queryset.QuerySet:
+        if self.fields is not None:
+            qs = qs.only(*dict.fromkeys((*self.fields, *required)))
+
+        if self.prefetch:
+            qs = qs.prefetch_related(*self.prefetch)
+
+        return qs
+
+    def fill(self, obj: models.Model) -> models.Model:
+        for name in self.unselected:
+            if name not in obj.__dict__:
+                setattr(obj, name, None)
+
+        return obj
+
+    def wrap_formatter(self, formatter: Callable) -> Callable:
+        def format(obj: models.Model) -> Any:
+            return formatter(self.fill(obj))
+
+        return format
+
+
+def get_projection_plan(
+    model: Type[models.Model], info: GraphQLResolveInfo
+) -> ProjectionPlan:
+    """The plan of the resolved field, cached per operation text and field position"""
+    field_node = info.field_nodes[0]
+
+    if field_node.loc is None:
+        return compile_projection_plan(model, info.field_nodes, info.fragments)
+
+    key = (model, field_node.loc.source.body, field_node.loc.start)
+    plan = _projection_plans.get(key)
+
+    if plan is not None:
+        _projection_plans.move_to_end(key)
+        return plan
+
+    plan = _projection_plans[key] = compile_projection_plan(
+        model, info.field_nodes, info.fragments
+    )
+
+    if len(_projection_plans) > PROJECTION_CACHE_SIZE:
+        _projection_plans.popitem(last=False)
+
+    return plan
+
+
+def compile_projection_plan(
+    model: Type[models.Model],
+    field_nodes: List[FieldNode],
+    fragments: Dict[str, FragmentDefinitionNode],
+) -> ProjectionPlan:
+    node_selections = [
+        node.selection_set
+        for edges in select_fields(
+            [f.selection_set for f in field_nodes], fragments, "edges"
+        )
+        for node in select_fields([edges.selection_set], fragments, "node")
+    ]
+
+    columns, prefetch = collect_fields(model, node_selections, fragments)
+    db_fields = model._meta.fields_db_projection
+
+    if columns is None:
+        return ProjectionPlan(None, tuple(prefetch), ())
+
+    columns.add(model._meta.pk_attr)
+
+    paginate_on = getattr(model.Meta, "paginate_on", None)
+    if paginate_on in db_fields:
+        columns.add(paginate_on)
+
+    fields = tuple(name for name in db_fields if name in columns)
+    unselected = tuple(name for name in db_fields if name not in columns)
+
+    return ProjectionPlan(fields, tuple(prefetch), unselected)
+
+
+def iter_fields(
+    selection_sets: Iterable[Optional[SelectionSetNode]],
+    fragments: Dict[str, FragmentDefinitionNode],
+) -> Iterator[FieldNode]:
+    """The field nodes of the selection sets, fragments included"""
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection
+            elif isinstance(selection, InlineFragmentNode):
+                yield from iter_fields([selection.selection_set], fragments)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = fragments.get(selection.name.value)
+                if fragment is not None:
+                    yield from iter_fields([fragment.selection_set], fragments)
+
+
+def select_fields(
+    selection_sets: Iterable[Optional[SelectionSetNode]],
+    fragments: Dict[str, FragmentDefinitionNode],
+    name: str,
+) -> List[FieldNode]:
+    return [f for f in iter_fields(selection_sets, fragments) if f.name.value == name]
+
+
+def collect_fields(
+    model: Type[models.Model],
+    selection_sets: List[Optional[SelectionSetNode]],
+    fragments: Dict[str, FragmentDefinitionNode],
+    prefix: str = "",
+) -> Tuple[Optional[Set[str]], List[str]]:
+    """
+    Model fields and relations to prefetch of the selection sets, graphql fields
+    are mapped with Meta.graphql_fields ({"fullName": ["first_name", "last_name"]})
+    or from camelCase to the snake_case field name, the columns are None when
+    a selected field can't be mapped
+    """
+    db_fields = model._meta.fields_db_projection
+    graphql_fields = getattr(model.Meta, "graphql_fields", {})
+    columns: Optional[Set[str]] = set()
+    prefetch: List[str] = []
+
+    for field in iter_fields(selection_sets, fragments):
+        graphql_name = field.name.value
+
+        if graphql_name.startswith("__"):
+            continue
+
+        if graphql_name in graphql_fields:
+            if columns is not None:
+                columns.update(graphql_fields[graphql_name])
+            continue
+
+        name = convert_camel_case_to_snake(graphql_name)
+
+        if name in db_fields:
+            if columns is not None:
+                columns.add(name)
+            continue
+
+        if name in model._meta.fetch_fields:
+            relation = model._meta.fields_map[name]
+            source_field = getattr(relation, "source_field", None)
+
+            if source_field and columns is not None:
+                columns.add(source_field)
+
+            if f"{prefix}{name}" not in prefetch:
+                prefetch.append(f"{prefix}{name}")
+
+            _, related_prefetch = collect_fields(
+                relation.related_model,
+                [field.selection_set],
+                fragments,
+                prefix=f"{prefix}{name}__",
+            )
+            prefetch.extend(p for p in related_prefetch if p not in prefetch)
+            continue
+
+        columns = None
+
+    return columns, prefetch
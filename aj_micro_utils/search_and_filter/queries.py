@@ -1,17 +1,33 @@
 from ariadne import convert_camel_case_to_snake
 from enum import Enum
-from tortoise import models, queryset
-from typing import List, Optional
+from tortoise import Tortoise, models, queryset
+from tortoise.expressions import Subquery
+from tortoise.fields.relational import BackwardFKRelation
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+from aj_micro_utils.index_advisor import UsageRecorder, usage_key, usage_operator
 from aj_micro_utils.paginator import RelayPaginator
+from aj_micro_utils.search_and_filter.projection import (
+    ProjectionPlan,
+    get_projection_plan,
+)
 from aj_micro_utils.util import validate_uuid4
 from tortoise.query_utils import Q
 
+FILTER_PLAN_CACHE_SIZE = 512
+USAGE_CACHE_SIZE = 512
+
 
 class ModelResolver:
     """
     Model resolver class that creates base query of the given model
     Uses the Relay Paginator
     Accepts filter and search dictionaires that contain ORM lookups
+    With a QueryBudget (budget kwarg or Meta.query_budget) the query
+    is checked before it is sent, trusted=True skips the EXPLAIN check
+    With the resolver info only the columns and relations the client
+    selected under edges.node are fetched, the prefetch kwarg is kept
+    when a selected field can't be mapped to the model
     """
 
     def __init__(self, model, formatter, **kwargs) -> None:
@@ -19,29 +35,73 @@ class ModelResolver:
         self.formatter = formatter
         self.extra = kwargs
 
+    @property
+    def projection(self) -> Optional[ProjectionPlan]:
+        info = self.extra.get("info")
+
+        if info is None:
+            return None
+
+        return get_projection_plan(self.model, info)
+
     @property
     def base_queryset(self) -> queryset.QuerySet:
-        if self.extra.get("prefetch"):
-            return self.model.all().prefetch_related(*self.extra.get("prefetch"))
+        """The projection replaces the prefetch kwarg only when it mapped every
+        selected field, otherwise the formatter may read the other relations
+        """
+        prefetch = self.extra.get("prefetch") or ()
+        projection = self.projection
+
+        if projection is not None:
+            if projection.fields is not None:
+                prefetch = ()
+            else:
+                prefetch = [p for p in prefetch if p not in projection.prefetch]
+
+        if prefetch:
+            return self.model.all().prefetch_related(*prefetch)
 
         return self.model.all()
 
+    @property
+    def search_backend(self):
+        return self.extra.get("search_backend") or getattr(
+            self.model.Meta, "search_backend", None
+        )
+
+    @property
+    def budget(self):
+        return self.extra.get("budget") or getattr(
+            self.model.Meta, "query_budget", None
+        )
+
     @property
     def paginator(self) -> RelayPaginator:
         first = self.extra.get("first")
         after = self.extra.get("after")
+        rank_field = None
+
+        if self.extra.get("search") and self.search_backend:
+            rank_field = self.search_backend.rank_field
 
         return RelayPaginator(
             first=first,
             after=after,
             typename=self.model.__name__,
+            rank_field=rank_field,
+            connection=self.extra.get("connection"),
+            sticky_key=self.extra.get("sticky_key"),
+            max_first=self.budget.max_first if self.budget else None,
         )
 
     def search_queryset(
         self, qs: queryset.QuerySet = None
     ) -> Optional[queryset.QuerySet]:
         return get_search_query(
-            model=self.model, search=self.extra.get("search"), qs=qs
+            model=self.model,
+            search=self.extra.get("search"),
+            qs=qs,
+            backend=self.search_backend,
         )
 
     def filter_queryset(
@@ -60,20 +120,71 @@ class ModelResolver:
         return qs if qs else self.base_queryset
 
     async def get_data(self, qs: queryset.QuerySet = None) -> dict:
-        return await self.paginator.paginate(
-            data_query=self.query_set(qs=qs if qs else self.base_queryset),
-            formatter=self.formatter,
+        paginator = self.paginator
+        data_query = self.query_set(qs=qs if qs else self.base_queryset)
+        formatter = self.formatter
+        projection = self.projection
+
+        if projection is not None:
+            data_query = projection.apply(data_query)
+
+            if projection.unselected:
+                formatter = projection.wrap_formatter(self.formatter)
+
+        if self.budget:
+            paginator.first = await self.budget.enforce(
+                self.model,
+                data_query,
+                paginator,
+                filter=self.extra.get("filter"),
+                search=self.extra.get("search"),
+                backend=self.search_backend,
+                trusted=self.extra.get("trusted", False),
+            )
+
+        self.record_usage(paginator)
+
+        return await paginator.paginate(
+            data_query=data_query,
+            formatter=formatter,
         )
 
+    def record_usage(self, paginator: RelayPaginator) -> None:
+        """Counts the columns, operators and sort key for the index advisor"""
+        if not UsageRecorder.enabled():
+            return
+
+        search = self.extra.get("search")
+        filter = self.extra.get("filter")
+
+        search_usage = (
+            get_search_usage(self.model, search, self.search_backend) if search else ()
+        )
+        shape = get_filter_shape(filter) if filter and not search else ()
+        order_by = (
+            None
+            if paginator.rank_field
+            else getattr(self.model.Meta, "paginate_on", None)
+        )
+
+        UsageRecorder.record(get_usage_keys(self.model, shape, search_usage, order_by))
+
 
 def get_search_query(
     model: models.Model,
     search: str,
     qs: queryset.QuerySet = None,
+    backend=None,
 ) -> queryset.QuerySet:
+    """
+    Equality search over the fields that can hold the search term,
+    a SearchBackend from search_backends can be passed to search differently
+    """
+    if backend is not None:
+        return backend.search_queryset(model, search, qs)
     if qs:
-        return qs.filter(get_search_q(model, search)).distinct()
-    return model.filter(get_search_q(model, search)).distinct()
+        return distinct_if_needed(qs.filter(get_search_q(model, search)))
+    return distinct_if_needed(model.filter(get_search_q(model, search)))
 
 
 def get_filter_query(
@@ -82,32 +193,236 @@ def get_filter_query(
     qs: queryset.QuerySet = None,
 ) -> queryset.QuerySet:
     if qs:
-        return qs.filter(get_filter_q(model, filter)).distinct()
-    return model.filter(get_filter_q(model, filter)).distinct()
+        return distinct_if_needed(qs.filter(get_filter_q(model, filter)))
+    return distinct_if_needed(model.filter(get_filter_q(model, filter)))
+
+
+def distinct_if_needed(qs: queryset.QuerySet) -> queryset.QuerySet:
+    """
+    DISTINCT makes postgres sort or hash the whole result before the LIMIT,
+    so it is only added when a lookup joins a to-many relation
+    """
+    for q in qs._q_objects:
+        if any(spans_to_many(qs.model, key) for key in get_q_keys(q)):
+            return qs.distinct()
+
+    return qs
+
+
+def get_q_keys(q: Q) -> List[str]:
+    keys = list(q.filters.keys())
+    for child in q.children:
+        keys.extend(get_q_keys(child))
+    return keys
+
+
+def spans_to_many(model: models.Model, key: str) -> bool:
+    """Does the lookup join a backward foreign key or many to many relation"""
+    for name in key.split("__"):
+        if name not in model._meta.fetch_fields:
+            return False
+        if name in model._meta.backward_fk_fields or name in model._meta.m2m_fields:
+            return True
+        model = model._meta.fields_map[name].related_model
+    return False
 
 
 def get_filter_q(
     model: models.Model,
     filter: dict,
 ) -> Q:
+    return get_filter_plan(model, filter).bind(filter)
 
-    filters = Q()
-    for key, val in filter.items():
-        formatted_field_name = convert_camel_case_to_snake(key)
-        assert field_exists(model, formatted_field_name)
-        filters &= Q(**get_orm_lookup(formatted_field_name, val))
-    return filters
 
+def get_filter_shape(filter: dict) -> tuple:
+    """The keys and operators of the filter, without the values"""
+    return tuple(
+        (key, get_filter_shape(value) if isinstance(value, dict) else None)
+        for key, value in filter.items()
+    )
 
-def field_exists(model: models.Model, field_name: str) -> bool:
-    model_desc = model.describe()
 
-    if model_desc["pk_field"]["name"] == field_name:
-        return True
-    for data_field in model_desc["data_fields"]:
-        if data_field["name"] == field_name:
-            return True
-    return False
+def get_filter_plan(model: models.Model, filter: dict) -> "FilterPlan":
+    return compile_filter_plan(model, get_filter_shape(filter))
+
+
+class FilterPlan:
+    """
+    Validated ORM lookups of a filter shape, clients send the same few
+    shapes so the plan is compiled once and only binds the values
+    of each filter into a Q object
+    """
+
+    def __init__(self, model: models.Model, shape: tuple) -> None:
+        self.model = model
+        self.binders = [self.compile(key, sub_shape) for key, sub_shape in shape]
+
+    def compile(self, key: str, sub_shape: Optional[tuple]) -> Callable[[Any], Q]:
+        name = convert_camel_case_to_snake(key)
+
+        if name in get_schema_index(self.model).relations:
+            return self.compile_relation(name, sub_shape)
+
+        assert field_exists(self.model, name)
+
+        if sub_shape is None:
+            return lambda value: Q(**{name: value})
+
+        lookups = [name + GRAPHQL_ORM_LOOKUPS[op] for op, _ in sub_shape]
+
+        return lambda value: Q(**dict(zip(lookups, value.values())))
+
+    def compile_relation(self, name: str, sub_shape: Optional[tuple]) -> Callable:
+        """
+        Filters on the fields of a related model, ex. {"items": {"sku": {"eq": "A1"}}}
+        The related rows are matched in a subquery that postgres runs as a semi-join,
+        unlike a join it never duplicates the rows so no DISTINCT is needed
+        """
+        assert sub_shape is not None
+
+        relation = self.model._meta.fields_map[name]
+        related_model = relation.related_model
+        related_plan = compile_filter_plan(related_model, sub_shape)
+
+        if isinstance(relation, BackwardFKRelation):
+            lookup = f"{self.model._meta.pk_attr}__in"
+            values_field = relation.relation_field
+        else:
+            lookup = f"{relation.source_field}__in"
+            values_field = relation.to_field_instance.model_field_name
+
+        def bind(value: dict) -> Q:
+            related_qs = related_model.filter(related_plan.bind(value))
+            return Q(**{lookup: Subquery(related_qs.values(values_field))})
+
+        return bind
+
+    def bind(self, filter: dict) -> Q:
+        filters = Q()
+        for binder, value in zip(self.binders, filter.values()):
+            filters &= binder(value)
+        return filters
+
+
+class InvalidFilterPlan:
+    """Cached plan of a filter shape that failed to compile, raises the same error"""
+
+    def __init__(self, error: Exception) -> None:
+        self.error_type = type(error)
+        self.error_args = error.args
+
+    def bind(self, filter: dict) -> Q:
+        raise self.error_type(*self.error_args)
+
+
+@lru_cache(maxsize=FILTER_PLAN_CACHE_SIZE)
+def compile_filter_plan(
+    model: models.Model, shape: tuple
+) -> Union[FilterPlan, InvalidFilterPlan]:
+    try:
+        return FilterPlan(model, shape)
+    except (AssertionError, KeyError) as e:
+        return InvalidFilterPlan(e)
+
+
+def get_column_name(model: models.Model, field_name: str) -> str:
+    field = get_schema_index(model).fields.get(field_name)
+
+    return field["db_column"] if field else field_name
+
+
+def get_filter_usage(model: models.Model, shape: tuple) -> List[tuple]:
+    """(model, column, operator) of every lookup of the filter shape,
+    relation filters add the lookups on the related model, the lookups of
+    the custom fields are prefixed with their kind, ex. array.contains
+    """
+    schema_index = get_schema_index(model)
+    usage = []
+
+    for key, sub_shape in shape:
+        name = convert_camel_case_to_snake(key)
+
+        if name in schema_index.relations:
+            if sub_shape is None:
+                continue
+
+            relation = model._meta.fields_map[name]
+            related_model = relation.related_model
+
+            if isinstance(relation, BackwardFKRelation):
+                column = get_column_name(related_model, relation.relation_field)
+                usage.append((related_model, column, "in"))
+
+            usage.extend(get_filter_usage(related_model, sub_shape))
+            continue
+
+        if name not in schema_index.fields:
+            continue
+
+        field = model._meta.fields_map[name]
+        operators = [op for op, _ in sub_shape] if sub_shape else ["eq"]
+        usage.extend(
+            (model, get_column_name(model, name), usage_operator(field, op))
+            for op in operators
+        )
+
+    return usage
+
+
+def get_search_usage(
+    model: models.Model, search: str, backend=None
+) -> Tuple[Tuple[str, str], ...]:
+    """(column, operator) the search runs on"""
+    if backend is not None:
+        return tuple(backend.search_usage(model, search))
+
+    searchable = get_schema_index(model).searchable(get_search_types(search))
+
+    return tuple(
+        (get_column_name(model, name), "eq")
+        for name, max_length in searchable
+        if not max_length or max_length >= len(search)
+    )
+
+
+@lru_cache(maxsize=USAGE_CACHE_SIZE)
+def get_usage_keys(
+    model: models.Model, shape: tuple, search_usage: tuple, order_by: Optional[str]
+) -> Tuple[str, ...]:
+    """UsageRecorder keys of a query, the sort key is kept
+    with the lookups on the model itself
+    """
+    table = model._meta.db_table
+    order_column = (
+        get_column_name(model, order_by)
+        if order_by in get_schema_index(model).fields
+        else None
+    )
+
+    keys = [
+        usage_key(model.__name__, table, column, operator, order_column)
+        for column, operator in search_usage
+    ]
+
+    for lookup_model, column, operator in get_filter_usage(model, shape):
+        keys.append(
+            usage_key(
+                lookup_model.__name__,
+                lookup_model._meta.db_table,
+                column,
+                operator,
+                order_column if lookup_model is model else None,
+            )
+        )
+
+    if order_column:
+        keys.append(usage_key(model.__name__, table, order_column, "order"))
+
+    return tuple(keys)
+
+
+def field_exists(model: models.Model, field_name: str) -> bool:
+    return field_name in get_schema_index(model).fields
 
 
 def get_orm_lookup(key, value):
@@ -132,6 +447,12 @@ GRAPHQL_ORM_LOOKUPS = {
     "matches": "__iexact",
     "icontains": "__icontains",
     "contains": "__contains",
+    "containedBy": "__contained_by",
+    "overlap": "__overlap",
+    "any": "__any",
+    "within": "__within",
+    "withinOrEqual": "__within_or_equal",
+    "containsOrEqual": "__contains_or_equal",
 }
 
 SMALL_INT_LOWER = -32768
@@ -145,20 +466,14 @@ def get_search_q(model: models.Model, search: str) -> Q:
     :param search: search term
     :return: Q object
     """
-    model_desc = model.describe()
     q = Q()
 
-    search_fields = get_search_fields(search)
-
-    if model_desc["pk_field"]["field_type"] in search_fields:
-        q |= Q(**{model_desc["pk_field"]["name"]: search})
+    searchable = get_schema_index(model).searchable(get_search_types(search))
 
-    for data_field in model_desc["data_fields"]:
-        if data_field["field_type"] in search_fields:
-            max_length = data_field["constraints"].get("max_length")
-            if max_length and max_length < len(search):
-                continue
-            q |= Q(**{data_field["name"]: search})
+    for name, max_length in searchable:
+        if max_length and max_length < len(search):
+            continue
+        q |= Q(**{name: search})
     return q
 
 
@@ -171,30 +486,38 @@ def get_search_fields(search: str) -> List[str]:
     :param search: search term
     :return: List of Field string representation
     """
-    search_types = []
+    search_fields = []
+
+    for search_type in get_search_types(search):
+        search_fields.extend(field_types[search_type])
+
+    return search_fields
+
+
+def get_search_types(search: str) -> Tuple["SearchType", ...]:
+    """
+    Depending on the type of the search term it will
+    return the SearchTypes that might contain the search value
 
-    for field in field_types[SearchType.CHAR]:
-        search_types.append(field)
+    :param search: search term
+    :return: Tuple of SearchType
+    """
+    search_types = [SearchType.CHAR]
 
     if search.isdigit():
         if SMALL_INT_LOWER <= int(search) <= SMALL_INT_UPPER:
-            for field in field_types[SearchType.SMALL_INT]:
-                search_types.append(field)
+            search_types.append(SearchType.SMALL_INT)
 
-        for field in field_types[SearchType.DIGIT]:
-            search_types.append(field)
+        search_types.append(SearchType.DIGIT)
     if search.isdecimal():
-        for field in field_types[SearchType.DECIMAL]:
-            search_types.append(field)
+        search_types.append(SearchType.DECIMAL)
     if validate_uuid4(search):
-        for field in field_types[SearchType.UUID]:
-            search_types.append(field)
+        search_types.append(SearchType.UUID)
 
     if search == "true" or search == "false":
-        for field in field_types[SearchType.BOOL]:
-            search_types.append(field)
+        search_types.append(SearchType.BOOL)
 
-    return search_types
+    return tuple(search_types)
 
 
 class SearchType(str, Enum):
@@ -227,3 +550,91 @@ field_types = {
         "BooleanField",
     ],
 }
+
+
+class ModelSchemaIndex:
+    """
+    Field lookup tables of a model, built once from model.describe()
+
+    - fields maps the pk and data field names to their description
+    (field_type, constraints, indexed, unique...)
+    - relations holds the names of the to-one and backward foreign key relations
+    - indexed holds the fields a btree index can be used for, the pk, unique and
+    indexed fields and the leading field of Meta.indexes and Meta.unique_together
+    - search_fields holds the (name, max_length) of the fields that
+    can contain a value of the SearchType, in the model field order
+    """
+
+    def __init__(self, model: Type[models.Model]) -> None:
+        model_desc = model.describe()
+        data_fields = [model_desc["pk_field"], *model_desc["data_fields"]]
+
+        self.model = model
+        self.pk_name = model_desc["pk_field"]["name"]
+        self.fields: Dict[str, dict] = {f["name"]: f for f in data_fields}
+        self.relations = (
+            model._meta.fk_fields
+            | model._meta.o2o_fields
+            | model._meta.backward_fk_fields
+            | model._meta.backward_o2o_fields
+        )
+        self.indexed = {
+            name
+            for name, f in self.fields.items()
+            if name == self.pk_name or f["indexed"] or f["unique"]
+        }
+        for index in (*model._meta.indexes, *model._meta.unique_together):
+            index_fields = getattr(index, "fields", index)
+            if index_fields:
+                self.indexed.add(index_fields[0])
+
+        self.search_fields: Dict[SearchType, List[Tuple[str, Optional[int]]]] = {
+            search_type: [
+                (f["name"], f["constraints"].get("max_length"))
+                for f in data_fields
+                if f["field_type"] in types
+            ]
+            for search_type, types in field_types.items()
+        }
+        self._searchable: Dict[tuple, List[Tuple[str, Optional[int]]]] = {}
+
+    def searchable(
+        self, search_types: Tuple[SearchType, ...]
+    ) -> List[Tuple[str, Optional[int]]]:
+        """(name, max_length) of the fields matching any of the search types"""
+        searchable = self._searchable.get(search_types)
+
+        if searchable is None:
+            names = set()
+            for search_type in search_types:
+                names.update(name for name, _ in self.search_fields[search_type])
+
+            searchable = [
+                (name, f["constraints"].get("max_length"))
+                for name, f in self.fields.items()
+                if name in names
+            ]
+            self._searchable[search_types] = searchable
+
+        return searchable
+
+
+_schema_indexes: Dict[Type[models.Model], ModelSchemaIndex] = {}
+
+
+def get_schema_index(model: Type[models.Model]) -> ModelSchemaIndex:
+    schema_index = _schema_indexes.get(model)
+
+    if schema_index is None:
+        schema_index = _schema_indexes[model] = ModelSchemaIndex(model)
+
+    return schema_index
+
+
+def build_schema_indexes() -> None:
+    """Builds the schema index of every model, call it right after Tortoise.init"""
+    _schema_indexes.clear()
+
+    for app in Tortoise.apps.values():
+        for model in app.values():
+            get_schema_index(model)
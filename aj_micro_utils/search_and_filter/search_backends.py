@@ -0,0 +1,274 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from pypika import Table
+from pypika.enums import Comparator
+from pypika.functions import Coalesce
+from pypika.terms import BasicCriterion, Bracket, Criterion, Function, Term
+from pypika.terms import ValueWrapper
+from tortoise import functions, models, queryset
+
+from aj_micro_utils.search_and_filter.queries import (
+    SearchType,
+    get_column_name,
+    get_schema_index,
+    get_search_query,
+    get_search_usage,
+)
+
+QUOTE_CHAR = '"'
+RANK_FIELD = "search_rank"
+MATCH_FIELD = "search_match"
+
+# same defaults as postgres ts_rank uses for the A, B, C and D weights
+TRIGRAM_WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.2, "D": 0.1}
+
+
+class SearchOperators(Comparator):
+    concat = " || "
+    match = " @@ "
+    word_similar = " <% "
+
+
+class SearchExpression(functions.Function):
+    """Annotation resolving to the pypika term built for the model table"""
+
+    def __init__(self, build: Callable[[Table], Term]) -> None:
+        super().__init__(None)
+        self.build = build
+
+    def resolve(self, model: Type[models.Model], table: Table) -> dict:
+        return {"joins": [], "field": self.build(table)}
+
+
+def get_search_weights(model: Type[models.Model]) -> Dict[str, str]:
+    """
+    Fields to search on with their weight (A, B, C or D), declared on the model as
+
+    class Meta:
+        search_fields = {"name": "A", "description": "B"}
+
+    a list of field names gets the weight A, without declaration
+    every CharField of the model is searched with the weight A
+    """
+    search_fields = getattr(model.Meta, "search_fields", None)
+
+    if search_fields is None:
+        search_fields = [
+            name for name, _ in get_schema_index(model).search_fields[SearchType.CHAR]
+        ]
+
+    if isinstance(search_fields, dict):
+        return search_fields
+
+    return {name: "A" for name in search_fields}
+
+
+def get_column(model: Type[models.Model], table: Table, name: str) -> Term:
+    return table[get_column_name(model, name)]
+
+
+class SearchBackend(ABC):
+    """
+    Builds the queryset for a search term, the subclasses implement search_queryset
+
+    rank_field is the annotation the results are ordered by,
+    the RelayPaginator uses it for keyset pagination on (rank, pk)
+    """
+
+    rank_field: Optional[str] = None
+
+    @abstractmethod
+    def search_queryset(
+        self,
+        model: Type[models.Model],
+        search: str,
+        qs: queryset.QuerySet = None,
+    ) -> queryset.QuerySet:
+        ...
+
+    def search_usage(
+        self, model: Type[models.Model], search: str
+    ) -> List[Tuple[str, str]]:
+        """(column, operator) the search runs on, for the index advisor"""
+        return []
+
+
+class ExactSearchBackend(SearchBackend):
+    """Equality matches over the fields that can hold the search term"""
+
+    def search_queryset(
+        self,
+        model: Type[models.Model],
+        search: str,
+        qs: queryset.QuerySet = None,
+    ) -> queryset.QuerySet:
+        return get_search_query(model=model, search=search, qs=qs)
+
+    def search_usage(
+        self, model: Type[models.Model], search: str
+    ) -> List[Tuple[str, str]]:
+        return list(get_search_usage(model, search))
+
+
+class FullTextSearchBackend(SearchBackend):
+    """
+    Postgres full text search over the weighted tsvector of the search fields,
+    ranked with ts_rank, full_text_index_sql creates the matching GIN index
+    """
+
+    rank_field = RANK_FIELD
+
+    def __init__(
+        self, config: str = "simple", query_function: str = "websearch_to_tsquery"
+    ) -> None:
+        self.config = config
+        self.query_function = query_function
+
+    def vector(self, model: Type[models.Model], table: Table) -> Term:
+        vectors = [
+            Function(
+                "setweight",
+                Function(
+                    "to_tsvector",
+                    ValueWrapper(self.config),
+                    Coalesce(get_column(model, table, name), ValueWrapper("")),
+                ),
+                ValueWrapper(weight),
+            )
+            for name, weight in get_search_weights(model).items()
+        ]
+
+        vector = vectors[0]
+        for other in vectors[1:]:
+            vector = BasicCriterion(SearchOperators.concat, vector, other)
+
+        return Bracket(vector)
+
+    def search_usage(
+        self, model: Type[models.Model], search: str
+    ) -> List[Tuple[str, str]]:
+        columns = [get_column_name(model, name) for name in get_search_weights(model)]
+
+        return [(",".join(columns), "fulltext")]
+
+    def query(self, search: str) -> Term:
+        return Function(
+            self.query_function, ValueWrapper(self.config), ValueWrapper(search)
+        )
+
+    def search_queryset(
+        self,
+        model: Type[models.Model],
+        search: str,
+        qs: queryset.QuerySet = None,
+    ) -> queryset.QuerySet:
+        qs = qs if qs else model.all()
+
+        return qs.annotate(
+            **{
+                MATCH_FIELD: SearchExpression(
+                    lambda table: Bracket(
+                        BasicCriterion(
+                            SearchOperators.match,
+                            self.vector(model, table),
+                            self.query(search),
+                        )
+                    )
+                ),
+                RANK_FIELD: SearchExpression(
+                    lambda table: Function(
+                        "ts_rank", self.vector(model, table), self.query(search)
+                    )
+                ),
+            }
+        ).filter(**{MATCH_FIELD: True})
+
+
+class TrigramSearchBackend(SearchBackend):
+    """
+    pg_trgm word similarity over the search fields, matches partial words,
+    ranked by the weighted sum of the word similarities,
+    trigram_index_sql creates the matching GIN indexes
+    """
+
+    rank_field = RANK_FIELD
+
+    def match(self, model: Type[models.Model], table: Table, search: str) -> Term:
+        return Criterion.any(
+            BasicCriterion(
+                SearchOperators.word_similar,
+                ValueWrapper(search),
+                get_column(model, table, name),
+            )
+            for name in get_search_weights(model).keys()
+        )
+
+    def search_usage(
+        self, model: Type[models.Model], search: str
+    ) -> List[Tuple[str, str]]:
+        return [
+            (get_column_name(model, name), "trigram")
+            for name in get_search_weights(model)
+        ]
+
+    def rank(self, model: Type[models.Model], table: Table, search: str) -> Term:
+        rank = None
+
+        for name, weight in get_search_weights(model).items():
+            similarity = Function(
+                "word_similarity",
+                ValueWrapper(search),
+                get_column(model, table, name),
+            )
+            term = similarity * TRIGRAM_WEIGHTS[weight]
+            rank = term if rank is None else rank + term
+
+        return rank
+
+    def search_queryset(
+        self,
+        model: Type[models.Model],
+        search: str,
+        qs: queryset.QuerySet = None,
+    ) -> queryset.QuerySet:
+        qs = qs if qs else model.all()
+
+        return qs.annotate(
+            **{
+                MATCH_FIELD: SearchExpression(
+                    lambda table: Bracket(self.match(model, table, search))
+                ),
+                RANK_FIELD: SearchExpression(
+                    lambda table: self.rank(model, table, search)
+                ),
+            }
+        ).filter(**{MATCH_FIELD: True})
+
+
+def full_text_index_sql(
+    model: Type[models.Model], config: str = "simple", name: str = None
+) -> str:
+    """CREATE INDEX statement for the tsvector the FullTextSearchBackend searches on"""
+    table = model._meta.basetable
+    vector = FullTextSearchBackend(config=config).vector(model, table)
+    name = name or f"{model._meta.db_table}_search_vector_idx"
+
+    return (
+        f'CREATE INDEX IF NOT EXISTS "{name}" ON "{model._meta.db_table}" '
+        f"USING GIN ({vector.get_sql(quote_char=QUOTE_CHAR)})"
+    )
+
+
+def trigram_index_sql(model: Type[models.Model]) -> List[str]:
+    """pg_trgm extension and GIN index statements for the TrigramSearchBackend"""
+    statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+
+    for name in get_search_weights(model).keys():
+        column = get_column_name(model, name)
+        statements.append(
+            f'CREATE INDEX IF NOT EXISTS "{model._meta.db_table}_{column}_trgm_idx" '
+            f'ON "{model._meta.db_table}" USING GIN ("{column}" gin_trgm_ops)'
+        )
+
+    return statements
@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+
+from arq.constants import default_queue_name, job_key_prefix, result_key_prefix
+
+from aj_micro_utils.arq import Arq, ArqJob, get_redis_settings, job_id
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        return [
+            getattr(self.redis, name)(*args, **kwargs)
+            for name, args, kwargs in self.commands
+        ]
+
+
+class FakeArqRedis:
+    SET_IF_NOT_EXIST = "SET_IF_NOT_EXIST"
+    job_serializer = None
+    default_queue_name = default_queue_name
+
+    def __init__(self):
+        self.keys = {}
+        self.queues = {}
+        self.round_trips = 0
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def set(self, key, value, pexpire=0, exist=None):
+        if exist and key in self.keys:
+            return False
+        self.keys[key] = value
+        return True
+
+    def exists(self, key):
+        return int(key in self.keys)
+
+    def zadd(self, key, *pairs):
+        queue = self.queues.setdefault(key, {})
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            queue[member] = score
+        return len(pairs) // 2
+
+    def delete(self, *keys):
+        for key in keys:
+            self.keys.pop(key, None)
+
+
+def test_jobs_are_enqueued_in_batches(event_loop):
+    redis = Arq._redis = FakeArqRedis()
+    jobs = [ArqJob("send_email", i) for i in range(5)]
+
+    try:
+        ids = event_loop.run_until_complete(Arq.enqueue_many(jobs, batch_size=2))
+    finally:
+        Arq._redis = None
+
+    assert all(ids)
+    assert redis.round_trips == 6
+    assert sorted(redis.queues[default_queue_name]) == sorted(ids)
+
+
+def test_duplicate_jobs_are_skipped(event_loop):
+    redis = Arq._redis = FakeArqRedis()
+    done = job_id("rebuild", 3)
+    redis.keys[result_key_prefix + done] = b"result"
+    defer_until = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+    jobs = [
+        ArqJob("rebuild", 1),
+        ArqJob("rebuild", 1),
+        ArqJob("rebuild", 2, _job_id="custom"),
+        ArqJob("rebuild", 3),
+    ]
+
+    try:
+        ids = event_loop.run_until_complete(
+            Arq.enqueue_many(jobs, dedupe=True, defer_until=defer_until)
+        )
+        again = event_loop.run_until_complete(Arq.enqueue_many(jobs[:1], dedupe=True))
+    finally:
+        Arq._redis = None
+
+    assert ids == [job_id("rebuild", 1), None, "custom", None]
+    assert again == [None]
+    assert job_key_prefix + done not in redis.keys
+    assert set(redis.queues[default_queue_name].values()) == {
+        int(defer_until.timestamp() * 1000)
+    }
+
+
+def test_redis_settings():
+    settings = get_redis_settings("redis://:secret@redis:6380/2")
+    assert (settings.host, settings.port, settings.database) == ("redis", 6380, 2)
+    assert not settings.sentinel
+
+    sentinels = [("sentinel-1", 26379)]
+    settings = get_redis_settings("redis://:secret@redis/3", sentinels)
+    assert settings.sentinel and settings.host == sentinels
+    assert (settings.password, settings.database) == ("secret", 3)
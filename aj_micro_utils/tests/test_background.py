@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from starlette.background import BackgroundTask
+
+from aj_micro_utils.arq import Arq
+from aj_micro_utils.ariadne import extension
+from aj_micro_utils.background import BackgroundExecutor
+from aj_micro_utils.ariadne.extension import DebugBackgroundTasks
+
+
+class Pool:
+    def __init__(self):
+        self.jobs = []
+
+    async def enqueue_job(self, function, *args, **kwargs):
+        self.jobs.append((function, args, kwargs))
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setattr(extension, "DEBUG", False)
+    BackgroundExecutor.setup(concurrency=2, timeout=0.2)
+    BackgroundExecutor.reset()
+    yield BackgroundExecutor
+    BackgroundExecutor.setup(concurrency=10, timeout=30)
+    BackgroundExecutor._offloaded.clear()
+
+
+def test_tasks_run_concurrently_up_to_the_limit(event_loop, executor):
+    running = []
+    peak = []
+
+    async def task():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    tasks = DebugBackgroundTasks()
+    for _ in range(5):
+        tasks.add_task(task)
+
+    event_loop.run_until_complete(tasks())
+
+    assert max(peak) == 2
+    stats = executor.stats()
+    assert stats["pending"] == stats["running"] == 0
+    assert sum(h["count"] for h in stats["tasks"].values()) == 5
+
+
+def test_failures_and_timeouts_are_isolated(event_loop, executor):
+    done = []
+
+    async def fail():
+        raise ValueError("boom")
+
+    async def hang():
+        await asyncio.sleep(1)
+
+    async def succeed():
+        done.append(True)
+
+    tasks = DebugBackgroundTasks()
+    for func in (fail, hang, succeed):
+        tasks.add_task(func)
+
+    event_loop.run_until_complete(tasks())
+
+    assert done == [True]
+    assert executor.stats()["failed"] == 1
+    assert executor.stats()["timed_out"] == 1
+
+
+def test_offloaded_tasks_are_enqueued_to_arq(event_loop, executor):
+    async def send_report(ctx, order_id, full=False):
+        raise AssertionError("ran in process")
+
+    executor.offload(send_report)
+    pool = Arq._redis = Pool()
+
+    tasks = DebugBackgroundTasks()
+    tasks.add_task(send_report, "order", full=True)
+
+    try:
+        event_loop.run_until_complete(tasks())
+    finally:
+        Arq._redis = None
+
+    assert pool.jobs == [("send_report", ("order",), {"full": True})]
+
+
+def test_a_timeout_of_0_disables_it(event_loop, executor):
+    executor.setup(timeout=0)
+    done = []
+
+    async def succeed():
+        await asyncio.sleep(0)
+        done.append(True)
+
+    event_loop.run_until_complete(executor.run_task(BackgroundTask(succeed)))
+
+    assert done == [True]
+    assert executor.stats()["timed_out"] == 0
+    assert BackgroundExecutor._timeout is None
+
+
+def test_debug_runs_the_tasks_one_after_another(event_loop, executor, monkeypatch):
+    monkeypatch.setattr(extension, "DEBUG", True)
+    order = []
+
+    async def first():
+        await asyncio.sleep(0.01)
+        order.append("first")
+
+    def second():
+        order.append("second")
+
+    async def send_report(ctx, order_id):
+        raise AssertionError("ran in process")
+
+    async def fail():
+        raise ValueError("boom")
+
+    executor.offload(send_report)
+    pool = Arq._redis = Pool()
+
+    tasks = DebugBackgroundTasks()
+    tasks.add_task(first)
+    tasks.add_task(second)
+    tasks.add_task(send_report, "order")
+    tasks.add_task(fail)
+
+    try:
+        with pytest.raises(ValueError):
+            event_loop.run_until_complete(tasks())
+    finally:
+        Arq._redis = None
+
+    assert order == ["first", "second"]
+    assert pool.jobs == [("send_report", ("order",), {})]
@@ -0,0 +1,70 @@
+from ariadne import QueryType, gql, make_executable_schema
+from starlette.testclient import TestClient
+
+from aj_micro_utils.ariadne.extension import GraphQLWithBackGroundTasks
+
+type_defs = gql(
+    """
+    type Query {
+        hello(name: String): String
+    }
+    """
+)
+
+query = QueryType()
+contexts = []
+done = []
+
+
+async def log_hello(name):
+    done.append(name)
+
+
+@query.field("hello")
+async def resolve_hello(_, info, name="world"):
+    contexts.append(id(info.context))
+    info.context["background"].add_task(log_hello, name)
+    return f"Hello {name}"
+
+
+schema = make_executable_schema(type_defs, query)
+
+HELLO = "query Hello($name: String) { hello(name: $name) }"
+
+
+def test_batched_operations_share_the_context():
+    contexts.clear()
+    done.clear()
+    client = TestClient(GraphQLWithBackGroundTasks(schema, max_batch_size=3))
+
+    response = client.post(
+        "/",
+        json=[
+            {"query": HELLO, "variables": {"name": "a"}},
+            {"query": HELLO, "variables": {"name": "b"}},
+            {"query": "{ goodbye }"},
+        ],
+    )
+
+    assert response.status_code == 200
+    results = response.json()
+    assert results[0] == {"data": {"hello": "Hello a"}}
+    assert results[1] == {"data": {"hello": "Hello b"}}
+    assert "errors" in results[2]
+
+    assert len(contexts) == 2 and contexts[0] == contexts[1]
+    assert sorted(done) == ["a", "b"]
+
+
+def test_batch_size_is_capped():
+    client = TestClient(GraphQLWithBackGroundTasks(schema, max_batch_size=1))
+    batch = [{"query": HELLO}, {"query": HELLO}]
+
+    assert client.post("/", json=batch).status_code == 400
+    assert client.post("/", json=[]).status_code == 400
+    assert client.post("/", json=batch[:1]).json() == [
+        {"data": {"hello": "Hello world"}}
+    ]
+
+    client = TestClient(GraphQLWithBackGroundTasks(schema, max_batch_size=0))
+    assert client.post("/", json=batch[:1]).status_code == 400
@@ -0,0 +1,116 @@
+import pytest
+
+from aj_micro_utils.paginator import RelayPaginator
+from aj_micro_utils.query_cost import QueryCostError, get_plan_cost
+from aj_micro_utils.search_and_filter import budget as budget_module
+from aj_micro_utils.search_and_filter.budget import QueryBudget
+from aj_micro_utils.search_and_filter.queries import ModelResolver, get_schema_index
+from aj_micro_utils.tests.test_models import TestModel, formatter
+
+
+def test_paginator_rejects_first_above_max():
+    with pytest.raises(QueryCostError) as e:
+        RelayPaginator(first=100000, after=None, typename="TestModel")
+
+    assert e.value.extensions == {
+        "code": "QUERY_TOO_EXPENSIVE",
+        "cost": 100000,
+        "limit": 100,
+    }
+    assert RelayPaginator(first=50, after=None, typename="TestModel").first == 50
+
+
+def test_schema_index_indexed_fields():
+    assert get_schema_index(TestModel).indexed == {"id"}
+
+
+def test_budget_rejects_unindexed_pattern_lookups():
+    budget = QueryBudget()
+
+    assert budget.check(TestModel, 10, filter={"id": {"eq": 1}}) == 10
+
+    with pytest.raises(QueryCostError) as e:
+        budget.check(TestModel, 10, filter={"email": {"icontains": "a"}})
+
+    assert "email.icontains" in e.value.message
+
+
+def test_budget_downgrades_unindexed_pattern_lookups():
+    budget = QueryBudget(expensive_lookups="downgrade", downgraded_first=5)
+
+    assert budget.check(TestModel, 50, filter={"email": {"icontains": "a"}}) == 5
+    assert budget.check(TestModel, 50, filter={"id": {"in": [1, 2]}}) == 50
+
+
+def test_budget_relation_filter_and_total_cost():
+    budget = QueryBudget(max_cost=100)
+
+    with pytest.raises(QueryCostError):
+        budget.check(TestModel, 10, filter={"items": {"sku": {"contains": "A"}}})
+
+    with pytest.raises(QueryCostError) as e:
+        budget.check(TestModel, 95, filter={"trackingNumber": {"eq": 1}})
+
+    assert e.value.extensions["cost"] == 105
+
+
+def test_budget_rejects_short_search():
+    budget = QueryBudget()
+
+    with pytest.raises(QueryCostError):
+        budget.check(TestModel, 10, search="a")
+
+    assert budget.check(TestModel, 10, search="reference") == 10
+
+
+def test_plan_cost():
+    assert get_plan_cost([{"QUERY PLAN": [{"Plan": {"Total Cost": 12.5}}]}]) == 12.5
+    assert get_plan_cost([{"QUERY PLAN": '[{"Plan": {"Total Cost": 3}}]'}]) == 3
+
+
+def test_resolver_enforces_budget(event_loop, created_data):
+    resolver = ModelResolver(
+        TestModel,
+        formatter,
+        filter={"email": {"icontains": "email"}},
+        first=8,
+        budget=QueryBudget(expensive_lookups="downgrade", downgraded_first=3),
+    )
+    data = event_loop.run_until_complete(resolver.get_data())
+
+    assert len(data["edges"]) == 3
+    assert data["pageInfo"]["hasNextPage"]
+
+    resolver.extra["budget"] = QueryBudget()
+
+    with pytest.raises(QueryCostError):
+        event_loop.run_until_complete(resolver.get_data())
+
+
+def test_explain_checks_the_ordered_page_query(event_loop, created_data, monkeypatch):
+    explained = []
+
+    async def explain_cost(client, sql, params=None):
+        explained.append(sql)
+        # the planner has to sort every matching row for the ORDER BY
+        return 5000 if "ORDER BY" in sql else 10
+
+    monkeypatch.setattr(budget_module, "explain_cost", explain_cost)
+    resolver = ModelResolver(
+        TestModel,
+        formatter,
+        filter={"trackingNumber": {"gte": 1}},
+        first=5,
+        budget=QueryBudget(explain_max_cost=1000),
+    )
+
+    with pytest.raises(QueryCostError) as e:
+        event_loop.run_until_complete(resolver.get_data())
+
+    assert e.value.extensions["cost"] == 5000
+    assert 'ORDER BY "created" DESC' in explained[0]
+    assert "LIMIT 6" in explained[0]
+
+    resolver.extra["trusted"] = True
+
+    assert len(event_loop.run_until_complete(resolver.get_data())["edges"]) == 5
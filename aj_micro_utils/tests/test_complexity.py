@@ -0,0 +1,139 @@
+from ariadne import QueryType, gql, make_executable_schema
+from graphql import parse, validate
+from starlette.testclient import TestClient
+
+from aj_micro_utils.ariadne.complexity import QueryComplexity
+from aj_micro_utils.ariadne.extension import GraphQLWithBackGroundTasks
+from aj_micro_utils.config import get_settings
+from aj_micro_utils.search_and_filter.input_schemas import (
+    connection_interface,
+    edge_interface,
+    page_info,
+)
+
+type_defs = gql(
+    """
+    type Query {
+        orders(first: Int, after: String): OrderConnection!
+        me: Customer
+    }
+
+    type Customer {
+        name: String
+        friend: Customer
+    }
+
+    type OrderConnection implements Connection {
+        pageInfo: PageInfo!
+        edges: [OrderEdge!]!
+    }
+
+    type OrderEdge implements Edge {
+        cursor: String
+        node: Order!
+    }
+
+    type Order {
+        id: Int!
+        items(first: Int = 20): ItemConnection!
+    }
+
+    type ItemConnection implements Connection {
+        pageInfo: PageInfo!
+        edges: [ItemEdge!]!
+    }
+
+    type ItemEdge implements Edge {
+        cursor: String
+        node: Item!
+    }
+
+    type Item {
+        sku: String!
+    }
+    """
+)
+
+query = QueryType()
+
+
+@query.field("orders")
+def resolve_orders(*_, first=None, after=None):
+    return {"pageInfo": {"hasNextPage": False}, "edges": []}
+
+
+schema = make_executable_schema(
+    [page_info, edge_interface, connection_interface, type_defs], query
+)
+
+NESTED = """
+    query Orders($first: Int) {
+        orders(first: $first) {
+            pageInfo { hasNextPage }
+            edges { node { id items { edges { node { sku } } } } }
+        }
+    }
+"""
+
+
+def measure(complexity, query, variables=None):
+    document = parse(query)
+    fragments = {
+        d.name.value: d for d in document.definitions if d.kind == "fragment_definition"
+    }
+    operation = next(
+        d for d in document.definitions if d.kind == "operation_definition"
+    )
+    return complexity.measure(schema, operation, fragments, variables)
+
+
+def test_connection_pages_multiply_the_cost():
+    complexity = QueryComplexity(max_depth=10, max_cost=1000, default_first=100)
+
+    # orders + pageInfo + first * (edges + node + items + 20 * (edges + node))
+    assert measure(complexity, NESTED, {"first": 5}) == (2 + 5 * (3 + 20 * 2), 7)
+    assert measure(complexity, NESTED)[0] == 2 + 100 * (3 + 20 * 2)
+
+    fragment = """
+        query { orders(first: 2) { ...Page } }
+        fragment Page on OrderConnection { edges { node { id } } }
+    """
+    assert measure(complexity, fragment) == (1 + 2 * 2, 4)
+
+
+def test_rule_rejects_deep_and_expensive_operations():
+    complexity = QueryComplexity(max_depth=4, max_cost=1000, default_first=100)
+
+    errors = validate(schema, parse(NESTED), [complexity.rule])
+    assert len(errors) == 1
+    assert errors[0].extensions["code"] == "QUERY_TOO_EXPENSIVE"
+
+    deep = "{ me { friend { friend { friend { friend { name } } } } } }"
+    assert "depth 6" in validate(schema, parse(deep), [complexity.rule])[0].message
+
+    assert validate(schema, parse("{ me { name } }"), [complexity.rule]) == []
+
+
+def test_cost_is_reported_in_extensions():
+    complexity = QueryComplexity(max_depth=10, max_cost=500, default_first=10)
+    app = GraphQLWithBackGroundTasks(
+        schema, validation_rules=[complexity.rule], extensions=[complexity.extension]
+    )
+
+    response = TestClient(app).post(
+        "/", json={"query": NESTED, "variables": {"first": 2}}
+    )
+
+    assert response.json()["extensions"]["cost"] == {
+        "requested": 2 + 2 * (3 + 20 * 2),
+        "depth": 7,
+        "maxCost": 500,
+        "maxDepth": 10,
+    }
+
+
+def test_the_cost_limit_has_its_own_setting():
+    settings = get_settings()
+
+    assert QueryComplexity().max_cost == settings.graphql_max_cost
+    assert QueryComplexity().max_cost != settings.query_max_cost
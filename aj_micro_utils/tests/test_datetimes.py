@@ -0,0 +1,82 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from aj_micro_utils.cache import MyEncoder
+from aj_micro_utils.datetimes import (
+    format_datetime,
+    parse_datetime,
+    parse_datetime_columns,
+    parse_datetimes,
+)
+from aj_micro_utils.fields import CustomDatetimeField
+from aj_micro_utils.paginator import RelayPaginator
+
+UTC_NOON = datetime(2021, 3, 4, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2021-03-04 12:00:00.000000+00:00",
+        "2021-03-04 12:00:00+00:00",
+        "2021-03-04T12:00:00",
+        "2021-03-04T12:00:00Z",
+        "20210304T140000+0200",
+        b"2021-03-04 13:00:00+01:00",
+        UTC_NOON.timestamp(),
+        datetime(2021, 3, 4, 12, 0),
+    ],
+)
+def test_parse_datetime(value):
+    parsed = parse_datetime(value)
+
+    assert parsed == UTC_NOON
+    assert parsed.tzinfo is not None
+
+
+def test_format_round_trips():
+    tz = timezone(timedelta(hours=2))
+    value = datetime(2021, 3, 4, 14, 0, tzinfo=tz)
+
+    assert format_datetime(value) == "2021-03-04 14:00:00.000000+02:00"
+    assert parse_datetime(format_datetime(value)) == value
+    assert format_datetime(datetime(2021, 3, 4, 12)) == "2021-03-04 12:00:00.000000"
+    assert parse_datetime("2021-03-04 12:00:00", tz=None) == datetime(2021, 3, 4, 12)
+    assert json.dumps(UTC_NOON, cls=MyEncoder) == '"2021-03-04 12:00:00.000000+00:00"'
+
+
+def test_columns_are_parsed_once_per_value():
+    column = parse_datetimes(["2021-03-04T12:00:00Z", None, "2021-03-04T12:00:00Z"])
+    rows = parse_datetime_columns(
+        [{"id": 1, "created": "2021-03-04 12:00:00+00:00"}], ["created", "missing"]
+    )
+
+    assert column == [UTC_NOON, None, UTC_NOON]
+    assert column[0] is column[2]
+    assert rows == [{"id": 1, "created": UTC_NOON}]
+
+
+def test_field_and_cursor_use_the_codec():
+    field = CustomDatetimeField()
+    paginator = RelayPaginator(10, None, "Test", cursor_name="Test")
+    cursor = paginator.get_relay_node_cursor({"created": UTC_NOON}, "created")
+
+    assert field.to_python_value("2021-03-04T12:00:00") == UTC_NOON
+    assert field.to_python_value(int(UTC_NOON.timestamp())) == UTC_NOON
+    assert base64.b64decode(cursor) == b"Test:2021-03-04 12:00:00.000000+00:00"
+    assert paginator.get_orm_cursor_value(cursor, field) == UTC_NOON
+
+
+def test_naive_cursors_stay_naive():
+    paginator = RelayPaginator(10, None, "Test", paginate_on="created")
+    paginator.cursor_name = "Test"
+    naive = datetime(2021, 3, 4, 12, 0)
+
+    cursor = paginator.get_relay_node_cursor({"created": naive}, "created")
+
+    assert base64.b64decode(cursor) == b"Test:2021-03-04 12:00:00.000000"
+    assert paginator.get_cursor_value(cursor) == naive
+    assert paginator.get_cursor_value(cursor).tzinfo is None
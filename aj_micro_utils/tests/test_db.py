@@ -0,0 +1,206 @@
+import pytest
+
+from aj_micro_utils import db
+from aj_micro_utils.config import get_settings
+from aj_micro_utils.paginator import PAGINATOR_MAPPING
+from aj_micro_utils.tests.test_models import TestItem, TestModel
+
+QUERY = "SELECT * FROM test WHERE email = {{ email }}" + PAGINATOR_MAPPING["id"]
+
+
+@pytest.fixture(autouse=True)
+def clear_query_cache():
+    db.clear_query_cache()
+    yield
+    db.clear_query_cache()
+
+
+@pytest.mark.parametrize(
+    "sql, data",
+    [
+        (QUERY, {"email": "a@test.com", "limit": 11, "after": None}),
+        (QUERY, {"email": "b@test.com", "limit": 11, "after": 20}),
+        (QUERY, {"email": None, "limit": 0, "after": 5}),
+        ("SELECT {{ value | upper }}", {"value": "a"}),
+        ("SELECT * FROM test WHERE id IN {{ ids | inclause }}", {"ids": [1, 2]}),
+        (
+            "SELECT * {% if status == 'open' %}WHERE open{% endif %}",
+            {"status": "open"},
+        ),
+    ],
+)
+def test_prepare_query_matches_jinjasql(sql, data):
+    expected = db.j.prepare_query(sql, data)
+
+    # first call renders, the second one comes from the cache when possible
+    assert db.prepare_query(sql, data) == expected
+    assert db.prepare_query(sql, data) == expected
+
+
+def test_prepare_query_reuses_rendered_query_for_shape():
+    query, params = db.prepare_query(QUERY, {"email": "a", "limit": 11, "after": 3})
+    cached_query, cached_params = db.prepare_query(
+        QUERY, {"email": "b", "limit": 21, "after": 7}
+    )
+
+    assert query is cached_query
+    assert params == ["a", 3, 11]
+    assert cached_params == ["b", 7, 21]
+
+
+@pytest.mark.parametrize(
+    "sql, expected",
+    [
+        (QUERY, True),
+        ("SELECT {% if a is none %}1{% endif %}", True),
+        ("SELECT {{ value | upper }}", False),
+        ("SELECT {{ value | sqlsafe }}", False),
+        ("SELECT {% if a == 1 %}1{% endif %}", False),
+        ("{% for a in b %}{{ a }}{% endfor %}", False),
+    ],
+)
+def test_can_cache_rendered(sql, expected):
+    assert db.can_cache_rendered(sql) == expected
+
+
+class FakeConnection:
+    def __init__(self):
+        self.prepared = []
+
+    async def prepare(self, query):
+        self.prepared.append(query)
+        return object()
+
+
+class FakeProxy:
+    def __init__(self, conn):
+        self._con = conn
+
+    async def prepare(self, query):
+        return await self._con.prepare(query)
+
+
+def test_get_prepared_statement_reused_per_connection(event_loop):
+    conn = FakeConnection()
+
+    first = event_loop.run_until_complete(
+        db.get_prepared_statement(FakeProxy(conn), "SELECT 1")
+    )
+    second = event_loop.run_until_complete(
+        db.get_prepared_statement(FakeProxy(conn), "SELECT 1")
+    )
+    other = event_loop.run_until_complete(
+        db.get_prepared_statement(FakeConnection(), "SELECT 1")
+    )
+
+    assert first is second
+    assert first is not other
+    assert conn.prepared == ["SELECT 1"]
+
+
+postgres = pytest.mark.skipif(
+    not get_settings().database_url.startswith("postgres"),
+    reason="needs asyncpg",
+)
+
+ITEM_COLUMNS = ["id", "sku", "quantity", "parent_id"]
+
+
+@postgres
+def test_bulk_insert_copies_the_records(event_loop, created_data):
+    async def run():
+        parent = await TestModel.first()
+        records = [(i, f"sku {i}", i, parent.id) for i in range(1, 4)]
+
+        copied = await db.bulk_insert("testitem", records, ITEM_COLUMNS)
+
+        return copied, await TestItem.all().order_by("id").values_list("sku", flat=True)
+
+    copied, skus = event_loop.run_until_complete(run())
+
+    assert copied == 3
+    assert skus == ["sku 1", "sku 2", "sku 3"]
+
+
+@postgres
+def test_bulk_upsert_updates_the_conflicting_rows(event_loop, created_data):
+    async def run():
+        parent = await TestModel.first()
+        await TestItem.create(id=1, sku="old", quantity=1, parent=parent)
+
+        upserted = await db.bulk_upsert(
+            "testitem",
+            [(1, "new", 5, parent.id), (2, "added", 2, parent.id)],
+            ITEM_COLUMNS,
+            conflict_columns=["id"],
+            schema_name="public",
+        )
+
+        return upserted, await TestItem.all().order_by("id").values_list(
+            "sku", "quantity"
+        )
+
+    upserted, rows = event_loop.run_until_complete(run())
+
+    assert upserted == 2
+    assert rows == [("new", 5), ("added", 2)]
+
+
+@postgres
+def test_bulk_upsert_can_skip_the_conflicting_rows(event_loop, created_data):
+    async def run():
+        parent = await TestModel.first()
+        await TestItem.create(id=1, sku="old", quantity=1, parent=parent)
+
+        upserted = await db.bulk_upsert(
+            "testitem",
+            [(1, "new", 5, parent.id), (2, "added", 2, parent.id)],
+            ITEM_COLUMNS,
+            conflict_columns=["id"],
+            update_columns=[],
+        )
+
+        return upserted, await TestItem.all().order_by("id").values_list(
+            "sku", flat=True
+        )
+
+    upserted, skus = event_loop.run_until_complete(run())
+
+    assert upserted == 1
+    assert skus == ["old", "added"]
+
+
+@postgres
+def test_executemany_runs_every_row(event_loop, created_data):
+    async def run():
+        parent = await TestModel.first()
+        await db.executemany(
+            "INSERT INTO testitem (sku, quantity, parent_id) VALUES ($1, $2, $3)",
+            [("a", 1, parent.id), ("b", 2, parent.id)],
+        )
+
+        return await TestItem.all().order_by("id").values_list("sku", flat=True)
+
+    assert event_loop.run_until_complete(run()) == ["a", "b"]
+
+
+@postgres
+def test_fetch_records_reuses_the_prepared_statement(event_loop, created_data):
+    sql = "SELECT email FROM testmodel WHERE tracking_number = {{ number }}"
+
+    async def run():
+        first = await db.fetch_records(sql, number=1)
+        second = await db.fetch_records(sql, number=2)
+
+        return first, second
+
+    first, second = event_loop.run_until_complete(run())
+    query, _ = db.prepare_query(sql, {"number": 1})
+    statements = [
+        cached[query] for cached in db._prepared_statements.values() if query in cached
+    ]
+
+    assert [record["email"] for record in first] == ["email1@test.com"]
+    assert [record["email"] for record in second] == ["email2@test.com"]
+    # the pool hands back the last released connection
+    assert len(statements) == 1
@@ -0,0 +1,84 @@
+from ariadne import QueryType, gql, make_executable_schema
+from starlette.testclient import TestClient
+
+from aj_micro_utils.ariadne.documents import DocumentCache, query_hash
+from aj_micro_utils.ariadne.extension import GraphQLWithBackGroundTasks
+
+type_defs = gql(
+    """
+    type Query {
+        hello(name: String): String
+    }
+    """
+)
+
+query = QueryType()
+
+
+@query.field("hello")
+def resolve_hello(_, info, name="world"):
+    return f"Hello {name}"
+
+
+schema = make_executable_schema(type_defs, query)
+
+HELLO = "query Hello($name: String) { hello(name: $name) }"
+
+
+def persisted(sha256_hash: str) -> dict:
+    return {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}
+
+
+def test_documents_are_parsed_and_validated_once():
+    cache = DocumentCache()
+    cached = cache.get(HELLO)
+
+    assert cache.get(HELLO) is cached
+    assert cache.validate(cached, schema) == []
+    assert (
+        cache.validate(cached, schema)
+        is cached.validation[next(iter(cached.validation))]
+    )
+
+    invalid = cache.get("{ goodbye }")
+    assert len(cache.validate(invalid, schema)) == 1
+
+
+def test_least_recently_used_documents_are_evicted():
+    cache = DocumentCache(size=2)
+    cache.warm(schema, [HELLO])
+
+    for name in ("a", "b", "c"):
+        cache.get(f'{{ hello(name: "{name}") }}')
+
+    assert len(cache) == 3
+    assert cache.lookup(query_hash(HELLO)) is not None
+    assert cache.lookup(query_hash('{ hello(name: "a") }')) is None
+
+
+def test_app_executes_cached_and_persisted_queries():
+    app = GraphQLWithBackGroundTasks(schema, known_queries=[HELLO])
+    client = TestClient(app)
+
+    response = client.post(
+        "/",
+        json={"variables": {"name": "you"}, "extensions": persisted(query_hash(HELLO))},
+    )
+    assert response.json() == {"data": {"hello": "Hello you"}}
+
+    unknown = "{ hello }"
+    response = client.post("/", json={"extensions": persisted(query_hash(unknown))})
+    assert response.json()["errors"][0]["message"] == "PersistedQueryNotFound"
+
+    response = client.post(
+        "/", json={"query": unknown, "extensions": persisted(query_hash(unknown))}
+    )
+    assert response.json() == {"data": {"hello": "Hello world"}}
+
+    response = client.post("/", json={"extensions": persisted(query_hash(unknown))})
+    assert response.json() == {"data": {"hello": "Hello world"}}
+
+    response = client.post(
+        "/", json={"query": unknown, "extensions": persisted(query_hash(HELLO))}
+    )
+    assert response.status_code == 400
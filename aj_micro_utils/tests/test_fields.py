@@ -0,0 +1,132 @@
+import json
+from array import array
+from ipaddress import ip_address, ip_interface
+
+import pytest
+from pypika import Table
+from tortoise import fields
+from tortoise.exceptions import FieldError
+from tortoise.models import Model
+
+from aj_micro_utils.ariadne.renderers import dumps
+from aj_micro_utils.fields import (
+    ArrayIntField,
+    CustomJSONField,
+    InetField,
+    LazyJSON,
+    add_field_filters,
+    encode_db_json,
+)
+from aj_micro_utils.search_and_filter.queries import get_orm_lookup
+
+RAW = '{"sizes": [1, 2, 3], "name": "naïve"}'
+
+
+def test_lazy_values_are_decoded_on_first_access():
+    field = CustomJSONField(lazy=True)
+    value = field.to_python_value(RAW)
+
+    assert isinstance(value, LazyJSON)
+    assert not value.decoded
+    assert field.to_db_value(value, None) == RAW
+
+    assert value["sizes"] == [1, 2, 3]
+    assert value.decoded
+    assert value == json.loads(RAW)
+
+    value["name"] = "changed"
+    assert json.loads(field.to_db_value(value, None))["name"] == "changed"
+
+
+def test_eager_values_and_validation():
+    field = CustomJSONField()
+
+    assert field.to_python_value(RAW) == json.loads(RAW)
+    assert field.to_python_value(LazyJSON(RAW.encode())) == json.loads(RAW)
+    assert field.to_db_value(RAW, None) == RAW
+    assert json.loads(field.to_db_value({1: "a"}, None)) == {"1": "a"}
+
+    with pytest.raises(FieldError):
+        field.to_db_value("{not json", None)
+
+
+def test_undecoded_values_are_rendered_raw():
+    value = LazyJSON(RAW)
+
+    assert json.loads(dumps({"data": value})) == {"data": json.loads(RAW)}
+    assert not value.decoded
+    assert encode_db_json(value) == RAW
+    assert encode_db_json({"a": 1}) == '{"a":1}'
+
+
+class TaggedModel(Model):
+    id = fields.IntField(pk=True)
+    tags = ArrayIntField(compact_size=3)
+    address = InetField(null=True)
+
+
+add_field_filters(TaggedModel)
+
+
+def test_large_arrays_are_compact():
+    field = TaggedModel._meta.fields_map["tags"]
+
+    assert ArrayIntField().to_python_value(list(range(1000))) == list(range(1000))
+    assert field.to_python_value([1, 2]) == [1, 2]
+    assert field.to_python_value([1, 2, 3]) == array("i", [1, 2, 3])
+    assert field.to_db_value(array("i", [1, 2, 3]), None) == [1, 2, 3]
+    assert json.loads(dumps({"tags": array("i", [1, 2, 3])})) == {"tags": [1, 2, 3]}
+
+
+@pytest.mark.parametrize(
+    "lookup, value, expected",
+    [
+        ({"contains": [1, 2]}, [1, 2], "\"tags\"@>'{1,2}'::integer[]"),
+        ({"containedBy": (3,)}, [3], "\"tags\"<@'{3}'::integer[]"),
+        ({"overlap": array("i", [4, 5])}, [4, 5], "\"tags\"&&'{4,5}'::integer[]"),
+        ({"any": 6}, [6], "\"tags\"@>'{6}'::integer[]"),
+    ],
+)
+def test_array_lookups(lookup, value, expected):
+    ((key, raw),) = get_orm_lookup("tags", lookup).items()
+    param = TaggedModel._meta._filters[key]
+    field = TaggedModel._meta.fields_map["tags"]
+
+    encoded = param["value_encoder"](raw, TaggedModel, field)
+    criterion = param["operator"](Table("tagged")[param["source_field"]], encoded)
+
+    assert encoded == value
+    assert criterion.get_sql(quote_char='"') == expected
+
+
+def test_inet_values_are_parsed_once():
+    field = TaggedModel._meta.fields_map["address"]
+
+    assert field.to_python_value("10.1.2.3") == ip_address("10.1.2.3")
+    assert field.to_python_value("10.1.2.3") is field.to_python_value("10.1.2.3")
+    assert field.to_python_value("10.0.0.0/8") == ip_interface("10.0.0.0/8")
+    assert field.to_db_value(ip_address("::1"), None) == "::1"
+    assert json.loads(dumps([ip_address("10.1.2.3")])) == ["10.1.2.3"]
+
+    with pytest.raises(FieldError):
+        field.to_db_value("10.0.0.300", None)
+
+
+@pytest.mark.parametrize(
+    "lookup, expected",
+    [
+        ({"within": "10.0.0.0/8"}, "\"address\"<<'10.0.0.0/8'::inet"),
+        ({"withinOrEqual": "10.0.0.0/8"}, "\"address\"<<='10.0.0.0/8'::inet"),
+        ({"containsOrEqual": "10.1.2.3"}, "\"address\">>='10.1.2.3'::inet"),
+        ({"overlap": ip_interface("::1/64")}, "\"address\"&&'::1/64'::inet"),
+    ],
+)
+def test_inet_lookups(lookup, expected):
+    ((key, raw),) = get_orm_lookup("address", lookup).items()
+    param = TaggedModel._meta._filters[key]
+    field = TaggedModel._meta.fields_map["address"]
+
+    encoded = param["value_encoder"](raw, TaggedModel, field)
+    criterion = param["operator"](Table("tagged")[param["source_field"]], encoded)
+
+    assert criterion.get_sql(quote_char='"') == expected
@@ -0,0 +1,143 @@
+from aj_micro_utils import index_advisor
+from aj_micro_utils.index_advisor import UsageRecorder, advise, parse_usage
+from aj_micro_utils.search_and_filter.queries import (
+    ModelResolver,
+    get_filter_shape,
+    get_filter_usage,
+)
+from aj_micro_utils.search_and_filter.search_backends import TrigramSearchBackend
+from aj_micro_utils.tests.test_fields import TaggedModel
+from aj_micro_utils.tests.test_models import TestModel, formatter
+
+
+def record(**kwargs):
+    resolver = ModelResolver(TestModel, formatter, **kwargs)
+    resolver.record_usage(resolver.paginator)
+
+
+def test_usage_is_only_recorded_when_enabled():
+    UsageRecorder.setup(enabled=False)
+    record(filter={"email": {"eq": "a"}})
+
+    assert UsageRecorder.counts() == {}
+
+
+def test_usage_recorder_counts_filters_search_and_sort():
+    UsageRecorder.setup()
+    record(filter={"email": {"eq": "a"}, "items": {"sku": {"icontains": "A"}}})
+    record(filter={"email": {"eq": "b"}})
+    record(search="term", search_backend=TrigramSearchBackend())
+
+    assert UsageRecorder.counts() == {
+        "TestModel|testmodel|email|eq|created": 2,
+        "TestModel|testmodel|created|order|": 2,
+        "TestItem|testitem|parent_id|in|": 1,
+        "TestItem|testitem|sku|icontains|": 1,
+        "TestModel|testmodel|model_name|trigram|": 1,
+        "TestModel|testmodel|email|trigram|": 1,
+        "TestModel|testmodel|reference|trigram|": 1,
+    }
+
+    UsageRecorder.setup(enabled=False)
+
+
+def test_flush_keeps_counts_when_redis_fails(event_loop):
+    flushed = {}
+
+    async def hincrby(key, field, increment=1):
+        if field.startswith("fail"):
+            raise ConnectionError("redis is down")
+        flushed[field] = increment
+
+    original = index_advisor.redis_hincrby
+    index_advisor.redis_hincrby = hincrby
+
+    try:
+        UsageRecorder.setup()
+        UsageRecorder.record(["a|t|c|eq|", "a|t|c|eq|", "fail|t|c|eq|"])
+        event_loop.run_until_complete(UsageRecorder.flush())
+    finally:
+        index_advisor.redis_hincrby = original
+
+    assert flushed == {"a|t|c|eq|": 2}
+    assert UsageRecorder.counts() == {"fail|t|c|eq|": 1}
+
+    UsageRecorder.setup(enabled=False)
+
+
+def test_advise_ranks_uncovered_indexes():
+    usage = parse_usage(
+        {
+            b"Order|order|status|eq|created": b"30",
+            b"Order|order|created|order|": b"30",
+            b"Order|order|email|icontains|": b"4",
+            b"Order|order|id|eq|": b"100",
+            b"Order|order|status|neq|": b"50",
+        }
+    )
+    existing = {
+        "order": [
+            ("btree", "id"),
+            ("btree", "created DESC"),
+        ]
+    }
+
+    proposals = advise(usage, existing)
+
+    assert [p.sql for p in proposals] == [
+        'CREATE INDEX IF NOT EXISTS "order_email_trgm_idx" '
+        'ON "order" USING GIN ("email" gin_trgm_ops)',
+        'CREATE INDEX IF NOT EXISTS "order_status_created_idx" '
+        'ON "order" ("status", "created")',
+    ]
+    assert proposals[0].benefit == 200
+
+
+def test_array_lookups_get_a_gin_index():
+    shape = get_filter_shape({"tags": {"contains": [1], "overlap": [2], "any": 3}})
+
+    assert [operator for _, _, operator in get_filter_usage(TaggedModel, shape)] == [
+        "array.contains",
+        "array.overlap",
+        "array.any",
+    ]
+
+    usage = parse_usage(
+        {
+            b"Tagged|tagged|tags|array.contains|": b"3",
+            b"Tagged|tagged|tags|array.containedBy|": b"1",
+            b"Other|other|tags|array.overlap|": b"1",
+        }
+    )
+    existing = {"other": [("gin", "tags")]}
+
+    assert [p.sql for p in advise(usage, existing)] == [
+        'CREATE INDEX IF NOT EXISTS "tagged_tags_gin_idx" '
+        'ON "tagged" USING GIN ("tags")',
+    ]
+
+
+def test_inet_lookups_get_a_gist_index():
+    shape = get_filter_shape({"address": {"within": "10.0.0.0/8", "overlap": "::/0"}})
+
+    assert [operator for _, _, operator in get_filter_usage(TaggedModel, shape)] == [
+        "inet.within",
+        "inet.overlap",
+    ]
+
+    usage = parse_usage(
+        {
+            b"Tagged|tagged|address|inet.withinOrEqual|": b"2",
+            b"Tagged|tagged|address|inet.containsOrEqual|": b"1",
+            b"Other|other|address|inet.within|": b"1",
+        }
+    )
+    existing = {"other": [("gist", "address inet_ops")]}
+
+    proposals = advise(usage, existing)
+
+    assert [p.sql for p in proposals] == [
+        'CREATE INDEX IF NOT EXISTS "tagged_address_gist_idx" '
+        'ON "tagged" USING GIST ("address" inet_ops)',
+    ]
+    assert proposals[0].benefit == 150
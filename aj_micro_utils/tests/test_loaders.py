@@ -0,0 +1,146 @@
+import asyncio
+import uuid
+
+import pytest
+from tortoise.functions import Coalesce
+
+from aj_micro_utils.query_monitor import QueryMonitor
+from aj_micro_utils.search_and_filter.loaders import get_connection_loader
+from aj_micro_utils.search_and_filter.queries import ModelResolver
+from aj_micro_utils.search_and_filter.search_backends import SearchBackend
+from aj_micro_utils.tests.test_models import TestItem, TestItemTag, TestModel
+
+
+class TagSearchBackend(SearchBackend):
+    """Items with a tag starting with the term, joined so rows multiply,
+    ranked by their quantity
+    """
+
+    rank_field = "search_rank"
+
+    def search_queryset(self, model, search, qs=None):
+        return (
+            (qs or model.all())
+            .filter(tags__name__startswith=search)
+            .distinct()
+            .annotate(search_rank=Coalesce("quantity", 0))
+        )
+
+
+def item_formatter(obj: "TestItem") -> dict:
+    return {"id": obj.id, "sku": obj.sku}
+
+
+@pytest.fixture
+def parents(event_loop):
+    async def create():
+        parents = []
+        for i in range(3):
+            parent = await TestModel.create(
+                model_name=f"name {i}",
+                email=f"email{i}@test.com",
+                reference=f"reference {i}",
+                tracking_number=i,
+                uuid_field=uuid.uuid4(),
+            )
+            for j in range(i * 2):
+                await TestItem.create(sku=f"{i}-{j}", parent=parent)
+            parents.append(parent)
+        return parents
+
+    return event_loop.run_until_complete(create())
+
+
+def test_connections_are_loaded_in_one_query(event_loop, parents):
+    records = []
+    QueryMonitor.reset()
+    QueryMonitor.add_hook(records.append)
+    context = {}
+
+    async def resolve(parent):
+        loader = get_connection_loader(
+            context, TestItem, item_formatter, "parent", first=2
+        )
+        return await loader.load(parent.id)
+
+    async def resolve_all():
+        return await asyncio.gather(*[resolve(parent) for parent in parents])
+
+    try:
+        connections = event_loop.run_until_complete(resolve_all())
+    finally:
+        QueryMonitor._hooks.remove(records.append)
+
+    assert len(records) == 1
+    assert "ROW_NUMBER() OVER(PARTITION BY" in records[0]["sql"]
+    assert len(context["connection_loaders"]) == 1
+
+    assert [len(c["edges"]) for c in connections] == [0, 2, 2]
+    assert [c["pageInfo"]["hasNextPage"] for c in connections] == [False, False, True]
+    assert [e["node"]["sku"] for e in connections[2]["edges"]] == ["2-3", "2-2"]
+
+
+def test_connections_match_the_model_resolver(event_loop, parents):
+    parent = parents[2]
+    context = {}
+    loader = get_connection_loader(
+        context, TestItem, item_formatter, "parent_id", first=1
+    )
+
+    async def load(loader):
+        return await loader.load(parent.id)
+
+    first_page = event_loop.run_until_complete(load(loader))
+
+    expected = event_loop.run_until_complete(
+        ModelResolver(TestItem, item_formatter, first=1).get_data(
+            TestItem.filter(parent_id=parent.id)
+        )
+    )
+    assert first_page == expected
+
+    after = first_page["pageInfo"]["endCursor"]
+    loader = get_connection_loader(
+        context, TestItem, item_formatter, "parent_id", first=2, after=after
+    )
+    next_page = event_loop.run_until_complete(load(loader))
+
+    assert [e["node"]["sku"] for e in next_page["edges"]] == ["2-2", "2-1"]
+    assert next_page["pageInfo"]["hasNextPage"]
+
+
+def test_ranked_and_joined_children_are_numbered_once(event_loop, parents):
+    parent = parents[2]
+
+    async def tag():
+        for item in await TestItem.filter(parent_id=parent.id):
+            item.quantity = 1 if item.sku in ("2-0", "2-3") else 2
+            await item.save()
+            for name in ("red", "rose"):
+                await TestItemTag.create(name=name, item=item)
+
+    event_loop.run_until_complete(tag())
+
+    async def load(loader):
+        return await loader.load(parent.id)
+
+    def load_page(after=None):
+        loader = get_connection_loader(
+            {},
+            TestItem,
+            item_formatter,
+            "parent_id",
+            first=3,
+            after=after,
+            search="r",
+            search_backend=TagSearchBackend(),
+        )
+        return event_loop.run_until_complete(load(loader))
+
+    first_page = load_page()
+    next_page = load_page(first_page["pageInfo"]["endCursor"])
+
+    assert [e["node"]["sku"] for e in first_page["edges"]] == ["2-2", "2-1", "2-3"]
+    assert first_page["pageInfo"]["hasNextPage"]
+    assert [e["node"]["sku"] for e in next_page["edges"]] == ["2-0"]
+    assert not next_page["pageInfo"]["hasNextPage"]
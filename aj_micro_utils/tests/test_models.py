@@ -26,3 +26,23 @@ def formatter(obj: "TestModel") -> dict:
         "trackingNumber": obj.tracking_number,
         "uuidField": obj.uuid_field,
     }
+
+
+class TestItem(models.Model):
+    class Meta:
+        paginate_on = "id"
+
+    __test__ = False
+
+    id = fields.IntField(pk=True)
+    sku = fields.CharField(max_length=64)
+    quantity = fields.IntField(default=1)
+    parent = fields.ForeignKeyField("models.TestModel", related_name="items")
+
+
+class TestItemTag(models.Model):
+    __test__ = False
+
+    id = fields.IntField(pk=True)
+    name = fields.CharField(max_length=64)
+    item = fields.ForeignKeyField("models.TestItem", related_name="tags")
@@ -0,0 +1,135 @@
+import pytest
+from ariadne import QueryType, gql, make_executable_schema
+from graphql import graphql
+
+from aj_micro_utils.query_monitor import QueryMonitor
+from aj_micro_utils.search_and_filter.projection import _projection_plans
+from aj_micro_utils.search_and_filter.queries import ModelResolver
+from aj_micro_utils.tests.test_models import TestItem, TestModel, formatter
+
+type_defs = gql(
+    """
+    type Query {
+        models(first: Int): TestModelConnection
+        modelsWithItemCount(first: Int): TestModelConnection
+    }
+    type TestModelConnection {
+        edges: [TestModelEdge]
+    }
+    type TestModelEdge {
+        cursor: String
+        node: TestModel
+    }
+    type TestModel {
+        id: Int
+        modelName: String
+        email: String
+        reference: String
+        trackingNumber: Int
+        uuidField: String
+        displayName: String
+        itemCount: Int
+        items: [TestItem]
+    }
+    type TestItem {
+        sku: String
+    }
+    """
+)
+
+query = QueryType()
+
+
+@query.field("models")
+async def resolve_models(_, info, first=None):
+    def format_with_items(obj):
+        data = formatter(obj)
+        data["displayName"] = (obj.model_name or "").title()
+        if obj.items._fetched:
+            data["items"] = [{"sku": item.sku} for item in obj.items]
+        return data
+
+    return await ModelResolver(
+        TestModel, format_with_items, first=first, info=info, prefetch=["items"]
+    ).get_data()
+
+
+@query.field("modelsWithItemCount")
+async def resolve_models_with_item_count(_, info, first=None):
+    def format_with_item_count(obj):
+        # reads the prefetched relation without items being selected
+        return {**formatter(obj), "itemCount": len(obj.items)}
+
+    return await ModelResolver(
+        TestModel, format_with_item_count, first=first, info=info, prefetch=["items"]
+    ).get_data()
+
+
+schema = make_executable_schema(type_defs, query)
+
+
+@pytest.fixture
+def records():
+    records = []
+    _projection_plans.clear()
+    QueryMonitor.reset()
+    QueryMonitor.add_hook(records.append)
+    yield records
+    QueryMonitor._hooks.remove(records.append)
+
+
+def run(event_loop, source: str) -> dict:
+    result = event_loop.run_until_complete(graphql(schema, source))
+    assert result.errors is None, result.errors
+    return result.data
+
+
+def test_only_selected_columns_are_fetched(event_loop, created_data, records):
+    data = run(event_loop, "{ models(first: 2) { edges { node { id modelName } } } }")
+
+    assert data["models"]["edges"][0]["node"] == {"id": 10, "modelName": "name 9"}
+    assert len(records) == 1
+    assert '"email"' not in records[0]["sql"]
+    assert '"model_name"' in records[0]["sql"]
+    assert '"created"' in records[0]["sql"]
+
+
+def test_fragments_and_relations_are_planned(event_loop, created_data, records):
+    source = """
+        { models(first: 1) { edges { node { ...Fields items { sku } } } } }
+        fragment Fields on TestModel { email }
+    """
+    data = run(event_loop, source)
+    run(event_loop, source)
+
+    assert data["models"]["edges"][0]["node"] == {
+        "email": "email9@test.com",
+        "items": [],
+    }
+    assert len(_projection_plans) == 1
+
+    plan = list(_projection_plans.values())[0]
+    assert plan.fields == ("id", "email", "created")
+    assert plan.prefetch == ("items",)
+
+
+def test_unmapped_fields_select_every_column(event_loop, created_data, records):
+    source = "{ models(first: 1) { edges { cursor node { id displayName } } } }"
+    data = run(event_loop, source)
+
+    assert data["models"]["edges"][0]["node"] == {"id": 10, "displayName": "Name 9"}
+
+    plan = list(_projection_plans.values())[0]
+    assert plan.fields is None
+    assert plan.prefetch == ()
+
+
+def test_static_prefetch_is_kept_for_unmapped_fields(event_loop, created_data, records):
+    parent = event_loop.run_until_complete(TestModel.get(id=10))
+    event_loop.run_until_complete(TestItem.create(sku="A1", parent=parent))
+
+    source = "{ modelsWithItemCount(first: 1) { edges { node { id itemCount } } } }"
+    data = run(event_loop, source)
+
+    assert data["modelsWithItemCount"]["edges"][0]["node"] == {"id": 10, "itemCount": 1}
+    assert list(_projection_plans.values())[0].fields is None
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from aj_micro_utils.query_monitor import (
+    LatencyHistogram,
+    QueryMonitor,
+    fingerprint,
+    get_queryset_shape,
+    time_queryset,
+)
+from aj_micro_utils.tests.test_models import TestModel
+
+
+@pytest.fixture
+def records():
+    records = []
+    QueryMonitor.reset()
+    QueryMonitor.add_hook(records.append)
+    yield records
+    QueryMonitor._hooks.remove(records.append)
+
+
+def test_latency_histogram_buckets():
+    histogram = LatencyHistogram()
+
+    for duration in (0.5, 3, 3, 7000):
+        histogram.observe(duration)
+
+    data = histogram.as_dict()
+
+    assert data["count"] == 4
+    assert data["max_ms"] == 7000
+    assert data["buckets"]["1"] == 1
+    assert data["buckets"]["5"] == 2
+    assert data["buckets"]["+Inf"] == 1
+
+
+def test_get_data_is_timed_and_tagged(
+    created_data, initialize_model_resolver, event_loop, records
+):
+    event_loop.run_until_complete(initialize_model_resolver.get_data())
+
+    shape = records[0]["shape"]
+
+    assert len(records) == 1
+    assert shape.startswith("orm:TestModel:")
+    assert records[0]["tags"] == {"model": "TestModel", "typename": "TestModel"}
+    assert "testmodel" in records[0]["sql"]
+    assert QueryMonitor.histograms()[shape]["count"] == 1
+
+
+def test_fingerprint_ignores_the_values():
+    assert fingerprint("SELECT * FROM t1 WHERE a = 'x' AND b IN (1, 2)") == (
+        fingerprint("SELECT * FROM t1 WHERE a = 'y''s'  AND b IN (3)")
+    )
+    assert fingerprint("SELECT * FROM t1 WHERE a = 1") != (
+        fingerprint("SELECT * FROM t1 WHERE b = 1")
+    )
+
+
+def test_orm_queries_are_bucketed_per_shape(created_data, event_loop, records):
+    async def run():
+        await time_queryset(TestModel.filter(email="email1@test.com"))
+        await time_queryset(TestModel.filter(email="email2@test.com"))
+        await time_queryset(TestModel.filter(tracking_number=1))
+
+    event_loop.run_until_complete(run())
+    histograms = QueryMonitor.histograms()
+
+    assert len(histograms) == 2
+    assert all(shape.startswith("orm:TestModel:") for shape in histograms)
+    assert sorted(h["count"] for h in histograms.values()) == [1, 2]
+
+
+def test_queryset_shape_ignores_the_values():
+    first = TestModel.filter(email="a").order_by("-created").limit(11)
+    second = TestModel.filter(email="b").order_by("-created").limit(21)
+
+    assert get_queryset_shape(first) == get_queryset_shape(second)
+    assert get_queryset_shape(first) != get_queryset_shape(first.offset(10))
+    assert get_queryset_shape(first) != get_queryset_shape(
+        TestModel.filter(email="a").order_by("-id").limit(11)
+    )
+
+
+def test_fast_orm_queries_are_not_rendered(created_data, event_loop, monkeypatch):
+    rendered = []
+    monkeypatch.setattr(QueryMonitor, "_hooks", [])
+    monkeypatch.setattr(QueryMonitor, "_slow_ms", 10000)
+    QueryMonitor.reset()
+
+    async def run():
+        queryset = TestModel.filter(email="email1@test.com")
+        await time_queryset(queryset)
+
+        query_class = type(queryset.query)
+        get_sql = query_class.get_sql
+
+        def counting_get_sql(self, *args, **kwargs):
+            rendered.append(self)
+            return get_sql(self, *args, **kwargs)
+
+        monkeypatch.setattr(query_class, "get_sql", counting_get_sql)
+        await time_queryset(TestModel.filter(email="email2@test.com"))
+
+    event_loop.run_until_complete(run())
+
+    # only the executor renders the query
+    assert len(rendered) == 1
+    assert [h["count"] for h in QueryMonitor.histograms().values()] == [2]
+
+
+class SlowClient:
+    def __init__(self):
+        self.done = asyncio.Event()
+
+    async def execute_query_dict(self, sql, params=None):
+        await self.done.wait()
+        return [{"QUERY PLAN": []}]
+
+
+def test_explain_tasks_are_kept_until_done(event_loop, monkeypatch):
+    monkeypatch.setattr(QueryMonitor, "_slow_ms", 0)
+    monkeypatch.setattr(QueryMonitor, "_explain_sample_rate", 1.0)
+
+    async def run():
+        client = SlowClient()
+        QueryMonitor.record(1, "SELECT 1", client=client)
+        running = set(QueryMonitor._explain_tasks)
+
+        client.done.set()
+        await asyncio.gather(*running)
+
+        return running
+
+    running = event_loop.run_until_complete(run())
+
+    assert len(running) == 1
+    assert not QueryMonitor._explain_tasks
@@ -0,0 +1,109 @@
+import asyncio
+
+from arq.connections import ArqRedis
+
+from aj_micro_utils.arq import Arq
+from aj_micro_utils.redis import Redis, RedisConnections
+
+
+class FakeConnection:
+    _encoding = None
+
+
+class FakePool:
+    size = 2
+    freesize = 1
+    maxsize = 10
+    encoding = None
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.encodings = []
+        self.connection = FakeConnection()
+
+    async def _run(self, command, args):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return (command, args)
+
+    def execute(self, command, *args, **kwargs):
+        self.encodings.append(kwargs.get("encoding"))
+        return self._run(command, args)
+
+    async def acquire(self, command=None, args=()):
+        return self.connection
+
+    def release(self, conn):
+        pass
+
+
+def test_purposes_share_the_pool_within_their_limit(event_loop):
+    pool = FakePool()
+
+    async def run():
+        RedisConnections._pool = pool
+        RedisConnections._limits = {"arq": 1}
+        RedisConnections._purposes = {}
+
+        await Redis.setup()
+        await Arq.setup()
+
+        assert isinstance(Arq._redis, ArqRedis)
+        assert RedisConnections.pool("arq")._pool is pool
+        assert RedisConnections.pool("cache")._pool is pool
+
+        arq = RedisConnections.pool("arq")
+        await asyncio.gather(*[arq.execute("zadd", i) for i in range(3)])
+        assert pool.peak == 1
+
+        pool.peak = 0
+        await asyncio.gather(*[Redis.get(f"key{i}") for i in range(3)])
+        assert pool.peak == 3
+
+        async with arq.get() as conn:
+            assert conn is pool.connection
+            assert conn._encoding == "utf8"
+            assert arq.stats()["in_flight"] == 1
+
+        assert pool.connection._encoding is None
+        assert Arq._redis.encoding == "utf8"
+
+        pool.encodings = []
+        await arq.execute("get", "key")
+        await arq.execute("get", "key", encoding=None)
+        await RedisConnections.pool("cache").execute("get", "key")
+        assert pool.encodings == ["utf8", None, None]
+
+    try:
+        event_loop.run_until_complete(run())
+    finally:
+        RedisConnections._pool = None
+        RedisConnections._limits = {}
+        RedisConnections._purposes = {}
+        Redis._pool = Arq._redis = None
+        Redis._shared = False
+
+    assert RedisConnections.stats() == {"pools": {}, "purposes": {}}
+
+
+def test_stats():
+    RedisConnections._pool = FakePool()
+    RedisConnections._limits = {"arq": 4}
+
+    try:
+        RedisConnections.pool("arq")
+        stats = RedisConnections.stats()
+    finally:
+        RedisConnections._pool = None
+        RedisConnections._limits = {}
+        RedisConnections._purposes = {}
+
+    assert stats == {
+        "pools": {
+            "default": {"size": 2, "in_use": 1, "idle": 1, "maxsize": 10, "waiters": 0}
+        },
+        "purposes": {"arq": {"in_flight": 0, "waiters": 0, "limit": 4}},
+    }
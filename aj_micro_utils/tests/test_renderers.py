@@ -0,0 +1,63 @@
+import json
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from starlette.responses import StreamingResponse
+
+from aj_micro_utils.ariadne.renderers import (
+    JSONRenderer,
+    ORJSONRenderer,
+    ResponseRenderer,
+    dumps,
+    iter_chunks,
+)
+
+PAYLOAD = {
+    "data": {
+        "orders": {
+            "edges": [
+                {"cursor": f"T3JkZXI6{i}", "node": {"id": i, "name": "naïve"}}
+                for i in range(100)
+            ],
+            "pageInfo": {"hasNextPage": True, "endCursor": None},
+        }
+    }
+}
+
+
+def test_dumps_native_types():
+    value = uuid.uuid4()
+    created = datetime(2021, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+    assert json.loads(
+        dumps({"id": value, "created": created, "total": Decimal("1.5")})
+    ) == {
+        "id": str(value),
+        "created": "2021-05-01T12:30:00+00:00",
+        "total": 1.5,
+    }
+
+
+def test_renderers_produce_the_same_json():
+    expected = JSONRenderer().render(PAYLOAD).body
+    rendered = ORJSONRenderer().render(PAYLOAD).body
+
+    assert json.loads(rendered) == json.loads(expected)
+    assert b"".join(iter_chunks(PAYLOAD, chunk_size=128)) == rendered
+
+
+def test_large_responses_are_streamed():
+    renderer = ORJSONRenderer(stream_over_items=50)
+
+    assert isinstance(renderer.render(PAYLOAD), StreamingResponse)
+    assert not isinstance(renderer.render({"data": {"edges": []}}), StreamingResponse)
+
+
+def test_renderers_must_implement_render():
+    class NoRender(ResponseRenderer):
+        pass
+
+    with pytest.raises(TypeError):
+        NoRender()
@@ -0,0 +1,119 @@
+import pytest
+from ariadne import QueryType, gql, make_executable_schema
+from starlette.testclient import TestClient
+
+from aj_micro_utils.ariadne.extension import GraphQLWithBackGroundTasks
+from aj_micro_utils.ariadne.response_cache import (
+    ResponseCache,
+    cache_control_type_defs,
+    set_cache_hint,
+)
+from aj_micro_utils.redis import Redis
+
+type_defs = gql(
+    cache_control_type_defs
+    + """
+    type Query {
+        products(short: Boolean): [Product!]! @cacheControl(maxAge: 60)
+        basket: [Product!]! @cacheControl(scope: PRIVATE)
+        now: Int
+    }
+
+    type Product @cacheControl(maxAge: 30) {
+        sku: String!
+    }
+    """
+)
+
+query = QueryType()
+calls = []
+
+
+@query.field("products")
+def resolve_products(*_, short=False):
+    calls.append("products")
+    if short:
+        set_cache_hint(5)
+    return [{"sku": "a"}, {"sku": "b"}]
+
+
+@query.field("basket")
+def resolve_basket(*_):
+    return [{"sku": "a"}]
+
+
+@query.field("now")
+def resolve_now(*_):
+    calls.append("now")
+    return len(calls)
+
+
+schema = make_executable_schema(type_defs, query)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key, (None,))[0]
+
+    async def set(self, key, value, expire=None):
+        self.values[key] = (value, expire)
+
+
+@pytest.fixture
+def redis():
+    Redis._pool = FakeRedis()
+    yield Redis._pool
+    Redis._pool = None
+
+
+@pytest.fixture
+def client(redis):
+    calls.clear()
+    return TestClient(
+        GraphQLWithBackGroundTasks(schema, response_cache=ResponseCache())
+    )
+
+
+def test_hinted_queries_are_cached(client, redis):
+    first = client.post("/", json={"query": "{ products { sku } }"})
+    second = client.post("/", json={"query": "{ products { sku } }"})
+
+    assert calls == ["products"]
+    assert (
+        first.json()
+        == second.json()
+        == {"data": {"products": [{"sku": "a"}, {"sku": "b"}]}}
+    )
+    assert first.headers["cache-control"] == "public, max-age=60"
+    assert second.headers["etag"] == first.headers["etag"]
+
+    response = client.post(
+        "/",
+        json={"query": "{ products { sku } }"},
+        headers={"If-None-Match": first.headers["etag"]},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    client.post("/", json={"query": "{ products(short: true) { sku } }"})
+    assert [expire for _, expire in redis.values.values()] == [60, 5]
+
+
+def test_unhinted_and_private_queries_are_not_cached(client, redis):
+    client.post("/", json={"query": "{ now }"})
+    client.post("/", json={"query": "{ now }"})
+    client.post("/", json={"query": "{ basket { sku } }"})
+
+    assert calls == ["now", "now"]
+    assert redis.values == {}
+
+    response = client.post(
+        "/",
+        json={"query": "{ basket { sku } }"},
+        headers={"Authorization": "Bearer token"},
+    )
+    assert response.headers["cache-control"] == "private, max-age=30"
+    assert len(redis.values) == 1
@@ -0,0 +1,65 @@
+import pytest
+from tortoise import Tortoise
+
+from aj_micro_utils.paginator import RelayPaginator
+from aj_micro_utils.routing import DBRouter
+from aj_micro_utils.tests.test_models import TestItem, TestModel
+
+
+@pytest.fixture
+def router():
+    DBRouter.setup(["replica_1", "replica_2"], sticky_seconds=60)
+    yield DBRouter
+    DBRouter.setup([])
+
+
+def test_reads_balanced_over_replicas(router):
+    assert [router.read_connection() for _ in range(4)] == [
+        "replica_1",
+        "replica_2",
+        "replica_1",
+        "replica_2",
+    ]
+
+
+def test_unhealthy_and_lagging_replicas_skipped(router):
+    router.mark_unhealthy("replica_1")
+
+    assert router.read_connection() == "replica_2"
+    assert router.read_connection() == "replica_2"
+
+    router._lag["replica_2"] = 60
+
+    assert router.read_connection() == "default"
+
+
+def test_reads_stick_to_primary_after_write(router):
+    router.record_write(key="account-1")
+
+    assert router.read_connection(key="account-1") == "default"
+    assert router.read_connection(key="account-2") == "default"
+
+
+def test_without_replicas_reads_go_to_primary():
+    DBRouter.setup([], primary="main")
+
+    assert DBRouter.read_connection() == "main"
+    assert DBRouter.get_replica() is None
+
+    DBRouter.setup([])
+
+
+def test_only_the_primary_models_are_routed(monkeypatch):
+    replica = TestModel._meta.db
+    monkeypatch.setitem(Tortoise._connections, "replica_1", replica)
+    items = TestItem.all()
+    # as if TestItem was bound to a second database
+    monkeypatch.setattr(TestItem._meta, "default_connection", "other")
+    DBRouter.setup(["replica_1"], primary=TestModel._meta.default_connection)
+    paginator = RelayPaginator(first=1, after=None, typename="TestModel")
+
+    try:
+        assert paginator.route_queryset(TestModel.all())._db is replica
+        assert paginator.route_queryset(items)._db is None
+    finally:
+        DBRouter.setup([])
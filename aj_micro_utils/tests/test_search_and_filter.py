@@ -4,13 +4,18 @@ import uuid
 from tortoise.contrib.test import initializer
 
 from aj_micro_utils.tests.conftest import unpack_nested_filters
-from aj_micro_utils.tests.test_models import TestModel
+from aj_micro_utils.tests.test_models import TestItem, TestModel
 from aj_micro_utils.search_and_filter.queries import (
     get_search_fields,
     get_search_q,
     get_orm_lookup,
     field_exists,
     get_filter_q,
+    get_filter_plan,
+    get_filter_query,
+    get_filter_shape,
+    get_schema_index,
+    SearchType,
 )
 
 from tortoise.query_utils import Q
@@ -56,6 +61,26 @@ def test_get_search_q(input, expected):
             assert key in expected
 
 
+def test_schema_index():
+    schema_index = get_schema_index(TestModel)
+
+    assert schema_index is get_schema_index(TestModel)
+    assert schema_index.pk_name == "id"
+    assert schema_index.fields["reference"]["constraints"]["max_length"] == 35
+    assert schema_index.search_fields[SearchType.CHAR] == [
+        ("model_name", 255),
+        ("email", 255),
+        ("reference", 35),
+    ]
+    assert schema_index.searchable((SearchType.CHAR, SearchType.DIGIT)) == [
+        ("id", None),
+        ("model_name", 255),
+        ("email", 255),
+        ("reference", 35),
+        ("tracking_number", None),
+    ]
+
+
 @pytest.mark.parametrize(
     "field, graphql_lookup, expected",
     [
@@ -142,7 +167,7 @@ def test_search_func_in_resolver(
             Q(reference="some search term"),
             join_type="OR",
         )
-    ).distinct()
+    )
 
     initialize_model_resolver.extra = search
 
@@ -167,7 +192,7 @@ def test_filter_func_in_resolver(
             Q(tracking_number__gt=2),
             join_type="AND",
         )
-    ).distinct()
+    )
 
     initialize_model_resolver.extra = filter
 
@@ -196,3 +221,59 @@ def test_get_data(
     data = event_loop.run_until_complete(initialize_model_resolver.get_data())
 
     assert len(data["edges"]) == 10
+
+
+def test_relation_filter_uses_semi_join(initialize_tests):
+    sql = get_filter_query(TestModel, {"items": {"sku": {"eq": "A1"}}}).sql()
+
+    assert not sql.startswith("SELECT DISTINCT")
+    assert sql.endswith(
+        'FROM "testmodel" WHERE "id" IN '
+        '(SELECT "parent_id" "parent_id" FROM "testitem" WHERE "sku"=\'A1\')'
+    )
+
+
+def test_forward_relation_filter(initialize_tests):
+    qs = get_filter_query(TestItem, {"parent": {"modelName": {"eq": "name 1"}}})
+
+    assert 'WHERE "parent_id" IN (SELECT "id" "id" FROM "testmodel"' in qs.sql()
+
+
+@pytest.mark.parametrize(
+    "qs, expected",
+    [
+        (lambda: TestModel.all(), False),
+        (lambda: TestModel.filter(items__sku="A1"), True),
+        (lambda: TestItem.filter(parent__model_name="name 1"), False),
+        (lambda: TestItem.filter(parent__items__sku="A1"), True),
+    ],
+)
+def test_distinct_only_for_to_many_joins(initialize_tests, qs, expected):
+    qs = qs()
+    qs = get_filter_query(qs.model, {"id": {"gt": 1}}, qs=qs)
+
+    assert qs.sql().startswith("SELECT DISTINCT") == expected
+
+
+def test_filter_plan_cached_by_shape():
+    first = {"modelName": {"eq": "a"}, "trackingNumber": {"gt": 2, "lt": 9}}
+    second = {"modelName": {"eq": "b"}, "trackingNumber": {"gt": 3, "lt": 5}}
+
+    assert get_filter_shape(first) == (
+        ("modelName", (("eq", None),)),
+        ("trackingNumber", (("gt", None), ("lt", None))),
+    )
+    assert get_filter_plan(TestModel, first) is get_filter_plan(TestModel, second)
+    assert unpack_nested_filters(get_filter_q(TestModel, second)) == [
+        {"model_name": "b"},
+        {"tracking_number__gt": 3, "tracking_number__lt": 5},
+    ]
+
+
+def test_invalid_filter_shape_rejected():
+    for _ in range(2):
+        with pytest.raises(AssertionError):
+            get_filter_q(TestModel, {"wrongField": {"eq": 1}})
+
+        with pytest.raises(KeyError):
+            get_filter_q(TestModel, {"modelName": {"wrong": 1}})
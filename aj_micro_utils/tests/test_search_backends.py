@@ -0,0 +1,91 @@
+import base64
+
+import pytest
+
+from aj_micro_utils.paginator import RelayPaginator
+from aj_micro_utils.search_and_filter.queries import ModelResolver
+from aj_micro_utils.search_and_filter.search_backends import (
+    FullTextSearchBackend,
+    SearchBackend,
+    TrigramSearchBackend,
+    full_text_index_sql,
+    get_search_weights,
+    trigram_index_sql,
+)
+from aj_micro_utils.tests.test_models import TestModel, formatter
+
+VECTOR = (
+    "(setweight(to_tsvector('simple',COALESCE(\"model_name\",'')),'A') || "
+    "setweight(to_tsvector('simple',COALESCE(\"email\",'')),'A') || "
+    "setweight(to_tsvector('simple',COALESCE(\"reference\",'')),'A'))"
+)
+
+
+def test_search_weights_default_to_char_fields():
+    assert get_search_weights(TestModel) == {
+        "model_name": "A",
+        "email": "A",
+        "reference": "A",
+    }
+
+
+def test_full_text_search_uses_indexed_vector():
+    sql = FullTextSearchBackend().search_queryset(TestModel, "some term").sql()
+
+    assert f"WHERE ({VECTOR} @@ websearch_to_tsquery('simple','some term'))" in sql
+    assert "DISTINCT" not in sql
+    assert full_text_index_sql(TestModel) == (
+        'CREATE INDEX IF NOT EXISTS "testmodel_search_vector_idx" '
+        f'ON "testmodel" USING GIN ({VECTOR})'
+    )
+
+
+def test_trigram_search_matches_any_field():
+    sql = TrigramSearchBackend().search_queryset(TestModel, "term").sql()
+
+    assert (
+        "WHERE ('term' <% \"model_name\" OR 'term' <% \"email\" "
+        "OR 'term' <% \"reference\")"
+    ) in sql
+    assert len(trigram_index_sql(TestModel)) == 4
+
+
+def test_ranked_search_keyset_pagination():
+    resolver = ModelResolver(
+        TestModel,
+        formatter,
+        search="term",
+        search_backend=TrigramSearchBackend(),
+        first=5,
+        after=base64.b64encode(b"TestModel:0.5|7").decode("utf-8"),
+    )
+    paginator = resolver.paginator
+
+    sql = paginator.rank_query(resolver.query_set()).sql()
+
+    assert paginator.rank_field == "search_rank"
+    assert paginator.get_rank_cursor_value(paginator.after) == (0.5, "7")
+    assert "<0.5 OR (" in sql
+    assert '=0.5 AND "id"<7)' in sql
+    assert sql.endswith('DESC,"id" DESC LIMIT 6')
+
+
+def test_rank_cursor():
+    paginator = RelayPaginator(
+        first=5, after=None, typename="TestModel", rank_field="search_rank"
+    )
+    paginator.cursor_name = "TestModel"
+    obj = TestModel(id=3)
+    obj.search_rank = 0.25
+
+    cursor = paginator.get_relay_node_cursor(obj, "search_rank")
+
+    assert paginator.get_rank_cursor_value(cursor) == (0.25, "3")
+
+
+def test_backends_must_implement_search_queryset():
+    class NoSearch(SearchBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        NoSearch()
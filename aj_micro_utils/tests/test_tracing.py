@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from ariadne import QueryType, gql, make_executable_schema
+from starlette.testclient import TestClient
+
+from aj_micro_utils.ariadne.extension import GraphQLWithBackGroundTasks
+from aj_micro_utils.ariadne.tracing import TRACE_HEADER, TracingExtension
+from aj_micro_utils.query_monitor import QueryMonitor, fingerprint
+from aj_micro_utils.tracing import Tracer, span
+
+type_defs = gql(
+    """
+    type Query {
+        orders: [Order!]!
+    }
+
+    type Order {
+        id: Int!
+        total: Float!
+    }
+    """
+)
+
+query = QueryType()
+
+
+@query.field("orders")
+async def resolve_orders(*_):
+    QueryMonitor.record(2.0, "SELECT * FROM orders")
+    with span("cache", "get"):
+        await asyncio.sleep(0)
+    return [{"id": i, "total": 1.5} for i in range(3)]
+
+
+schema = make_executable_schema(type_defs, query)
+
+ORDERS = "query Orders { orders { id total } }"
+
+
+@pytest.fixture
+def client():
+    Tracer.setup(sample_rate=0, allow_requested=True)
+    yield TestClient(GraphQLWithBackGroundTasks(schema, extensions=[TracingExtension]))
+    Tracer.setup(sample_rate=0, allow_requested=False)
+
+
+def test_requested_trace_is_returned(client):
+    response = client.post("/", json={"query": ORDERS}, headers={TRACE_HEADER: "1"})
+    trace = response.json()["extensions"]["trace"]
+
+    assert trace["operation"] == "Orders"
+    assert trace["fields"]["Query.orders"]["count"] == 1
+    assert "Order.id" not in trace["fields"]
+    assert trace["spans"]["db"][fingerprint("SELECT * FROM orders")]["count"] == 1
+    assert trace["spans"]["cache"]["get"]["count"] == 1
+    assert trace["slowest"][0]["path"] == ["orders"]
+
+
+def test_untraced_operations_have_no_trace(client):
+    response = client.post("/", json={"query": ORDERS})
+
+    assert response.json() == {
+        "data": {"orders": [{"id": i, "total": 1.5} for i in range(3)]}
+    }
+
+    Tracer.setup(allow_requested=False)
+    response = client.post("/", json={"query": ORDERS}, headers={TRACE_HEADER: "1"})
+    assert "extensions" not in response.json()
+
+
+def test_sampled_traces_go_to_the_sinks(client):
+    traces = []
+    Tracer.setup(sample_rate=1)
+    Tracer.add_sink(traces.append)
+
+    try:
+        response = client.post("/", json={"query": ORDERS})
+    finally:
+        Tracer._sinks.remove(traces.append)
+
+    assert "extensions" not in response.json()
+    assert len(traces) == 1
+    assert traces[0]["operation"] == "Orders"
@@ -0,0 +1,195 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Dict, List, Optional
+
+from aj_micro_utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_RESOLVERS = 10
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+class Timing:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, duration_ms: float) -> None:
+        self.count += 1
+        self.total += duration_ms
+
+        if duration_ms > self.max:
+            self.max = duration_ms
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class Trace:
+    """
+    Timings of one GraphQL operation, the resolvers are aggregated
+    per Type.field and the db queries, cache calls and upstream
+    queries per kind and name, the slowest resolver calls are kept
+    with their path
+    """
+
+    def __init__(self, requested: bool = False) -> None:
+        self.requested = requested
+        self.operation: Optional[str] = None
+        self.start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.fields: Dict[str, Timing] = {}
+        self.spans: Dict[str, Dict[str, Timing]] = {}
+        self.slowest: List[tuple] = []
+
+    def add_field(self, path: list, field: str, duration_ms: float) -> None:
+        timing = self.fields.get(field)
+
+        if timing is None:
+            timing = self.fields[field] = Timing()
+
+        timing.observe(duration_ms)
+
+        if len(self.slowest) < SLOWEST_RESOLVERS:
+            self.slowest.append((duration_ms, path))
+            self.slowest.sort(reverse=True, key=lambda s: s[0])
+        elif duration_ms > self.slowest[-1][0]:
+            self.slowest[-1] = (duration_ms, path)
+            self.slowest.sort(reverse=True, key=lambda s: s[0])
+
+    def add_span(self, kind: str, name: str, duration_ms: float) -> None:
+        spans = self.spans.setdefault(kind, {})
+        timing = spans.get(name)
+
+        if timing is None:
+            timing = spans[name] = Timing()
+
+        timing.observe(duration_ms)
+
+    def finish(self) -> None:
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+
+    def as_dict(self) -> dict:
+        duration_ms = self.duration_ms
+        if duration_ms is None:
+            duration_ms = (time.perf_counter() - self.start) * 1000
+
+        return {
+            "operation": self.operation,
+            "duration_ms": round(duration_ms, 3),
+            "fields": {field: t.as_dict() for field, t in self.fields.items()},
+            "spans": {
+                kind: {name: t.as_dict() for name, t in spans.items()}
+                for kind, spans in self.spans.items()
+            },
+            "slowest": [
+                {"path": path, "duration_ms": round(duration_ms, 3)}
+                for duration_ms, path in self.slowest
+            ],
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(kind: str, name: str):
+    """Times the block into the trace of the current operation, if it is traced"""
+    trace = _current_trace.get()
+
+    if trace is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(kind, name, (time.perf_counter() - start) * 1000)
+
+
+def record_span(kind: str, name: str, duration_ms: float) -> None:
+    trace = _current_trace.get()
+
+    if trace is not None:
+        trace.add_span(kind, name, duration_ms)
+
+
+class Tracer:
+    """
+    Decides which operations are traced and where the traces go
+
+    - sample_rate of the operations are traced and sent to the sinks
+    and the aj_micro_utils.tracing logger
+    - with allow_requested a client can ask for the trace of its operation
+    with the x-graphql-trace header, it is returned in the response extensions
+    """
+
+    _sample_rate: float = get_settings().trace_sample_rate
+    _allow_requested: bool = get_settings().trace_requests or get_settings().debug
+    _sinks: List[Callable[[dict], Any]] = []
+
+    @classmethod
+    def setup(cls, sample_rate: float = None, allow_requested: bool = None) -> None:
+        if sample_rate is not None:
+            cls._sample_rate = sample_rate
+        if allow_requested is not None:
+            cls._allow_requested = allow_requested
+
+    @classmethod
+    def add_sink(cls, sink: Callable[[dict], Any]) -> None:
+        cls._sinks.append(sink)
+
+    @classmethod
+    def start(cls, requested: bool = False) -> Optional[Token]:
+        requested = requested and cls._allow_requested
+
+        if not requested and not (
+            cls._sample_rate and random.random() < cls._sample_rate
+        ):
+            return None
+
+        return _current_trace.set(Trace(requested))
+
+    @classmethod
+    def finish(cls, token: Token) -> Trace:
+        trace = _current_trace.get()
+        _current_trace.reset(token)
+        trace.finish()
+
+        if not trace.requested:
+            cls.emit(trace)
+
+        return trace
+
+    @classmethod
+    def emit(cls, trace: Trace) -> None:
+        record = trace.as_dict()
+
+        logger.info(
+            "GraphQL trace %s %.1fms",
+            record["operation"],
+            record["duration_ms"],
+            extra={"trace": record},
+        )
+
+        for sink in cls._sinks:
+            try:
+                sink(record)
+            except Exception as e:
+                logger.error(e)
@@ -0,0 +1,49 @@
+"""Per value cost of the datetime conversions of the field, the cursors
+and the cache before and after the datetimes codec
+
+python -m benchmarks.bench_datetime
+"""
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from iso8601 import parse_date
+
+from aj_micro_utils.datetimes import format_datetime, parse_datetime, parse_datetimes
+
+NUMBER = 20000
+COLUMN_SIZE = 1000
+
+VALUE = datetime(2021, 3, 4, 12, 0, 0, 123456, tzinfo=timezone.utc)
+TEXT = str(VALUE)
+ISO_Z = "2021-03-04T12:00:00.123456Z"
+COLUMN = [str(VALUE + timedelta(seconds=i // 10)) for i in range(COLUMN_SIZE)]
+
+
+def report(name, func, number=NUMBER, per=1):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{name:<36} {seconds / number / per * 1e6:8.3f} us/value")
+
+
+if __name__ == "__main__":
+    report(
+        "cursor strptime",
+        lambda: datetime.strptime(TEXT, "%Y-%m-%d %H:%M:%S.%f%z"),
+    )
+    report("cursor parse_datetime", lambda: parse_datetime(TEXT))
+    report("field iso8601", lambda: parse_date(TEXT, default_timezone=timezone.utc))
+    report("field parse_datetime", lambda: parse_datetime(TEXT))
+    report("'Z' text parse_datetime", lambda: parse_datetime(ISO_Z))
+    report("cache str()", lambda: str(VALUE))
+    report("cache format_datetime", lambda: format_datetime(VALUE))
+    report(
+        "column iso8601 per row",
+        lambda: [parse_date(v, default_timezone=timezone.utc) for v in COLUMN],
+        number=20,
+        per=COLUMN_SIZE,
+    )
+    report(
+        "column parse_datetimes",
+        lambda: parse_datetimes(COLUMN),
+        number=20,
+        per=COLUMN_SIZE,
+    )
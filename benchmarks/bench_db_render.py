@@ -0,0 +1,45 @@
+"""Per call cost of rendering a paginated query
+
+python -m benchmarks.bench_db_render
+"""
+import timeit
+
+from aj_micro_utils import db
+from aj_micro_utils.paginator import PAGINATOR_MAPPING
+
+SQL = (
+    """
+    SELECT id, reference, email, created
+    FROM orders
+    WHERE account_id = {{ account_id }}
+    {% if status %}
+        AND status = {{ status }}
+    {% endif %}
+    {% if reference %}
+        AND reference = {{ reference }}
+    {% endif %}
+"""
+    + PAGINATOR_MAPPING["created"]
+)
+DATA = {
+    "account_id": 1,
+    "status": "open",
+    "reference": None,
+    "after": None,
+    "limit": 11,
+}
+NUMBER = 2000
+
+
+def report(name, func):
+    seconds = min(timeit.repeat(func, number=NUMBER, repeat=5))
+    print(f"{name:<28} {seconds / NUMBER * 1e6:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    report("jinjasql prepare_query", lambda: db.j.prepare_query(SQL, DATA))
+    report(
+        "compiled template",
+        lambda: db.j.prepare_query(db.get_template(SQL), DATA),
+    )
+    report("compiled + rendered cache", lambda: db.prepare_query(SQL, DATA))
@@ -0,0 +1,74 @@
+"""Per request cost of building the filter Q for 1-20 key filters, the filter
+plan against the schema index path it replaced and the older describe path
+
+python -m benchmarks.bench_filter_plan
+"""
+import timeit
+
+from ariadne import convert_camel_case_to_snake
+from tortoise import Tortoise, fields, models, run_async
+from tortoise.query_utils import Q
+
+from aj_micro_utils.search_and_filter.queries import (
+    field_exists,
+    get_filter_q,
+    get_orm_lookup,
+    get_schema_index,
+)
+
+FIELD_COUNT = 20
+NUMBER = 500
+
+
+class BenchModel(models.Model):
+    id = fields.IntField(pk=True)
+
+    for i in range(FIELD_COUNT):
+        locals()[f"field_{i}"] = fields.IntField()
+
+
+def describe_filter_q(model, filter: dict) -> Q:
+    """The filter building as it was before the schema index"""
+    filters = Q()
+    for key, val in filter.items():
+        formatted_field_name = convert_camel_case_to_snake(key)
+        model_desc = model.describe()
+        assert model_desc["pk_field"]["name"] == formatted_field_name or any(
+            f["name"] == formatted_field_name for f in model_desc["data_fields"]
+        )
+        filters &= Q(**get_orm_lookup(formatted_field_name, val))
+    return filters
+
+
+def index_filter_q(model, filter: dict) -> Q:
+    """The filter building the plan cache replaced, with the schema index"""
+    filters = Q()
+    relations = get_schema_index(model).relations
+    for key, val in filter.items():
+        formatted_field_name = convert_camel_case_to_snake(key)
+        assert formatted_field_name not in relations
+        assert field_exists(model, formatted_field_name)
+        filters &= Q(**get_orm_lookup(formatted_field_name, val))
+    return filters
+
+
+def report(keys, name, func):
+    seconds = min(timeit.repeat(func, number=NUMBER, repeat=5))
+    print(f"{keys:>4} keys  {name:<16} {seconds / NUMBER * 1e6:9.2f} us/call")
+
+
+async def main():
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": [__name__]})
+
+    for keys in (1, 5, 10, 20):
+        filter = {f"field{i}": {"gte": i, "lt": i + 10} for i in range(keys)}
+
+        report(keys, "describe", lambda: describe_filter_q(BenchModel, filter))
+        report(keys, "schema index", lambda: index_filter_q(BenchModel, filter))
+        report(keys, "filter plan", lambda: get_filter_q(BenchModel, filter))
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    run_async(main())
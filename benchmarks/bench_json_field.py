@@ -0,0 +1,40 @@
+"""Per row cost of hydrating and rendering a wide JSONB column
+
+python -m benchmarks.bench_json_field
+"""
+import json
+import timeit
+
+from aj_micro_utils.ariadne.renderers import dumps
+from aj_micro_utils.fields import CustomJSONField
+
+RAW = json.dumps(
+    {
+        f"attribute_{i}": {
+            "label": f"Attribute {i}",
+            "values": list(range(10)),
+            "enabled": i % 2 == 0,
+        }
+        for i in range(50)
+    }
+)
+NUMBER = 2000
+
+stdlib = CustomJSONField(decoder=json.loads)
+eager = CustomJSONField()
+lazy = CustomJSONField(lazy=True)
+
+
+def report(name, func):
+    seconds = min(timeit.repeat(func, number=NUMBER, repeat=5))
+    print(f"{name:<32} {seconds / NUMBER * 1e6:8.2f} us/row")
+
+
+if __name__ == "__main__":
+    print(f"document {len(RAW)} bytes")
+    report("json.loads", lambda: stdlib.to_python_value(RAW))
+    report("orjson.loads", lambda: eager.to_python_value(RAW))
+    report("lazy, not read", lambda: lazy.to_python_value(RAW))
+    report("lazy, one key read", lambda: lazy.to_python_value(RAW)["attribute_1"])
+    report("orjson.loads + render", lambda: dumps(eager.to_python_value(RAW)))
+    report("lazy + render raw", lambda: dumps(lazy.to_python_value(RAW)))
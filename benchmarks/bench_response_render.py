@@ -0,0 +1,63 @@
+"""Per call cost of rendering a 100 edge connection response
+
+python -m benchmarks.bench_response_render
+"""
+import json
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+from aj_micro_utils.ariadne.renderers import (
+    JSONRenderer,
+    ORJSONRenderer,
+    iter_chunks,
+)
+from aj_micro_utils.cache import MyEncoder
+
+CREATED = datetime(2021, 5, 1, 12, 30, tzinfo=timezone.utc)
+PAYLOAD = {
+    "data": {
+        "orders": {
+            "__typename": "OrderConnection",
+            "edges": [
+                {
+                    "cursor": f"T3JkZXI6MjAyMS0wNS0wMSAxMjozMDowMC4wMDAwMDAr{i}",
+                    "node": {
+                        "__typename": "Order",
+                        "id": str(uuid.uuid4()),
+                        "reference": f"REF-{i:06d}",
+                        "email": f"customer{i}@example.com",
+                        "status": "DISPATCHED",
+                        "trackingNumber": 1000000 + i,
+                        "total": 129.99,
+                        "created": CREATED.isoformat(),
+                        "lines": [
+                            {"sku": f"SKU-{i}-{j}", "quantity": j + 1, "price": 9.99}
+                            for j in range(3)
+                        ],
+                    },
+                }
+                for i in range(100)
+            ],
+            "pageInfo": {
+                "hasNextPage": True,
+                "startCursor": "T3JkZXI6MQ==",
+                "endCursor": "T3JkZXI6MTAw",
+            },
+        }
+    }
+}
+NUMBER = 500
+
+
+def report(name, func):
+    seconds = min(timeit.repeat(func, number=NUMBER, repeat=5))
+    print(f"{name:<28} {seconds / NUMBER * 1e6:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    print(f"payload {len(json.dumps(PAYLOAD))} bytes")
+    report("starlette JSONResponse", lambda: JSONRenderer().render(PAYLOAD))
+    report("json MyEncoder", lambda: json.dumps(PAYLOAD, cls=MyEncoder).encode())
+    report("orjson", lambda: ORJSONRenderer().render(PAYLOAD))
+    report("orjson streamed chunks", lambda: b"".join(iter_chunks(PAYLOAD)))